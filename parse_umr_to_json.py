@@ -1,80 +1,436 @@
 #!/usr/bin/env python3
 import os
 import re
+import sys
 import json
+import time
 import argparse
+import functools
+import itertools
+import multiprocessing
 from pathlib import Path
-from typing import Dict, List, Optional, Union, Any
+from typing import Dict, List, Optional, Union, Any, Iterable, Iterator, TextIO, Tuple, Callable
 
-def parse_umr_file(file_path: str) -> Dict[str, Any]:
-    """Parse a UMR file into a dictionary."""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+from umr_scanner import (UMRBlock, Section, SectionView, BLOCK_DELIMITER, SENT_ID_RE, scan_lines,
+                         classify_header, decode_lines, has_document_level_annotation)
+from umr_snapshot import scan_file_record, build_snapshot
+from umr_columnar import DEFAULT_ROW_GROUP_SIZE, write_columnar
+from umr_shards import DEFAULT_SHARD_BLOCKS, ALL_SPLIT, parse_split, parse_size, write_shards
+from umr_incremental import (default_manifest_path, export_layout, render_json_item, load_manifest,
+                             plan_export, write_export)
+from umr_graph import count_doc_relations, doc_graph_triples
+from umr_graph_cache import GraphCache, default_graph_cache
+from umr_profile import PROFILER
+from umr_prefetch import DEFAULT_PREFETCH_DEPTH, read_file, map_file
+from umr_sources import (ARCHIVE_SUFFIXES, DATA_DIRS, is_umr_name, is_plain, is_stream, logical_name,
+                         language_of, archive_language, tar_archive_of, iter_archive_umr_files,
+                         open_sources, open_umr, read_source, buffer_size)
+
+def parse_umr_file(file_path: str, data=None, use_mmap: bool = False) -> Dict[str, Any]:
+    """
+    Parse a UMR file into a dictionary. `data` is the file content (bytes or mmap), if it was
+    already read; with `use_mmap` the file is memory-mapped instead of read into memory.
+    Each field is decoded straight from its slice of the file (see UMRDocument).
+    Compressed files and archive members (see umr_sources), or a `data` stream, are parsed
+    a segment at a time as they are decompressed instead.
+    """
+    if data is None and not is_plain(file_path):
+        with open_umr(file_path) as stream:
+            return parse_umr_stream(file_path, stream)
+    if is_stream(data):
+        return parse_umr_stream(file_path, data)
+    return UMRDocument(file_path, data, use_mmap).to_dict()
+
+def parse_umr_stream(file_path: str, stream) -> Dict[str, Any]:
+    """
+    Parse a UMR file from a binary stream (e.g. a decompressing reader) into the parse_umr_file
+    format, a segment at a time (see iter_stream_blocks), so the decompressed file is never held whole.
+    """
+    if PROFILER.enabled:
+        with PROFILER.stage("scan"):
+            blocks = [block for block in iter_stream_blocks(stream, file_path) if block.has_sections]
+        parsed_blocks = [profile_block_to_dict(file_path, block) for block in blocks]
+    else:
+        parsed_blocks = [block.to_dict() for block in iter_stream_blocks(stream, file_path) if block.has_sections]
+    return {
+        "filename": logical_name(os.path.basename(file_path)),
+        "language": language_of(file_path),
+        "blocks": parsed_blocks
+    }
+
+def block_to_dict(block: Union[UMRBlock, 'LazyBlock']) -> Dict[str, Any]:
+    """Convert a scanned (or lazy) block into the dictionary written to the JSON output."""
+    block_data = {}
     
-    language = os.path.basename(os.path.dirname(os.path.dirname(file_path)))
-    filename = os.path.basename(file_path)
+    # Parse meta info
+    block_data["meta_info"] = parse_meta_info(block.meta_info)
     
-    # Split the file into blocks separated by 80 hash signs
-    blocks = re.split(r'#{80,}', content)
-    blocks = [block.strip() for block in blocks if block.strip()]
+    # Parse sentence information
+    with PROFILER.stage("parse_sentence_info"):
+        block_data["sentence_info"] = parse_sentence_info(block.sentence_text)
     
-    parsed_blocks = []
-    for block in blocks:
-        # Split each block into parts
-        parts = block.split('#')
-        parts = [part.strip() for part in parts if part.strip()]
-        
-        if len(parts) < 3:  # Need at least meta, sentence, and one annotation
-            continue
-        
-        block_data = {}
-        
-        # Parse meta info
-        meta_part = parts[0]
-        block_data["meta_info"] = parse_meta_info(meta_part)
-        
-        # Parse sentence information
-        sentence_part = parts[1]
-        block_data["sentence_info"] = parse_sentence_info(sentence_part)
-        
-        # Find and parse sentence level graph
-        sentence_graph = None
-        for part in parts:
-            if part.startswith('sentence level graph:'):
-                sentence_graph = part.replace('sentence level graph:', '').strip()
-                break
-        block_data["sentence_annotation"] = sentence_graph
-        
-        # Find and parse alignment
-        alignment = None
-        for part in parts:
-            if part.startswith('alignment:'):
-                alignment = part.replace('alignment:', '').strip()
-                break
-        block_data["alignment"] = alignment
-        
-        # Find and parse document level annotation
-        doc_annotation = None
-        for part in parts:
-            if part.startswith('document level annotation:'):
-                doc_annotation = part.replace('document level annotation:', '').strip()
-                # Check if it's empty or just contains (sXsX / sentence)
-                if doc_annotation and not re.match(r'^\s*\(\w+\s*/\s*sentence\)\s*$', doc_annotation):
-                    block_data["has_document_annotation"] = True
-                else:
-                    block_data["has_document_annotation"] = False
-                break
-        block_data["document_annotation"] = doc_annotation
-        
-        parsed_blocks.append(block_data)
+    # Sentence level graph and alignment
+    block_data["sentence_annotation"] = block.section_text('sentence_graph')
+    block_data["alignment"] = block.section_text('alignment')
     
-    result = {
-        "filename": filename,
-        "language": language,
-        "blocks": parsed_blocks
-    }
+    # Document level annotation
+    doc_annotation = block.section_text('document_annotation')
+    doc_counts = None
+    if doc_annotation is not None:
+        # Relations per type; an empty graph such as (s1s0 / sentence) has none
+        doc_counts = count_doc_relations(doc_annotation)
+        block_data["has_document_annotation"] = sum(doc_counts.values()) > 0
+    block_data["document_annotation"] = doc_annotation
+    if doc_counts is not None:
+        block_data["document_relation_counts"] = doc_counts
     
-    return result
+    return block_data
+
+# A header line ('#' after optional leading whitespace), with the section or meta keyword that
+# classify_header would find after the hash signs as a named group. The pattern starts with a
+# literal '\n' so the regex engine can skip ahead between lines; the first line is matched separately.
+_HEADER_BODY = rb'''[ \t\f\v\r]*(?P<hashes>\#+)[ \t\f\v\r]*
+    (?:(?P<meta>meta-info|::)|(?P<sentence_graph>sentence\ level\ graph:)|(?P<alignment>alignment:)
+      |(?P<document_annotation>document\ level\ annotation:))?
+    [^\n]*'''
+_HEADER_LINE_RE = re.compile(rb'\n' + _HEADER_BODY, re.VERBOSE)
+_FIRST_HEADER_LINE_RE = re.compile(_HEADER_BODY, re.VERBOSE)
+_DELIMITER_HASHES = len(BLOCK_DELIMITER)
+
+class LazyBlock:
+    """
+    A block of a UMRDocument that only knows the byte offsets of its header lines.
+    Sections are (offset, length) views into the file buffer (see umr_scanner.SectionView),
+    and text is decoded from the buffer only when a field is accessed.
+    """
+    __slots__ = ('data', 'path', 'index', 'start', 'end', 'headers', '_views', '_sentence_regions')
+
+    def __init__(self, data, path: str, index: int, start: int, end: int,
+                 headers: Tuple[Tuple[str, int, int, Optional[int]], ...]):
+        # The document's buffer and path, not the document itself, so that a document and its
+        # blocks do not form a reference cycle that keeps the buffer alive until the next GC
+        self.data = data
+        self.path = path
+        self.index = index
+        # Byte range of the block and, for each of its header lines, (kind, line start, line end,
+        # start of the text after the section keyword or None if unknown)
+        self.start = start
+        self.end = end
+        self.headers = headers
+        self._views = None
+        self._sentence_regions = None
+
+    def _layout(self) -> None:
+        """
+        Assign the byte ranges between header lines to the sections and the sentence information,
+        as umr_scanner.scan_lines does: the lines after a section header belong to that section (the
+        first section of each kind wins, lines of a repeated one are dropped), and the lines before
+        any header or after a meta line are sentence information.
+        """
+        data = self.data
+        views = {}
+        sentence_regions = []
+        first_header = self.headers[0][1] if self.headers else self.end
+        if first_header > self.start:
+            sentence_regions.append((self.start, first_header))
+        next_starts = [header[1] for header in self.headers[1:]] + [self.end]
+        for (kind, line_start, line_end, rest_start), next_start in zip(self.headers, next_starts):
+            if kind == 'meta':
+                if next_start > line_end:
+                    sentence_regions.append((line_end, next_start))
+            elif kind not in views:
+                views[kind] = SectionView(data, kind, line_start, line_end, next_start, rest_start)
+        self._views = views
+        self._sentence_regions = sentence_regions
+
+    @property
+    def has_sections(self) -> bool:
+        """True if the block has at least one annotation section."""
+        return any(header[0] != 'meta' for header in self.headers)
+
+    def _meta_lines(self) -> Iterator[str]:
+        for kind, line_start, line_end, _ in self.headers:
+            if kind == 'meta':
+                yield decode_lines(self.data, line_start, line_end)
+
+    @property
+    def meta_info(self) -> str:
+        """The first meta line, decoded on its own (see UMRBlock.meta_info)."""
+        for line in self._meta_lines():
+            return line.strip()[1:].strip()
+        return ''
+
+    @property
+    def sent_id(self) -> Optional[str]:
+        """The sent_id from the meta-info line, if any."""
+        for line in self._meta_lines():
+            match = SENT_ID_RE.search(line)
+            if match:
+                return match.group(1)
+        return None
+
+    def section_view(self, kind: str) -> Optional[SectionView]:
+        """The (offset, length) view of the section of the given kind, or None if the block has none."""
+        if self._views is None:
+            self._layout()
+        return self._views.get(kind)
+
+    def section(self, kind: str) -> Optional[Section]:
+        """Scan the section of the given kind into a Section (with its lines), or None if absent."""
+        view = self.section_view(kind)
+        if view is None:
+            return None
+        lines = view.raw.tobytes().splitlines(keepends=True)
+        return next(scan_lines(lines, offset=view.offset)).section(kind)
+
+    def section_text(self, kind: str) -> Optional[str]:
+        """Decode the stripped text of the section of the given kind, or None if absent."""
+        view = self.section_view(kind)
+        return view.text if view is not None else None
+
+    @property
+    def sentence_text(self) -> str:
+        """The sentence information lines as a single string (see UMRBlock.sentence_text)."""
+        if self._sentence_regions is None:
+            self._layout()
+        data = self.data
+        return ''.join(decode_lines(data, start, end) for start, end in self._sentence_regions).strip()
+
+    @property
+    def sentence_info(self) -> Dict[str, str]:
+        return parse_sentence_info(self.sentence_text)
+
+    @property
+    def sentence_annotation(self) -> Optional[str]:
+        return self.section_text('sentence_graph')
+
+    @property
+    def alignment(self) -> Optional[str]:
+        return self.section_text('alignment')
+
+    def alignment_table(self):
+        """The alignment section parsed into node -> token span arrays (see umr_alignment.AlignmentTable)."""
+        # Imported here so that JSON export does not need numpy
+        from umr_alignment import parse_alignment
+        return parse_alignment(self.alignment)
+
+    @property
+    def document_annotation(self) -> Optional[str]:
+        return self.section_text('document_annotation')
+
+    @property
+    def has_document_annotation(self) -> Optional[bool]:
+        """has_document_annotation as in the JSON output, or None if the block has no such section."""
+        doc_annotation = self.document_annotation
+        if doc_annotation is None:
+            return None
+        return has_document_level_annotation(doc_annotation)
+
+    def document_relations(self) -> List[Tuple[str, str, str, str]]:
+        """The relations of the document level graph as (type, head, relation, tail) tuples (see umr_graph.doc_graph_triples)."""
+        doc_annotation = self.document_annotation
+        return doc_graph_triples(doc_annotation) if doc_annotation else []
+
+    def graph(self, cache: Optional[GraphCache] = None):
+        """
+        The decoded penman.Graph of the sentence level graph (None if the block has none), served
+        from `cache` or the process-wide default graph cache so repeated access does not re-decode it.
+        """
+        if cache is None:
+            cache = default_graph_cache()
+        return cache.decode_block(self.path, self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the block in the JSON output format, decoding each field straight from the buffer."""
+        return block_to_dict(self)
+
+def locate_blocks(data, path: str, index: int = 0) -> Iterator[LazyBlock]:
+    """
+    Locate the blocks of a buffer with a single regex pass over its header lines, numbering
+    them from `index`. The buffer must start at the start of a line (e.g. right after a delimiter).
+    """
+    block_start = 0
+    headers = []
+    first = _FIRST_HEADER_LINE_RE.match(data)
+    matches = _HEADER_LINE_RE.finditer(data)
+    for match in itertools.chain([first] if first else [], matches):
+        line_start = 0 if match is first else match.start() + 1
+        line_end = min(match.end() + 1, len(data))  # include the newline
+        if match.end('hashes') - match.start('hashes') >= _DELIMITER_HASHES:
+            if line_start > block_start:
+                yield LazyBlock(data, path, index, block_start, line_start, tuple(headers))
+                index += 1
+            block_start = line_end
+            headers = []
+            continue
+        kind = match.lastgroup
+        if kind == 'hashes':
+            # No known keyword: let classify_header decide (it also accepts non-ASCII whitespace)
+            kind, _ = classify_header(data[line_start:line_end].decode('utf-8').strip())
+            rest_start = match.end('hashes') if kind == 'other' else None
+        else:
+            rest_start = match.end(kind)
+        headers.append((kind, line_start, line_end, rest_start))
+    if len(data) > block_start:
+        yield LazyBlock(data, path, index, block_start, len(data), tuple(headers))
+
+# Streams are cut into segments of whole blocks of about this size (see iter_stream_blocks)
+_STREAM_SEGMENT_SIZE = 1 << 18
+_DELIMITER_LINE_START = b'\n' + BLOCK_DELIMITER.encode('ascii')
+
+def iter_stream_blocks(stream, path: str) -> Iterator[LazyBlock]:
+    """
+    Locate the blocks of a binary stream (e.g. a decompressing reader) as it is read. The stream
+    is read in segments that end right after a delimiter line, and each segment is located like a
+    whole file (see locate_blocks), so only about one segment (or one block, if larger) is in memory.
+    """
+    pending = b''
+    index = 0
+    while True:
+        chunk = stream.read(_STREAM_SEGMENT_SIZE)
+        pending += chunk
+        # Cut after the last line that starts with a delimiter; the rest waits for more data
+        cut = pending.rfind(_DELIMITER_LINE_START)
+        if cut >= 0:
+            cut = pending.find(b'\n', cut + 1) + 1
+        if chunk and cut <= 0:
+            continue
+        segment, pending = (pending[:cut], pending[cut:]) if chunk else (pending, b'')
+        for block in locate_blocks(segment, path, index):
+            index = block.index + 1
+            yield block
+        if not chunk:
+            return
+
+class UMRDocument:
+    """
+    A UMR file opened lazily. The file is read (or memory-mapped, with `use_mmap`) on first
+    access and its blocks are located with a single regex pass over the header lines; nothing
+    else is decoded or parsed until a block field is accessed, so filters can probe a few header
+    lines instead of building dicts, and every field is decoded straight from its slice of the buffer.
+    """
+    __slots__ = ('path', 'filename', 'language', 'use_mmap', '_data', '_blocks')
+
+    def __init__(self, file_path: str, data=None, use_mmap: bool = False):
+        self.path = file_path
+        self.filename = logical_name(os.path.basename(file_path))
+        self.language = language_of(file_path)
+        self.use_mmap = use_mmap
+        # The file content (bytes or mmap), if it was already read (e.g. by umr_prefetch)
+        self._data = data
+        self._blocks = None
+
+    @property
+    def data(self):
+        """
+        The raw file content: bytes, or a read-only mmap with `use_mmap`. Compressed files and
+        archive members are decompressed into memory, since blocks are located by random access.
+        """
+        if self._data is None:
+            with PROFILER.stage("read") as stage:
+                if not is_plain(self.path):
+                    self._data = read_source(self.path)
+                else:
+                    self._data = map_file(self.path) if self.use_mmap else read_file(self.path)
+                stage.nbytes = len(self._data)
+        return self._data
+
+    @property
+    def blocks(self) -> List[LazyBlock]:
+        """All blocks of the file, including those without annotation sections."""
+        if self._blocks is None:
+            self._blocks = list(self._locate_blocks())
+        return self._blocks
+
+    def iter_blocks(self) -> Iterator[LazyBlock]:
+        """
+        Yield the blocks as they are located. Header lines past the last block consumed are
+        never matched, so a caller that stops early (e.g. a filter probe) skips the rest of the file.
+        """
+        if self._blocks is not None:
+            yield from self._blocks
+            return
+        blocks = []
+        for block in self._locate_blocks():
+            blocks.append(block)
+            yield block
+        self._blocks = blocks
+
+    def _locate_blocks(self) -> Iterator[LazyBlock]:
+        return locate_blocks(self.data, self.path)
+
+    def exported_blocks(self) -> Iterator[LazyBlock]:
+        """The blocks that appear in the JSON output (those with at least one annotation section)."""
+        return (block for block in self.iter_blocks() if block.has_sections)
+
+    def has_partial_conversion(self) -> bool:
+        """True if any exported block's meta-info has type = partial_conversion; only meta lines are decoded."""
+        return any("type = partial_conversion" in block.meta_info for block in self.exported_blocks())
+
+    def has_block_with_document_annotation(self, value: bool) -> bool:
+        """True if any exported block's has_document_annotation equals `value`; only doc sections are decoded."""
+        return any(bool(block.has_document_annotation) == value for block in self.exported_blocks())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the file in the parse_umr_file format, decoding each field straight from the buffer."""
+        if PROFILER.enabled:
+            with PROFILER.stage("scan", len(self.data)):
+                blocks = list(self.exported_blocks())
+            parsed_blocks = [profile_block_to_dict(self.path, block) for block in blocks]
+        else:
+            # Blocks are converted as they are located and not kept, so only one is alive at a time
+            blocks = self._blocks if self._blocks is not None else self._locate_blocks()
+            parsed_blocks = [block.to_dict() for block in blocks if block.has_sections]
+        return {
+            "filename": self.filename,
+            "language": self.language,
+            "blocks": parsed_blocks
+        }
+
+def load_filtered_file(file_path: str,
+                       language: Optional[str] = None,
+                       has_partial_conversion: Optional[bool] = None,
+                       has_document_annotation: Optional[bool] = None,
+                       parse_func: Optional[Callable[..., Dict[str, Any]]] = None,
+                       data: Optional[bytes] = None) -> Optional[Dict[str, Any]]:
+    """
+    Open a file as a UMRDocument, probe it against the filters, and only parse it fully
+    if it passes: into the parse_umr_file format, or with `parse_func(file_path, data)` if given.
+    `data` is the file content, if it was already read. Returns None for files that are filtered out.
+    A `data` stream (a compressed file or archive member, see umr_sources) can only be read once,
+    so it is parsed first and the parsed result is filtered.
+    """
+    start = time.perf_counter() if PROFILER.enabled else 0.0
+    if is_stream(data):
+        if language and language_of(file_path) != language:
+            return None
+        parsed = parse_func(file_path, data=data) if parse_func is not None else parse_umr_stream(file_path, data)
+        with PROFILER.stage("filter"):
+            matches = file_matches(parsed, language, has_partial_conversion, has_document_annotation)
+        if PROFILER.enabled:
+            PROFILER.item("file", file_path, time.perf_counter() - start)
+        return parsed if matches else None
+    document = UMRDocument(file_path, data)
+    with PROFILER.stage("filter"):
+        matches = file_matches(document, language, has_partial_conversion, has_document_annotation)
+    if not matches:
+        return None
+    if parse_func is not None:
+        # The probe may already have read the file; hand the content on instead of reading it again
+        parsed = parse_func(file_path, data=document.data)
+    else:
+        parsed = document.to_dict()
+    if PROFILER.enabled:
+        PROFILER.item("file", file_path, time.perf_counter() - start, len(document.data))
+    return parsed
+
+def profile_block_to_dict(file_path: str, block: UMRBlock) -> Dict[str, Any]:
+    """block_to_dict for --profile runs, recording the block among the slowest blocks."""
+    start = time.perf_counter()
+    block_data = block_to_dict(block)
+    PROFILER.item("block", f"{file_path} block {block.index} ({block.sent_id})",
+                  time.perf_counter() - start, block.end - block.start)
+    return block_data
 
 def parse_meta_info(meta_part: str) -> str:
     """Parse meta information from UMR file content."""
@@ -102,78 +458,295 @@ def parse_sentence_info(sentence_part: str) -> Dict[str, str]:
     
     return info
 
-def has_document_level_annotation(document_annotation: str) -> bool:
-    """Check if the document has meaningful document level annotation."""
-    if not document_annotation:
-        return False
-    
-    # If it's just (sXsX / sentence), consider it empty
-    if re.match(r'^\s*\(\w+\s*/\s*sentence\)\s*$', document_annotation):
-        return False
-    
-    return True
-
-def find_umr_files(root_dir: str) -> List[str]:
-    """Find all UMR files in the directory structure."""
-    umr_files = []
-    
-    for lang_dir in os.listdir(root_dir):
-        lang_path = os.path.join(root_dir, lang_dir)
+def iter_umr_files(root_dir: str, language: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield UMR file paths in the directory structure one at a time.
+    With `language`, only that language directory (or archive) is listed.
+    Compressed files (.umr.gz, .umr.zst) are listed like .umr files, and language archives
+    next to the language directories (e.g. czech.tar.gz, see umr_sources) are listed as
+    virtual member paths, in archive order.
+    """
+    # Sorted listings keep the output order deterministic across filesystems
+    with PROFILER.stage("list_files"):
+        entries = sorted(os.listdir(root_dir))
+    if language:
+        entries = [entry for entry in entries if entry == language or archive_language(entry) == language]
+    for entry in entries:
+        lang_path = os.path.join(root_dir, entry)
+        if entry.endswith(ARCHIVE_SUFFIXES) and os.path.isfile(lang_path):
+            with PROFILER.stage("list_files"):
+                members = list(iter_archive_umr_files(lang_path))
+            yield from members
+            continue
         if not os.path.isdir(lang_path):
             continue
         
         # Check both umr_data and formatted_data directories
-        for data_dir in ['umr_data', 'formatted_data']:
+        for data_dir in DATA_DIRS:
             dir_path = os.path.join(lang_path, data_dir)
             if not os.path.exists(dir_path):
                 continue
                 
-            for filename in os.listdir(dir_path):
-                if filename.endswith(".umr"):
-                    umr_files.append(os.path.join(dir_path, filename))
-                
-    return umr_files
+            with PROFILER.stage("list_files"):
+                filenames = sorted(os.listdir(dir_path))
+            for filename in filenames:
+                if is_umr_name(filename):
+                    yield os.path.join(dir_path, filename)
 
-def filter_files(parsed_files: List[Dict[str, Any]], 
+def find_umr_files(root_dir: str, language: Optional[str] = None) -> List[str]:
+    """Find all UMR files in the directory structure (optionally of a single language)."""
+    return list(iter_umr_files(root_dir, language))
+
+def _parse_file_safe(parse_func: Callable[..., Dict[str, Any]], file_path: str,
+                     load: Callable[[], bytes]) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Load one file's content with `load` (see umr_prefetch) and parse it,
+    returning (path, parsed, error) instead of raising.
+    """
+    try:
+        with PROFILER.stage("read") as stage:
+            data = load()
+            stage.nbytes = buffer_size(data)
+        return file_path, parse_func(file_path, data=data), None
+    except Exception as e:
+        return file_path, None, f"{type(e).__name__}: {e}"
+
+def _parse_chunk_safe(parse_func: Callable[..., Dict[str, Any]], prefetch: int, read: Callable[[str], Any],
+                      file_paths: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """Parse a chunk of files with _parse_file_safe, prefetching within the chunk. Runs in pool workers."""
+    return [_parse_file_safe(parse_func, file_path, load)
+            for file_path, load in open_sources(file_paths, prefetch, read=read)]
+
+def _chunks(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    """Split an iterable into lists of at most `size` items."""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _parse_runs(file_paths: Iterable[str], pool: 'multiprocessing.pool.Pool',
+                parse_func: Callable[..., Dict[str, Any]], prefetch: int, read: Callable[[str], Any],
+                chunk_size: int) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Parse files with the pool in chunks, except members of tar archives: a tar can only be read
+    front to back, so each run of its members is parsed here, in one streaming pass over the archive.
+    """
+    parse_chunk = functools.partial(_parse_chunk_safe, parse_func, prefetch, read)
+    for tar, run in itertools.groupby(file_paths, key=tar_archive_of):
+        if tar is None:
+            yield from itertools.chain.from_iterable(pool.imap(parse_chunk, _chunks(run, chunk_size)))
+        else:
+            for file_path, load in open_sources(run, prefetch, read=read):
+                yield _parse_file_safe(parse_func, file_path, load)
+
+def iter_parsed_files(file_paths: Iterable[str],
+                      jobs: int = 1,
+                      chunk_size: int = 16,
+                      errors: Optional[List[Tuple[str, str]]] = None,
+                      parse_func: Callable[..., Dict[str, Any]] = parse_umr_file,
+                      prefetch: int = DEFAULT_PREFETCH_DEPTH,
+                      use_mmap: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Parse UMR files lazily with `parse_func(file_path, data=...)`, yielding one parsed document
+    at a time in input order. Files for which `parse_func` returns None are skipped.
+    Up to `prefetch` upcoming files are read by background threads while earlier ones are parsed
+    (see umr_prefetch); 0 reads each file only when it is parsed. With `use_mmap`, files are
+    memory-mapped instead of read, and parse_func gets the mmap as `data`.
+    With jobs > 1 the files are parsed by a process pool in chunks of `chunk_size` files,
+    and every worker prefetches within its chunk; members of tar archives are still parsed in
+    this process, in archive order (see _parse_runs).
+    Files that fail to parse are appended to `errors` as (path, message) pairs,
+    or reported on stderr when no list is given.
+    """
+    read = map_file if use_mmap else read_file
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        results = _parse_runs(file_paths, pool, parse_func, prefetch, read, chunk_size)
+    else:
+        pool = None
+        results = (_parse_file_safe(parse_func, file_path, load)
+                   for file_path, load in open_sources(file_paths, prefetch, read=read))
+    
+    try:
+        for file_path, parsed, error in results:
+            if error is not None:
+                if errors is not None:
+                    errors.append((file_path, error))
+                else:
+                    print(f"Error parsing {file_path}: {error}", file=sys.stderr)
+                continue
+            if parsed is not None:  # None means the file was filtered out by parse_func
+                yield parsed
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def report_errors(errors: List[Tuple[str, str]], out: TextIO) -> None:
+    """Print the per-file parse errors collected during a run."""
+    if not errors:
+        return
+    print(f"{len(errors)} files could not be parsed:", file=out)
+    for file_path, error in errors:
+        print(f"  {file_path}: {error}", file=out)
+
+def file_matches(parsed_file: Union[Dict[str, Any], UMRDocument],
                  language: Optional[str] = None,
                  has_partial_conversion: Optional[bool] = None,
-                 has_document_annotation: Optional[bool] = None) -> List[Dict[str, Any]]:
-    """Filter parsed files based on criteria."""
-    filtered_files = parsed_files.copy()
+                 has_document_annotation: Optional[bool] = None) -> bool:
+    """Check whether a single parsed file (dict or lazy UMRDocument) satisfies the filter criteria."""
+    if isinstance(parsed_file, UMRDocument):
+        # Probe only the header lines / sections the predicates need
+        if language and parsed_file.language != language:
+            return False
+        if has_partial_conversion is not None and \
+                parsed_file.has_partial_conversion() != has_partial_conversion:
+            return False
+        if has_document_annotation is not None and \
+                not parsed_file.has_block_with_document_annotation(has_document_annotation):
+            return False
+        return True
     
-    if language:
-        filtered_files = [f for f in filtered_files if f["language"] == language]
+    if language and parsed_file["language"] != language:
+        return False
     
     if has_partial_conversion is not None:
-        temp_files = []
-        for file in filtered_files:
-            has_partial = False
-            for block in file.get("blocks", []):
-                # Check if any block in the file has partial_conversion
-                meta_info = block.get("meta_info", "")
-                if "type = partial_conversion" in meta_info:
-                    has_partial = True
-                    break
-            
-            # Include file based on whether it should have partial conversion or not
-            if has_partial == has_partial_conversion:
-                temp_files.append(file)
-            
-        filtered_files = temp_files
+        # Check if any block in the file has partial_conversion
+        has_partial = any("type = partial_conversion" in block.get("meta_info", "")
+                          for block in parsed_file.get("blocks", []))
+        if has_partial != has_partial_conversion:
+            return False
     
     if has_document_annotation is not None:
-        temp_files = []
-        for file in filtered_files:
-            include_file = False
-            for block in file.get("blocks", []):
-                if block.get("has_document_annotation", False) == has_document_annotation:
-                    include_file = True
-                    break
-            if include_file:
-                temp_files.append(file)
-        filtered_files = temp_files
-    
-    return filtered_files
+        if not any(block.get("has_document_annotation", False) == has_document_annotation
+                   for block in parsed_file.get("blocks", [])):
+            return False
+    
+    return True
+
+def iter_filtered_files(parsed_files: Iterable[Dict[str, Any]],
+                        language: Optional[str] = None,
+                        has_partial_conversion: Optional[bool] = None,
+                        has_document_annotation: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
+    """Lazily filter a stream of parsed files based on criteria."""
+    for parsed_file in parsed_files:
+        if file_matches(parsed_file, language, has_partial_conversion, has_document_annotation):
+            yield parsed_file
+
+def filter_files(parsed_files: List[Dict[str, Any]], 
+                 language: Optional[str] = None,
+                 has_partial_conversion: Optional[bool] = None,
+                 has_document_annotation: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """Filter parsed files based on criteria."""
+    return list(iter_filtered_files(parsed_files, language,
+                                    has_partial_conversion, has_document_annotation))
+
+def render_jsonl(parsed_file: Dict[str, Any], per_block: bool = False) -> str:
+    """The JSON Lines of a parsed file: one line for the document, or one line per block."""
+    if not per_block:
+        return json.dumps(parsed_file) + "\n"
+    lines = []
+    for block_index, block in enumerate(parsed_file["blocks"]):
+        record = {"filename": parsed_file["filename"],
+                  "language": parsed_file["language"],
+                  "block_index": block_index}
+        record.update(block)
+        lines.append(json.dumps(record) + "\n")
+    return "".join(lines)
+
+def write_jsonl(parsed_files: Iterable[Dict[str, Any]], out: TextIO,
+                per_block: bool = False) -> int:
+    """
+    Stream parsed files to `out` as JSON Lines, one document (or one block) per line.
+    Returns the number of documents written.
+    """
+    count = 0
+    for parsed_file in parsed_files:
+        with PROFILER.stage("json_dump"):
+            out.write(render_jsonl(parsed_file, per_block))
+        # Flush per document so downstream readers can consume output as it is produced
+        out.flush()
+        count += 1
+    return count
+
+def render_file(load_file: Callable[..., Optional[Dict[str, Any]]], layout: str, per_block: bool,
+                file_path: str, data=None) -> Dict[str, Any]:
+    """
+    Parse a file with `load_file` (see load_filtered_file) and render its output for an
+    incremental or sharded export (see umr_incremental, umr_shards): {"path", "language",
+    "filename", "blocks", "text"}, where "text" is None if the file is filtered out.
+    Runs in pool workers, so the JSON is serialized there too.
+    """
+    parsed = load_file(file_path, data=data)
+    if parsed is None:
+        return {"path": file_path, "language": None, "filename": None, "blocks": 0, "text": None}
+    with PROFILER.stage("json_dump"):
+        if layout == 'jsonl':
+            text = render_jsonl(parsed, per_block)
+        else:
+            text = render_json_item(parsed, pretty=layout == 'pretty')
+    return {"path": file_path, "language": parsed["language"], "filename": parsed["filename"],
+            "blocks": len(parsed["blocks"]), "text": text}
+
+def export_incremental(args: argparse.Namespace, root_dir: str, load_file: Callable[..., Optional[Dict[str, Any]]],
+                       jobs: int, log: TextIO) -> None:
+    """
+    --incremental: re-parse only the files that changed since the last export, and reuse the
+    output of all other files (see umr_incremental).
+    """
+    layout = export_layout(args.format, args.pretty)
+    per_block = args.format == 'jsonl' and args.jsonl_records == 'block'
+    # Everything that changes the output of a file, besides the file itself
+    options = {"format": args.format, "pretty": args.pretty, "jsonl_records": args.jsonl_records,
+               "language": args.language, "partial_conversion": args.partial_conversion,
+               "no_partial_conversion": args.no_partial_conversion,
+               "has_document_annotation": args.has_document_annotation,
+               "no_document_annotation": args.no_document_annotation}
+    manifest_path = args.incremental or default_manifest_path(args.output)
+    manifest = load_manifest(manifest_path, args.output, options)
+
+    with PROFILER.stage("list_files"):
+        entries, changed, removed = plan_export(iter_umr_files(root_dir, args.language), manifest)
+    print(f"Incremental export: {len(entries) - len(changed)} files unchanged, {len(changed)} to parse, "
+          f"{removed} removed", file=log)
+
+    errors = []
+    rendered = iter_parsed_files(changed, jobs=jobs, chunk_size=args.chunk_size, errors=errors,
+                                 parse_func=functools.partial(render_file, load_file, layout, per_block),
+                                 prefetch=args.prefetch, use_mmap=args.mmap)
+    output_dir = os.path.dirname(args.output)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    written, _ = write_export(entries, rendered, args.output, manifest_path, layout, options)
+    report_errors(errors, log)
+    print(f"After filtering: {written} files", file=log)
+    print(f"Output written to {args.output} (manifest: {manifest_path})", file=log)
+
+def export_sharded(args: argparse.Namespace, root_dir: str, load_file: Callable[..., Optional[Dict[str, Any]]],
+                   splits: List[Tuple[str, float]], max_bytes: Optional[int], jobs: int) -> None:
+    """--shard-dir: write the JSON Lines export as split shards with a manifest (see umr_shards)."""
+    per_block = args.jsonl_records == 'block'
+    errors = []
+    rendered = iter_parsed_files(iter_umr_files(root_dir, args.language), jobs=jobs, chunk_size=args.chunk_size,
+                                 errors=errors,
+                                 parse_func=functools.partial(render_file, load_file, 'jsonl', per_block),
+                                 prefetch=args.prefetch, use_mmap=args.mmap)
+    manifest = write_shards(rendered, args.shard_dir, splits, seed=args.split_seed,
+                            max_blocks=args.shard_blocks or None, max_bytes=max_bytes,
+                            records=args.jsonl_records)
+    report_errors(errors, sys.stdout)
+    for name, split in manifest["splits"].items():
+        print(f"{name}: {split['documents']} files, {split['blocks']} blocks in {split['shards']} shards")
+    print(f"Shards and manifest written to {args.shard_dir}")
+
+def finish_profile(args: argparse.Namespace) -> None:
+    """Write the --profile report (and the --cprofile dump) at the end of a run."""
+    if not args.profile:
+        return
+    PROFILER.dump_cprofile(args.cprofile)
+    PROFILER.write_report(args.profile)
 
 def main():
     parser = argparse.ArgumentParser(description='Parse UMR files to JSON with filtering options')
@@ -193,6 +766,52 @@ def main():
                         help='Only include files without document level annotation')
     parser.add_argument('--pretty', action='store_true',
                         help='Output pretty-printed JSON')
+    parser.add_argument('--format', type=str, choices=['json', 'jsonl', 'snapshot', 'parquet', 'arrow'], default='json',
+                        help='Output format: a single JSON array, streamed JSON Lines, a compiled '
+                             'memory-mappable snapshot (see umr_snapshot.py), or a Parquet or Arrow IPC '
+                             'table with one row per block (see umr_columnar.py) (default: json)')
+    parser.add_argument('--jsonl-records', type=str, choices=['document', 'block'], default='document',
+                        help='With --format jsonl, write one line per document or per block (default: document)')
+    parser.add_argument('--row-group-size', type=int, default=DEFAULT_ROW_GROUP_SIZE, metavar='N',
+                        help='With --format parquet or arrow, write row groups (record batches) of at most N blocks '
+                             f'(default: {DEFAULT_ROW_GROUP_SIZE})')
+    parser.add_argument('--dictionary', action='store_true',
+                        help='With --format parquet or arrow, dictionary-encode the language and filename columns')
+    parser.add_argument('--shard-dir', type=str, metavar='DIR',
+                        help='With --format jsonl, write the export as shards in DIR, with a manifest of '
+                             'per-shard counts and checksums (see umr_shards.py)')
+    parser.add_argument('--shard-blocks', type=int, default=DEFAULT_SHARD_BLOCKS, metavar='N',
+                        help=f'With --shard-dir, start a new shard before it exceeds N blocks; 0 for no limit '
+                             f'(default: {DEFAULT_SHARD_BLOCKS})')
+    parser.add_argument('--shard-bytes', type=str, metavar='SIZE',
+                        help="With --shard-dir, start a new shard before it exceeds SIZE bytes (e.g. 64M)")
+    parser.add_argument('--split', type=str, metavar='SPEC',
+                        help="With --shard-dir, assign every document to a split by a hash of its language and "
+                             "file name, e.g. 'train=0.8,dev=0.1,test=0.1' (default: a single split, 'all')")
+    parser.add_argument('--split-seed', type=str, default='',
+                        help='With --split, a seed mixed into the document hash, for a different but still '
+                             'deterministic assignment')
+    parser.add_argument('--incremental', type=str, nargs='?', const='', metavar='MANIFEST',
+                        help='With --format json or jsonl, only re-parse files that changed since the last export '
+                             'and reuse the output of the others; their state is kept in MANIFEST '
+                             '(default: <output>.manifest.json)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of worker processes used for parsing; 0 uses all CPUs (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=16,
+                        help='Number of files handed to a worker at a time when --jobs > 1 (default: 16)')
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH_DEPTH, metavar='DEPTH',
+                        help='Number of upcoming files read ahead by background threads while parsing; '
+                             f'raise it for network storage, 0 disables read-ahead (default: {DEFAULT_PREFETCH_DEPTH})')
+    parser.add_argument('--mmap', action='store_true',
+                        help='Memory-map the input files instead of reading them into memory; '
+                             'fields are decoded straight from the mapped pages')
+    parser.add_argument('--profile', type=str, nargs='?', const='parse_umr_to_json_profile.json', metavar='PATH',
+                        help='Time every stage and write a JSON profile report to PATH '
+                             '(default: parse_umr_to_json_profile.json); files are parsed in a single process')
+    parser.add_argument('--profile-top', type=int, default=20,
+                        help='Number of slowest files and blocks listed in the profile report (default: 20)')
+    parser.add_argument('--cprofile', type=str, metavar='PATH',
+                        help='With --profile, also dump cProfile stats to PATH (for snakeviz, flameprof, ...)')
     
     args = parser.parse_args()
     
@@ -203,20 +822,57 @@ def main():
     if args.has_document_annotation and args.no_document_annotation:
         parser.error("--has-document-annotation and --no-document-annotation cannot be used together")
     
-    # Find and parse all UMR files
-    root_dir = os.path.abspath(args.root_dir)
-    print(f"Looking for UMR files in {root_dir}...")
+    if args.pretty and args.format != 'json':
+        parser.error("--pretty can only be used with --format json")
     
-    umr_files = find_umr_files(root_dir)
-    print(f"Found {len(umr_files)} UMR files")
+    if args.output == '-' and args.format != 'jsonl':
+        parser.error("writing to stdout ('-') is only supported with --format jsonl")
+    
+    if args.row_group_size < 1:
+        parser.error("--row-group-size must be >= 1")
+    if args.dictionary and args.format not in ('parquet', 'arrow'):
+        parser.error("--dictionary can only be used with --format parquet or arrow")
+    if args.shard_dir is None and (args.split or args.split_seed or args.shard_bytes):
+        parser.error("--split, --split-seed and --shard-bytes require --shard-dir")
+    if args.shard_dir is not None and args.format != 'jsonl':
+        parser.error("--shard-dir can only be used with --format jsonl")
+    if args.shard_dir is not None and args.incremental is not None:
+        parser.error("--shard-dir cannot be used with --incremental")
+    if args.shard_blocks < 0:
+        parser.error("--shard-blocks must be >= 0")
+    try:
+        splits = parse_split(args.split) if args.split else ALL_SPLIT
+        max_bytes = parse_size(args.shard_bytes) if args.shard_bytes else None
+    except ValueError as e:
+        parser.error(f"--split/--shard-bytes: {e}")
+    if args.incremental is not None and args.format not in ('json', 'jsonl'):
+        parser.error("--incremental can only be used with --format json or jsonl")
+    if args.incremental is not None and args.output == '-':
+        parser.error("--incremental needs an output file")
     
-    parsed_files = []
-    for file_path in umr_files:
-        try:
-            parsed = parse_umr_file(file_path)
-            parsed_files.append(parsed)
-        except Exception as e:
-            print(f"Error parsing {file_path}: {e}")
+    if args.jobs < 0:
+        parser.error("--jobs must be >= 0")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be >= 1")
+    if args.prefetch < 0:
+        parser.error("--prefetch must be >= 0")
+    if args.cprofile and not args.profile:
+        parser.error("--cprofile requires --profile")
+    if args.profile == '-' and args.output == '-':
+        parser.error("--profile and --output cannot both write to stdout")
+    jobs = args.jobs or os.cpu_count() or 1
+    if args.profile:
+        # Stage times are only comparable with the wall time when everything runs in this process
+        jobs = 1
+        PROFILER.enable(top_n=args.profile_top, cprofile=bool(args.cprofile))
+    errors = []
+    
+    # Keep stdout clean for the data when streaming to it
+    log = sys.stderr if args.output == '-' else sys.stdout
+    
+    # Find and parse all UMR files
+    root_dir = os.path.abspath(args.root_dir)
+    print(f"Looking for UMR files in {root_dir}...", file=log)
     
     # Apply filters
     has_partial_conversion = None
@@ -231,13 +887,88 @@ def main():
     elif args.no_document_annotation:
         has_document_annotation = False
     
-    filtered_files = filter_files(
-        parsed_files,
+    # Filters are pushed down: --language prunes the directory listing, and every other file is
+    # probed lazily (see UMRDocument) and only fully parsed if it passes
+    load_file = functools.partial(
+        load_filtered_file,
         language=args.language,
         has_partial_conversion=has_partial_conversion,
         has_document_annotation=has_document_annotation
     )
     
+    if args.shard_dir is not None:
+        export_sharded(args, root_dir, load_file, splits, max_bytes, jobs)
+        finish_profile(args)
+        return
+    
+    if args.incremental is not None:
+        export_incremental(args, root_dir, load_file, jobs, log)
+        finish_profile(args)
+        return
+    
+    if args.format == 'snapshot':
+        # Same streaming pipeline, but each file is scanned into a snapshot record
+        records = iter_parsed_files(iter_umr_files(root_dir, args.language), jobs=jobs,
+                                    chunk_size=args.chunk_size, errors=errors, prefetch=args.prefetch,
+                                    use_mmap=args.mmap,
+                                    parse_func=functools.partial(load_file, parse_func=scan_file_record))
+        output_dir = os.path.dirname(args.output)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        n_files, n_blocks = build_snapshot(records, args.output, root_dir)
+        report_errors(errors, sys.stdout)
+        print(f"After filtering: {n_files} files ({n_blocks} blocks)")
+        print(f"Snapshot written to {args.output}")
+        finish_profile(args)
+        return
+    
+    if args.format in ('parquet', 'arrow'):
+        # Streaming pipeline as for jsonl; blocks are written a row group at a time
+        documents = iter_parsed_files(iter_umr_files(root_dir, args.language), jobs=jobs, chunk_size=args.chunk_size,
+                                      errors=errors, parse_func=load_file, prefetch=args.prefetch,
+                                      use_mmap=args.mmap)
+        output_dir = os.path.dirname(args.output)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        n_files, n_blocks, n_row_groups = write_columnar(documents, args.output, args.format,
+                                                         row_group_size=args.row_group_size,
+                                                         dictionary=args.dictionary)
+        report_errors(errors, sys.stdout)
+        print(f"After filtering: {n_files} files ({n_blocks} blocks in {n_row_groups} row groups)")
+        print(f"Output written to {args.output}")
+        finish_profile(args)
+        return
+    
+    if args.format == 'jsonl':
+        # Streaming pipeline: find -> filter -> parse -> write, one document at a time
+        documents = iter_parsed_files(iter_umr_files(root_dir, args.language), jobs=jobs, chunk_size=args.chunk_size,
+                                      errors=errors, parse_func=load_file, prefetch=args.prefetch,
+                                      use_mmap=args.mmap)
+        
+        if args.output == '-':
+            written = write_jsonl(documents, sys.stdout, per_block=args.jsonl_records == 'block')
+        else:
+            output_dir = os.path.dirname(args.output)
+            if output_dir and not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                written = write_jsonl(documents, f, per_block=args.jsonl_records == 'block')
+        
+        report_errors(errors, sys.stderr)
+        print(f"After filtering: {written} files", file=log)
+        if args.output != '-':
+            print(f"Output written to {args.output}", file=log)
+        finish_profile(args)
+        return
+    
+    umr_files = find_umr_files(root_dir, args.language)
+    print(f"Found {len(umr_files)} UMR files")
+    
+    filtered_files = list(iter_parsed_files(umr_files, jobs=jobs, chunk_size=args.chunk_size,
+                                            errors=errors, parse_func=load_file, prefetch=args.prefetch,
+                                            use_mmap=args.mmap))
+    report_errors(errors, sys.stdout)
+    
     print(f"After filtering: {len(filtered_files)} files")
     
     # Create directories if they don't exist
@@ -246,13 +977,14 @@ def main():
         os.makedirs(output_dir)
     
     # Write output
-    with open(args.output, 'w', encoding='utf-8') as f:
+    with PROFILER.stage("json_dump"), open(args.output, 'w', encoding='utf-8') as f:
         if args.pretty:
             json.dump(filtered_files, f, indent=2)
         else:
             json.dump(filtered_files, f)
     
     print(f"Output written to {args.output}")
+    finish_profile(args)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
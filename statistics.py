@@ -1,11 +1,18 @@
-import os,re
-import penman
-from penman.exceptions import DecodeError
+import os
 from tabulate import tabulate
 from pathlib import Path
-import sys
+import argparse
+import numpy as np
 from datetime import datetime
 
+import umr_stats
+from umr_stats import (DEFAULT_CACHE_PATH, SUMMARY_HEADERS, list_umr_files, find_language_files,
+                       load_stats_cache, save_stats_cache, collect_block_table, collect_stats,
+                       stats_by, summary_rows)
+from umr_snapshot import UMRSnapshot, PARTIAL, SENTENCE_GRAPH, DOC_GRAPH
+from umr_profile import PROFILER
+from umr_prefetch import DEFAULT_PREFETCH_DEPTH
+from umr_metrics import BlockTable, source_prefix
 
 # Get the directory of the current script
 current_script_dir = Path(__file__).parent
@@ -13,236 +20,112 @@ current_script_dir = Path(__file__).parent
 # Construct the path to the file
 root = current_script_dir
 
-# Setup output file
-output_file_path = current_script_dir / f"umr_statistics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-output_file = open(output_file_path, 'w', encoding='utf-8')
+# Output file, opened in __main__ so that importing this module (e.g. in worker processes) has no side effects
+output_file_path = None
+output_file = None
 
 # Custom print function to output to both terminal and file
 def dual_print(text):
     print(text)
-    output_file.write(text + '\n')
+    if output_file is not None:
+        output_file.write(text + '\n')
 
-def parse_blocks_from_file(file_path):
+def snapshot_block_table(snapshot):
     """
-    Reads the .txt file and yields one 'block' at a time (list of lines).
-    Each block is separated by lines starting with '################################################################################'.
+    Build the BlockTable of a UMRSnapshot (see umr_snapshot.py) from its columns, without reading any .umr file.
+    Languages are in the order they appear in the snapshot.
     """
-    blocks = []
-    current_block = []
-
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip().startswith("################################################################################"):
-                # If we hit the delimiter, store the current block (if not empty) and start a new one
-                if current_block:
-                    blocks.append(current_block)
-                    current_block = []
-            else:
-                current_block.append(line.rstrip('\n'))
-        # Add the last block if file doesn't end with the delimiter
-        if current_block:
-            blocks.append(current_block)
-
-    return blocks
+    flags = np.array(snapshot.column('flags'))
+    sources = {}
+    block_source = np.array([sources.setdefault(source_prefix(snapshot.sent_id(b)), len(sources))
+                             for b in range(snapshot.n_blocks)], dtype=np.int32)
+    columns = {
+        "file": np.array(snapshot.column('file'), dtype=np.int32),
+        "source": block_source,
+        "is_partial": (flags & PARTIAL) != 0,
+        "word_count": np.array(snapshot.column('words'), dtype=np.int32),
+        "has_sentence_graph": (flags & SENTENCE_GRAPH) != 0,
+        "has_doc_graph": (flags & DOC_GRAPH) != 0,
+        "relations_count": np.array(snapshot.column('relations'), dtype=np.int32),
+        "concepts_count": np.array(snapshot.column('concepts'), dtype=np.int32),
+        "doc_relations_count": np.array(snapshot.column('doc_relations'), dtype=np.int32),
+        "doc_temporal_count": np.array(snapshot.column('doc_temporal'), dtype=np.int32),
+        "doc_modal_count": np.array(snapshot.column('doc_modal'), dtype=np.int32),
+        "doc_coref_count": np.array(snapshot.column('doc_coref'), dtype=np.int32),
+    }
+    files = [snapshot.file_path(file_id) for file_id in range(snapshot.n_files)]
+    return BlockTable(list(snapshot.languages), files, np.array(snapshot.column('file_lang'), dtype=np.int32),
+                      list(sources), columns)
 
-def analyze_block(block_lines):
+def collect_snapshot_stats(snapshot):
     """
-    Analyze a single block and return a dictionary with:
-      - is_partial: bool (True if :: type = partial_conversion)
-      - word_count: int (# of words in the 'Words:' line)
-      - has_sentence_graph: bool
-      - has_doc_graph: bool (doc-level graph with >2 lines)
-      - relations_count: int (# of relations in the sentence-level graph)
-      - concepts_count: int (# of concepts in the sentence-level graph)
+    Compute counters per language from a UMRSnapshot (see umr_snapshot.py) without reading any .umr file.
+    Returns {language: counters} in the order the languages appear in the snapshot.
     """
-    is_partial = False
-    word_count = 0
-    has_sentence_graph = False
-    has_doc_graph = False
-    relations_count = 0
-    concepts_count = 0
-    doc_relations_count = 0
-
-    # Convert block lines to a single string for easy searching
-    block_text = "\n".join(block_lines)
-
-    # 1) Check if partial_conversion
-    for line in block_lines:
-        if line.startswith('# meta-info') and 'type = partial_conversion' in line:
-            is_partial = True
-            break
-
-    # 2) Count words from the "Words:" line
-    for line in block_lines:
-        if line.startswith("Words:"):
-            # Extract everything after "Words:"
-            words_part = line.replace("Words:", "").strip()
-            word_count = len(words_part.split())
-            break
-
-    # 3) Detect and parse the sentence-level graph
-    #    We'll count "has_sentence_graph" if there's at least one line of graph text
-    #    after '# sentence level graph:'.
-    if "# sentence level graph:" in block_text:
-        start_index = None
-        for i, line in enumerate(block_lines):
-            if line.strip().startswith("# sentence level graph:"):
-                start_index = i + 1
-                break
-
-        if start_index is not None and start_index < len(block_lines):
-            # Collect graph lines until we hit another '#' section or end of block
-            graph_lines = []
-            for j in range(start_index, len(block_lines)):
-                if block_lines[j].strip().startswith("#"):
-                    break
-                graph_lines.append(block_lines[j])
+    return stats_by(snapshot_block_table(snapshot))
 
-            graph_text = "\n".join(graph_lines).strip()
-            if graph_text:
-                has_sentence_graph = True
-                clean_graph_text = graph_text.replace("#", "") # czech has concepts starts with #
-                clean_graph_text = re.sub(r"\((s\d+x\d+) / /\)", r"\1", clean_graph_text) # czech has nodes like (s234x21 / /)
-                # Try to decode with Penman
-                try:
-                    g = penman.decode(clean_graph_text)
-                    triples = g.triples
-                    # Count concepts vs. relations
-                    relations_count = sum(1 for triple in triples if triple[1] != ':instance')
-                    concepts_count = sum(1 for triple in triples if triple[1] == ':instance')
-                except DecodeError:
-                    # Optional: print the failing graph or an error message
-                    # (Only if you want to debug. Otherwise, you can silence it.)
-                    print(f"DecodeError in block:\n{clean_graph_text}\n")
+# Extra tables printed after the summary with --breakdown
+BREAKDOWNS = ["file", "source", "graph-size"]
 
-
-    # 4) Check for multi-line document-level graph
-    #    We only count it if there are >2 lines after "# document level annotation:".
-    if "# document level annotation:" in block_text:
-        start_index = None
-        for i, line in enumerate(block_lines):
-            if line.strip().startswith("# document level annotation:"):
-                start_index = i + 1
-                break
-        if start_index is not None:
-            doc_graph_lines = []
-            for j in range(start_index, len(block_lines)):
-                line_j = block_lines[j].strip()
-                if line_j.startswith("#"):
-                    break
-                if line_j:  # skip empty lines
-                    doc_graph_lines.append(line_j)
-            if len(doc_graph_lines) > 2:
-                has_doc_graph = True
-                doc_relations_count = len(doc_graph_lines) - 1
-
-
-    return {
-        "is_partial": is_partial,
-        "word_count": word_count,
-        "has_sentence_graph": has_sentence_graph,
-        "has_doc_graph": has_doc_graph,
-        "relations_count": relations_count,
-        "concepts_count": concepts_count,
-        "doc_relations_count": doc_relations_count
-    }
-
-def analyze_folder(folder_path):
+def print_breakdown(table, breakdown):
     """
-    Go through each .txt file in the folder, parse blocks, categorize partial vs. non-partial,
-    and accumulate stats (including relations & concepts).
+    Print one --breakdown table: the summary per file or per sent_id source (e.g. DF-, u_tree-),
+    or the number of sentence graphs per language by size in concepts.
+    """
+    if breakdown == "graph-size":
+        labels, bins, counts = table.histogram("language")
+        dual_print("\n\n======== SENTENCE GRAPHS BY SIZE (CONCEPTS) ========")
+        rows = [[label] + row.tolist() + [int(row.sum())] for label, row in zip(labels, counts)]
+        rows.append(["TOTAL"] + counts.sum(axis=0).tolist() + [int(counts.sum())])
+        dual_print(tabulate(rows, headers=["Language"] + bins + ["Total"], tablefmt="grid"))
+        return
+
+    labels, counters = table.counters(breakdown)
+    if breakdown == "file":
+        dual_print("\n\n======== SUMMARY PER FILE ========")
+        labels = [os.path.relpath(label, root) for label in labels]
+        header = "File"
+    else:
+        dual_print("\n\n======== SUMMARY PER SOURCE (SENT_ID PREFIX) ========")
+        labels = [label or "(none)" for label in labels]
+        header = "Source"
+    dual_print(tabulate(summary_rows(labels, counters), headers=[header] + SUMMARY_HEADERS, tablefmt="grid"))
+
+def print_folder_stats(stats):
+    """
+    Print the ALL / PARTIAL / NON-PARTIAL tables for one folder's counters.
     """
-    all_docs = 0
-    # PARTIAL counters
-    partial_docs = 0
-    partial_sentences = 0
-    partial_words = 0
-    partial_sentence_graphs = 0
-    partial_doc_graphs = 0
-    partial_relations = 0
-    partial_concepts = 0
-    partial_doc_relations = 0
-
-    # NON-PARTIAL counters
-    nonpartial_docs = 0
-    nonpartial_sentences = 0
-    nonpartial_words = 0
-    nonpartial_sentence_graphs = 0
-    nonpartial_doc_graphs = 0
-    nonpartial_relations = 0
-    nonpartial_concepts = 0
-    nonpartial_doc_relations = 0
-
-    # Iterate over each .txt file
-    for fname in os.listdir(folder_path):
-        if not fname.endswith(".umr"):
-            continue
-
-        all_docs += 1
-        file_path = os.path.join(folder_path, fname)
-        blocks = parse_blocks_from_file(file_path)
-
-        # Track if this file had partial or non-partial blocks
-        file_has_partial = False
-        file_has_nonpartial = False
-
-        for block in blocks:
-            info = analyze_block(block)
-
-            if info["is_partial"]:
-                file_has_partial = True
-                partial_sentences += 1
-                partial_words += info["word_count"]
-                if info["has_sentence_graph"]:
-                    partial_sentence_graphs += 1
-                if info["has_doc_graph"]:
-                    partial_doc_graphs += 1
-                partial_relations += info["relations_count"]
-                partial_concepts += info["concepts_count"]
-                partial_doc_relations += info["doc_relations_count"]
-            else:
-                file_has_nonpartial = True
-                nonpartial_sentences += 1
-                nonpartial_words += info["word_count"]
-                if info["has_sentence_graph"]:
-                    nonpartial_sentence_graphs += 1
-                if info["has_doc_graph"]:
-                    nonpartial_doc_graphs += 1
-                nonpartial_relations += info["relations_count"]
-                nonpartial_concepts += info["concepts_count"]
-                nonpartial_doc_relations += info["doc_relations_count"]
-
-        if file_has_partial:
-            partial_docs += 1
-        if file_has_nonpartial:
-            nonpartial_docs += 1
-
-
     all_data = [
-        ["Documents", all_docs],
+        ["Documents", stats["all_docs"]],
     ]
     # Prepare table data for partial
     partial_data = [
-        ["Documents", partial_docs],
-        ["Sentences (Blocks)", partial_sentences],
-        ["Words", partial_words],
-        ["Sentence-level Graphs", partial_sentence_graphs],
-        ["Doc-level Graphs", partial_doc_graphs],
-        ["Relations (Sentence-level)", partial_relations],
-        ["Concepts (Sentence-level)", partial_concepts],
-        ["Relations (Document-level)", partial_doc_relations],
+        ["Documents", stats["partial_docs"]],
+        ["Sentences (Blocks)", stats["partial_sentences"]],
+        ["Words", stats["partial_words"]],
+        ["Sentence-level Graphs", stats["partial_sentence_graphs"]],
+        ["Doc-level Graphs", stats["partial_doc_graphs"]],
+        ["Relations (Sentence-level)", stats["partial_relations"]],
+        ["Concepts (Sentence-level)", stats["partial_concepts"]],
+        ["Relations (Document-level)", stats["partial_doc_relations"]],
+        ["  Temporal Relations", stats["partial_doc_temporal"]],
+        ["  Modal Relations", stats["partial_doc_modal"]],
+        ["  Coref Relations", stats["partial_doc_coref"]],
     ]
 
     # Prepare table data for non-partial
     nonpartial_data = [
-        ["Documents", nonpartial_docs],
-        ["Sentences (Blocks)", nonpartial_sentences],
-        ["Words", nonpartial_words],
-        ["Sentence-level Graphs", nonpartial_sentence_graphs],
-        ["Doc-level Graphs", nonpartial_doc_graphs],
-        ["Relations (Sentence-level)", nonpartial_relations],
-        ["Concepts (Sentence-level)", nonpartial_concepts],
-        ["Relations (Document-level)", nonpartial_doc_relations],
+        ["Documents", stats["nonpartial_docs"]],
+        ["Sentences (Blocks)", stats["nonpartial_sentences"]],
+        ["Words", stats["nonpartial_words"]],
+        ["Sentence-level Graphs", stats["nonpartial_sentence_graphs"]],
+        ["Doc-level Graphs", stats["nonpartial_doc_graphs"]],
+        ["Relations (Sentence-level)", stats["nonpartial_relations"]],
+        ["Concepts (Sentence-level)", stats["nonpartial_concepts"]],
+        ["Relations (Document-level)", stats["nonpartial_doc_relations"]],
+        ["  Temporal Relations", stats["nonpartial_doc_temporal"]],
+        ["  Modal Relations", stats["nonpartial_doc_modal"]],
+        ["  Coref Relations", stats["nonpartial_doc_coref"]],
     ]
     dual_print("=== Stats for ALL ===")
     dual_print(tabulate(all_data, headers=["Metric", "Count"], tablefmt="grid"))
@@ -252,26 +135,15 @@ def analyze_folder(folder_path):
 
     dual_print("\n=== Stats for NON-PARTIAL-CONVERSION Blocks ===")
     dual_print(tabulate(nonpartial_data, headers=["Metric", "Count"], tablefmt="grid"))
-    
-    return {
-        "all_docs": all_docs,
-        "partial_docs": partial_docs,
-        "partial_sentences": partial_sentences,
-        "partial_words": partial_words,
-        "partial_sentence_graphs": partial_sentence_graphs,
-        "partial_doc_graphs": partial_doc_graphs,
-        "partial_relations": partial_relations,
-        "partial_concepts": partial_concepts,
-        "partial_doc_relations": partial_doc_relations,
-        "nonpartial_docs": nonpartial_docs,
-        "nonpartial_sentences": nonpartial_sentences,
-        "nonpartial_words": nonpartial_words,
-        "nonpartial_sentence_graphs": nonpartial_sentence_graphs,
-        "nonpartial_doc_graphs": nonpartial_doc_graphs,
-        "nonpartial_relations": nonpartial_relations,
-        "nonpartial_concepts": nonpartial_concepts,
-        "nonpartial_doc_relations": nonpartial_doc_relations
-    }
+
+def analyze_folder(folder_path, jobs=1):
+    """
+    Go through each .umr file in the folder, parse blocks, categorize partial vs. non-partial,
+    and accumulate stats (including relations & concepts). Prints the tables and returns the counters.
+    """
+    stats = collect_stats({folder_path: list_umr_files(folder_path)}, jobs=jobs)[folder_path]
+    print_folder_stats(stats)
+    return stats
 
 def print_explanation():
 
@@ -288,6 +160,9 @@ def print_explanation():
         ["Relations (Sentence-level)", "Total relations in partially converted sentence level annotation"],
         ["Concepts (Sentence-level)", "Total concepts in partially converted annotation"],
         ["Relations (Document-level)", "Total relations in partially converted document level annotation"],
+        ["  Temporal Relations", "Relations listed under :temporal in partially converted document level annotation"],
+        ["  Modal Relations", "Relations listed under :modal in partially converted document level annotation"],
+        ["  Coref Relations", "Relations listed under :coref in partially converted document level annotation"],
     ]
 
     # Prepare table data for non-partial
@@ -300,6 +175,9 @@ def print_explanation():
         ["Relations (Sentence-level)", "Total relations in non-partially converted sentence level annotation"],
         ["Concepts (Sentence-level)", "Total concepts in non-partially converted annotation"],
         ["Relations (Document-level)", "Total relations in non-partially converted document level annotation"],
+        ["  Temporal Relations", "Relations listed under :temporal in non-partially converted document level annotation"],
+        ["  Modal Relations", "Relations listed under :modal in non-partially converted document level annotation"],
+        ["  Coref Relations", "Relations listed under :coref in non-partially converted document level annotation"],
     ]
     print("=== Stats for ALL ===")
     print(tabulate(all_data, headers=["Metric", "Count"], tablefmt="grid"))
@@ -312,89 +190,107 @@ def print_explanation():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compute UMR corpus statistics tables')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of worker processes; 0 uses all CPUs (default: 1)')
+    parser.add_argument('--shard-size', type=int, default=64,
+                        help='Number of files analyzed per worker task (default: 64)')
+    parser.add_argument('--cache', type=str, nargs='?', const=str(DEFAULT_CACHE_PATH),
+                        help='Reuse per-file results from this cache file and only re-analyze changed files '
+                             f'(default path when given without a value: {DEFAULT_CACHE_PATH.name})')
+    parser.add_argument('--cache-hash', action='store_true',
+                        help='With --cache, validate entries by content hash instead of mtime and size')
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH_DEPTH, metavar='DEPTH',
+                        help='Number of upcoming files read ahead by background threads while analyzing; '
+                             f'raise it for network storage, 0 disables read-ahead (default: {DEFAULT_PREFETCH_DEPTH})')
+    parser.add_argument('--graph-cache', type=str, metavar='DIR',
+                        help='Keep graphs that need a full Penman decode in this on-disk graph cache')
+    parser.add_argument('--profile', type=str, nargs='?', const='statistics_profile.json', metavar='PATH',
+                        help='Time every stage and write a JSON profile report to PATH '
+                             '(default: statistics_profile.json); files are analyzed in a single process')
+    parser.add_argument('--profile-top', type=int, default=20,
+                        help='Number of slowest files and blocks listed in the profile report (default: 20)')
+    parser.add_argument('--cprofile', type=str, metavar='PATH',
+                        help='With --profile, also dump cProfile stats to PATH (for snakeviz, flameprof, ...)')
+    parser.add_argument('--breakdown', choices=BREAKDOWNS, action='append',
+                        help='Also print a summary per file, per sent_id source (DF-, u_tree-, ...) or a histogram '
+                             'of sentence graph sizes per language; may be repeated')
+    parser.add_argument('--snapshot', type=str,
+                        help='Compute the tables from a snapshot built with '
+                             '`parse_umr_to_json.py --format snapshot` instead of reading the .umr files')
+    args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("--jobs must be >= 0")
+    if args.shard_size < 1:
+        parser.error("--shard-size must be >= 1")
+    if args.cache_hash and not args.cache:
+        parser.error("--cache-hash requires --cache")
+    if args.snapshot and args.cache:
+        parser.error("--snapshot cannot be used with --cache")
+    if args.prefetch < 0:
+        parser.error("--prefetch must be >= 0")
+    if args.cprofile and not args.profile:
+        parser.error("--cprofile requires --profile")
+    jobs = args.jobs or os.cpu_count() or 1
+    if args.profile:
+        # Stage times are only comparable with the wall time when everything runs in this process
+        jobs = 1
+        PROFILER.enable(top_n=args.profile_top, cprofile=bool(args.cprofile))
+
+    # Setup output file
+    output_file_path = current_script_dir / f"umr_statistics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    output_file = open(output_file_path, 'w', encoding='utf-8')
+
     try:
-        # Find all language folders in ready_to_release directory
-        languages = [d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)) and not d.startswith('.')]
-        dual_print(f"Detected language folders: {languages}")
+        if args.snapshot:
+            with PROFILER.stage("snapshot"), UMRSnapshot(args.snapshot) as snapshot:
+                table = snapshot_block_table(snapshot)
+            languages = list(table.languages)
+            found_languages = set(languages)
+            dual_print(f"Detected language folders: {languages}")
+        else:
+            languages, files_by_lang = find_language_files(root)
+            dual_print(f"Detected language folders: {languages}")
+            with PROFILER.stage("cache_load"):
+                cache = load_stats_cache(args.cache) if args.cache else None
+            table = collect_block_table(files_by_lang, jobs=jobs, shard_size=args.shard_size,
+                                        cache=cache, use_hash=args.cache_hash, languages=languages,
+                                        graph_cache_dir=args.graph_cache, prefetch=args.prefetch)
+            found_languages = set(files_by_lang)
+            if cache is not None:
+                with PROFILER.stage("cache_save"):
+                    save_stats_cache(args.cache, cache)
+            if umr_stats.graph_cache is not None and jobs == 1:
+                # Worker processes keep their own counters, so these are only meaningful for a serial run
+                info = umr_stats.graph_cache.info()
+                print(f"Graph cache: {info.hits + info.disk_hits} hits ({info.disk_hits} from disk), "
+                      f"{info.misses} misses")
         
-        # Store statistics for each language
-        language_stats = {}
+        # Every table below is a group-by over the block table (see umr_metrics.py)
+        collected = stats_by(table, "language")
         
         for lang in languages:
             dual_print(f"\n\n======== STATISTICS FOR {lang.upper()} ========")
             # Check if umr_data subfolder exists
-            umr_data_path = Path(root) / lang / "umr_data"
-            if umr_data_path.exists() and umr_data_path.is_dir():
-                language_stats[lang] = analyze_folder(umr_data_path)
+            if lang in found_languages:
+                print_folder_stats(collected[lang])
             else:
                 dual_print(f"No umr_data folder found for {lang}")
-                language_stats[lang] = {
-                    "all_docs": 0, "partial_docs": 0, "partial_sentences": 0, 
-                    "partial_words": 0, "partial_sentence_graphs": 0, "partial_doc_graphs": 0,
-                    "partial_relations": 0, "partial_concepts": 0, "partial_doc_relations": 0,
-                    "nonpartial_docs": 0, "nonpartial_sentences": 0, "nonpartial_words": 0,
-                    "nonpartial_sentence_graphs": 0, "nonpartial_doc_graphs": 0, 
-                    "nonpartial_relations": 0, "nonpartial_concepts": 0, "nonpartial_doc_relations": 0
-                }
         
         # Print summary table
         dual_print("\n\n======== SUMMARY ACROSS ALL LANGUAGES ========")
-        summary_headers = ["Language", "Documents", "Sentences", "Words", "Sentence Graphs", "Doc Graphs", "Relations", "Concepts"]
-        summary_rows = []
-        
-        # Calculate totals
-        totals = {
-            "all_docs": 0, "sentences": 0, "words": 0, 
-            "sentence_graphs": 0, "doc_graphs": 0,
-            "relations": 0, "concepts": 0
-        }
-        
-        for lang, stats in language_stats.items():
-            sentences = stats["partial_sentences"] + stats["nonpartial_sentences"]
-            words = stats["partial_words"] + stats["nonpartial_words"]
-            sentence_graphs = stats["partial_sentence_graphs"] + stats["nonpartial_sentence_graphs"]
-            doc_graphs = stats["partial_doc_graphs"] + stats["nonpartial_doc_graphs"]
-            relations = stats["partial_relations"] + stats["nonpartial_relations"] + stats["partial_doc_relations"] + stats["nonpartial_doc_relations"]
-            concepts = stats["partial_concepts"] + stats["nonpartial_concepts"]
-            
-            summary_rows.append([
-                lang, 
-                stats["all_docs"], 
-                sentences,
-                words,
-                sentence_graphs,
-                doc_graphs,
-                relations,
-                concepts
-            ])
-            
-            # Update totals
-            totals["all_docs"] += stats["all_docs"]
-            totals["sentences"] += sentences
-            totals["words"] += words
-            totals["sentence_graphs"] += sentence_graphs
-            totals["doc_graphs"] += doc_graphs
-            totals["relations"] += relations
-            totals["concepts"] += concepts
-        
-        # Sort summary rows by document count (descending)
-        summary_rows.sort(key=lambda x: x[1], reverse=True)
+        labels, counters = table.counters("language")
+        dual_print(tabulate(summary_rows(labels, counters), headers=["Language"] + SUMMARY_HEADERS, tablefmt="grid"))
         
-        # Add totals row
-        summary_rows.append([
-            "TOTAL", 
-            totals["all_docs"], 
-            totals["sentences"],
-            totals["words"],
-            totals["sentence_graphs"],
-            totals["doc_graphs"],
-            totals["relations"],
-            totals["concepts"]
-        ])
+        for breakdown in args.breakdown or []:
+            print_breakdown(table, breakdown)
         
-        dual_print(tabulate(summary_rows, headers=summary_headers, tablefmt="grid"))
+        # Terminal only: the saved tables should not depend on where or when they were written
+        print(f"\nStatistics have been saved to: {output_file_path}")
         
-        dual_print(f"\nStatistics have been saved to: {output_file_path}")
+        if args.profile:
+            PROFILER.dump_cprofile(args.cprofile)
+            PROFILER.write_report(args.profile)
         
     finally:
         # Close the output file
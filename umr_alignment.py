@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Alignment sections parsed into compact span tables.
+
+An '# alignment:' section maps every node of the sentence graph to token spans of the
+'Index:' line, e.g. 's2e1: 6-6,8-8'; '0-0' (and '-1--1') marks an unaligned node.
+parse_alignment turns the section into an AlignmentTable: the node ids, and one (start, end)
+row per span in an int32 array, with the spans of each node contiguous. Lookups go both ways:
+
+    table = parse_alignment(block.section_text('alignment'))
+    table.lookup('s2e1')         # array([[6, 6], [8, 8]], dtype=int32)
+    table.nodes_at(6)            # ['s2e1']
+    table.validate(index_token_count(block.sentence_text))   # [] if every span is in range
+
+An AlignmentStore keeps the tables of a whole corpus in a few flat arrays saved as one .npz
+file, so a training loader reads them back instead of parsing the sections on every epoch:
+
+    python umr_alignment.py build
+    python umr_alignment.py show u_tree-cs-s2-root --language czech
+    python umr_alignment.py validate
+
+    store = AlignmentStore.load('umr_alignments.npz')
+    for block_id in store.find('u_tree-cs-s2-root'):
+        table = store.table(block_id)
+"""
+import os
+import re
+import sys
+import argparse
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from umr_scanner import scan_umr_file
+from umr_sources import logical_name, language_of
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'umr_alignments.npz')
+
+# Spans that mark a node as unaligned; the node is kept, without spans
+UNALIGNED_SPANS = {(0, 0), (-1, -1)}
+
+_LINE_RE = re.compile(r'\s*([^\s:]+)\s*:(.*)$')
+_SPAN_RE = re.compile(r'\s*(-?\d+)\s*-\s*(-?\d+)\s*')
+_INDEX_RE = re.compile(r'^Index:(.*)$', re.MULTILINE)
+
+class AlignmentTable:
+    """
+    The alignment of one block: `nodes` (node ids in section order), `spans` (an (n_spans, 2)
+    int32 array of 1-based, inclusive token ranges) and `node_first` (node i owns the rows
+    node_first[i]:node_first[i + 1] of `spans`). `problems` lists the lines that could not be read.
+    """
+    __slots__ = ('nodes', 'node_first', 'spans', 'problems', '_node_ids', '_token_nodes')
+
+    def __init__(self, nodes: List[str], node_first: np.ndarray, spans: np.ndarray,
+                 problems: Optional[List[str]] = None):
+        self.nodes = nodes
+        self.node_first = node_first
+        self.spans = spans
+        self.problems = problems or []
+        self._node_ids: Optional[Dict[str, int]] = None
+        self._token_nodes = None
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __repr__(self) -> str:
+        return f"AlignmentTable({len(self.nodes)} nodes, {len(self.spans)} spans)"
+
+    def node_spans(self, node_id: int) -> np.ndarray:
+        """The (start, end) rows of the node at position node_id."""
+        return self.spans[self.node_first[node_id]:self.node_first[node_id + 1]]
+
+    def node_id(self, node: str) -> Optional[int]:
+        """The position of a node in `nodes`, or None if the section does not align it."""
+        if self._node_ids is None:
+            self._node_ids = {name: i for i, name in enumerate(self.nodes)}
+        return self._node_ids.get(node)
+
+    def lookup(self, node: str) -> np.ndarray:
+        """The (start, end) rows of a node, empty if it is unaligned or not in the section."""
+        node_id = self.node_id(node)
+        if node_id is None:
+            return self.spans[:0]
+        return self.node_spans(node_id)
+
+    def span_nodes(self) -> np.ndarray:
+        """The position of the node of every span row."""
+        return np.repeat(np.arange(len(self.nodes), dtype=np.int32), np.diff(self.node_first))
+
+    def token_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The inverse table, token -> nodes, in CSR form: (token_first, token_nodes), where the nodes
+        covering token t are token_nodes[token_first[t]:token_first[t + 1]] (node positions in
+        section order). Tokens range from 0 to the largest aligned token.
+        """
+        if self._token_nodes is None:
+            span_nodes = self.span_nodes()
+            lengths = np.maximum(self.spans[:, 1] - self.spans[:, 0] + 1, 0)
+            # One (token, node) pair per token of every span
+            tokens = np.repeat(self.spans[:, 0], lengths) + \
+                np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            nodes = np.repeat(span_nodes, lengths)
+            pairs = np.unique(np.stack([tokens, nodes], axis=1), axis=0) if len(tokens) \
+                else np.empty((0, 2), dtype=np.int64)
+            n_tokens = int(pairs[:, 0].max()) + 1 if len(pairs) else 0
+            token_first = np.zeros(n_tokens + 1, dtype=np.int32)
+            np.cumsum(np.bincount(pairs[:, 0], minlength=n_tokens), out=token_first[1:])
+            self._token_nodes = (token_first, pairs[:, 1].astype(np.int32))
+        return self._token_nodes
+
+    def nodes_at(self, token: int) -> List[str]:
+        """The ids of the nodes aligned to a (1-based) token, in section order."""
+        token_first, token_nodes = self.token_index()
+        if not 0 <= token < len(token_first) - 1:
+            return []
+        return [self.nodes[i] for i in token_nodes[token_first[token]:token_first[token + 1]]]
+
+    def validate(self, n_tokens: Optional[int]) -> List[str]:
+        """
+        Check the table against the number of tokens of the block's Index: line (None if the
+        block has none) and return one message per problem: unreadable lines, repeated nodes,
+        reversed spans and spans outside 1..n_tokens.
+        """
+        messages = list(self.problems)
+        if len(set(self.nodes)) != len(self.nodes):
+            seen = set()
+            for node in self.nodes:
+                if node in seen:
+                    messages.append(f"node {node} is aligned more than once")
+                seen.add(node)
+        if not len(self.spans):
+            return messages
+        span_nodes = self.span_nodes()
+        starts, ends = self.spans[:, 0], self.spans[:, 1]
+        for i in np.flatnonzero(starts > ends):
+            messages.append(f"{self.nodes[span_nodes[i]]}: span {starts[i]}-{ends[i]} is reversed")
+        if n_tokens is None:
+            messages.append("the block has alignments but no Index: line")
+            return messages
+        for i in np.flatnonzero((starts < 1) | (ends > n_tokens)):
+            messages.append(f"{self.nodes[span_nodes[i]]}: span {starts[i]}-{ends[i]} "
+                            f"is outside the {n_tokens} tokens of the Index: line")
+        return messages
+
+def parse_alignment(text: Optional[str]) -> AlignmentTable:
+    """Parse the text of an alignment section (None or '' for a block without one) into an AlignmentTable."""
+    nodes: List[str] = []
+    node_first = [0]
+    rows: List[Tuple[int, int]] = []
+    problems: List[str] = []
+    for line in (text or '').splitlines():
+        if not line.strip():
+            continue
+        match = _LINE_RE.match(line)
+        if match is None:
+            problems.append(f"cannot read alignment line {line.strip()!r}")
+            continue
+        node, spans_text = match.groups()
+        node_rows = []
+        for part in spans_text.split(','):
+            span = _SPAN_RE.fullmatch(part)
+            if span is None:
+                node_rows = None
+                break
+            node_rows.append((int(span.group(1)), int(span.group(2))))
+        if node_rows is None:
+            problems.append(f"cannot read the spans of {node}: {spans_text.strip()!r}")
+            continue
+        nodes.append(node)
+        rows.extend(row for row in node_rows if row not in UNALIGNED_SPANS)
+        node_first.append(len(rows))
+    spans = np.array(rows, dtype=np.int32).reshape(len(rows), 2)
+    return AlignmentTable(nodes, np.array(node_first, dtype=np.int32), spans, problems)
+
+def index_token_count(sentence_text: str) -> Optional[int]:
+    """The number of tokens on the 'Index:' line of a block's sentence information, or None if it has none."""
+    match = _INDEX_RE.search(sentence_text)
+    return len(match.group(1).split()) if match else None
+
+def block_alignment(block) -> AlignmentTable:
+    """The AlignmentTable of a scanned (umr_scanner.UMRBlock) or lazy (parse_umr_to_json.LazyBlock) block."""
+    return parse_alignment(block.section_text('alignment'))
+
+def validate_block(block) -> List[str]:
+    """Validate a block's alignment against its Index: line (see AlignmentTable.validate)."""
+    return block_alignment(block).validate(index_token_count(block.sentence_text))
+
+def scan_file_alignments(file_path: str, data=None) -> Dict[str, Any]:
+    """Scan one .umr file into a record of the alignment tables of its blocks, for AlignmentStore.build."""
+    blocks = []
+    for block in scan_umr_file(file_path, data):
+        table = block_alignment(block)
+        blocks.append({"index": block.index, "sent_id": block.sent_id or "",
+                       "nodes": table.nodes, "node_first": table.node_first, "spans": table.spans})
+    return {
+        "filename": logical_name(os.path.basename(file_path)),
+        "language": language_of(file_path),
+        "blocks": blocks,
+    }
+
+def _pack_strings(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack strings into (UTF-8 heap, offsets) arrays; string i is heap[offsets[i]:offsets[i + 1]]."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+class AlignmentStore:
+    """
+    The alignment tables of a corpus as flat arrays: blocks (with their file, block index and
+    sent_id), the nodes of every block and the spans of every node, each table a slice of them.
+    Block ids follow the corpus order of parse_umr_to_json.iter_umr_files.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.n_blocks = len(arrays["block_file"])
+        self._strings: Dict[str, List[str]] = {}
+        self._sent_ids: Optional[Dict[str, List[int]]] = None
+
+    @classmethod
+    def build(cls, records: Iterable[Dict[str, Any]]) -> 'AlignmentStore':
+        """Build a store from scan_file_alignments records."""
+        files, languages, block_file, block_index, sent_ids = [], [], [], [], []
+        nodes: List[str] = []
+        node_counts, span_counts, spans = [], [], []
+        for record in records:
+            file_id = len(files)
+            files.append(record["filename"])
+            languages.append(record["language"])
+            for block in record["blocks"]:
+                block_file.append(file_id)
+                block_index.append(block["index"])
+                sent_ids.append(block["sent_id"])
+                nodes.extend(block["nodes"])
+                node_counts.append(len(block["nodes"]))
+                span_counts.append(np.diff(block["node_first"]))
+                spans.append(block["spans"])
+
+        arrays = {
+            "block_file": np.array(block_file, dtype=np.int32),
+            "block_index": np.array(block_index, dtype=np.int32),
+            "block_node_first": np.concatenate([[0], np.cumsum(node_counts, dtype=np.int64)]),
+            "node_span_first": np.concatenate([[0], np.cumsum(np.concatenate(span_counts or [[]]), dtype=np.int64)]),
+            "spans": np.concatenate(spans) if spans else np.empty((0, 2), dtype=np.int32),
+        }
+        for name, strings in (("file", files), ("language", languages), ("sent_id", sent_ids), ("node", nodes)):
+            arrays[f"{name}_heap"], arrays[f"{name}_offsets"] = _pack_strings(strings)
+        return cls(arrays)
+
+    def save(self, path: str) -> None:
+        """Write the store as an uncompressed .npz file."""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **self.arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'AlignmentStore':
+        with np.load(path, allow_pickle=False) as npz:
+            return cls({name: npz[name] for name in npz.files})
+
+    def strings(self, name: str) -> List[str]:
+        """All strings of a packed column ('file', 'language', 'sent_id' or 'node'), decoded once."""
+        strings = self._strings.get(name)
+        if strings is None:
+            heap = self.arrays[f"{name}_heap"].tobytes()
+            offsets = self.arrays[f"{name}_offsets"].tolist()
+            strings = self._strings[name] = [heap[a:b].decode('utf-8') for a, b in zip(offsets, offsets[1:])]
+        return strings
+
+    def location(self, block_id: int) -> Dict[str, Any]:
+        """The language, file name, block index and sent_id of a block."""
+        file_id = int(self.arrays["block_file"][block_id])
+        return {
+            "language": self.strings("language")[file_id],
+            "filename": self.strings("file")[file_id],
+            "block_index": int(self.arrays["block_index"][block_id]),
+            "sent_id": self.strings("sent_id")[block_id],
+        }
+
+    def find(self, sent_id: str, language: Optional[str] = None) -> List[int]:
+        """The ids of the blocks with a sent_id (sent_ids repeat across files), optionally of one language."""
+        if self._sent_ids is None:
+            self._sent_ids = {}
+            for block_id, block_sent_id in enumerate(self.strings("sent_id")):
+                self._sent_ids.setdefault(block_sent_id, []).append(block_id)
+        block_ids = self._sent_ids.get(sent_id, [])
+        if language is not None:
+            block_ids = [block_id for block_id in block_ids if self.location(block_id)["language"] == language]
+        return block_ids
+
+    def table(self, block_id: int) -> AlignmentTable:
+        """The AlignmentTable of a block; its arrays are views into the store."""
+        first, last = self.arrays["block_node_first"][block_id:block_id + 2]
+        node_span_first = self.arrays["node_span_first"][first:last + 1]
+        spans = self.arrays["spans"][node_span_first[0]:node_span_first[-1]]
+        return AlignmentTable(self.strings("node")[first:last],
+                              (node_span_first - node_span_first[0]).astype(np.int32), spans)
+
+def iter_block_problems(file_paths: Iterable[str], jobs: int = 1,
+                        errors: Optional[List[Tuple[str, str]]] = None) -> Iterator[Tuple[str, str, str]]:
+    """Validate the alignment of every block and yield (file path, sent_id, message) for each problem."""
+    from parse_umr_to_json import iter_parsed_files
+    for record in iter_parsed_files(file_paths, jobs=jobs, errors=errors, parse_func=_scan_file_problems):
+        for sent_id, message in record["problems"]:
+            yield record["path"], sent_id, message
+
+def _scan_file_problems(file_path: str, data=None) -> Dict[str, Any]:
+    problems = [(block.sent_id or f"block {block.index}", message)
+                for block in scan_umr_file(file_path, data) for message in validate_block(block)]
+    return {"path": file_path, "problems": problems}
+
+def main():
+    from parse_umr_to_json import iter_umr_files, iter_parsed_files, report_errors
+
+    parser = argparse.ArgumentParser(description='Build, query or validate UMR alignment span tables')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    root_dir = os.path.dirname(DEFAULT_STORE_PATH)
+
+    build_parser = subparsers.add_parser('build', help='Parse every alignment section into an .npz store')
+    show_parser = subparsers.add_parser('show', help='Print the alignment table of the blocks with a sent_id')
+    show_parser.add_argument('sent_id', metavar='SENT_ID')
+    show_parser.add_argument('--language', type=str, help='Only show blocks of this language')
+    validate_parser = subparsers.add_parser('validate', help='Check every alignment against its Index: line')
+    for sub in (build_parser, validate_parser):
+        sub.add_argument('--root-dir', type=str, default=root_dir,
+                         help='Root directory containing language subdirectories (default: the script directory)')
+        sub.add_argument('--language', type=str, help='Only read this language')
+        sub.add_argument('--jobs', type=int, default=1,
+                         help='Number of worker processes; 0 uses all CPUs (default: 1)')
+    for sub in (build_parser, show_parser):
+        sub.add_argument('--store', type=str, default=DEFAULT_STORE_PATH,
+                         help=f'Alignment store path (default: {os.path.basename(DEFAULT_STORE_PATH)})')
+
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        store = AlignmentStore.load(args.store)
+        block_ids = store.find(args.sent_id, args.language)
+        if not block_ids:
+            print("No matching block found", file=sys.stderr)
+            sys.exit(1)
+        for block_id in block_ids:
+            location = store.location(block_id)
+            print(f"{location['language']}\t{location['filename']}\tblock {location['block_index']}")
+            table = store.table(block_id)
+            for i, node in enumerate(table.nodes):
+                spans = ','.join(f"{start}-{end}" for start, end in table.node_spans(i).tolist())
+                print(f"  {node}: {spans or '(unaligned)'}")
+        return
+
+    if args.jobs < 0:
+        parser.error("--jobs must be >= 0")
+    jobs = args.jobs or os.cpu_count() or 1
+    file_paths = iter_umr_files(os.path.abspath(args.root_dir), args.language)
+    errors = []
+
+    if args.command == 'build':
+        store = AlignmentStore.build(iter_parsed_files(file_paths, jobs=jobs, errors=errors,
+                                                       parse_func=scan_file_alignments))
+        store.save(args.store)
+        report_errors(errors, sys.stderr)
+        print(f"Stored {len(store.arrays['spans'])} spans of {len(store.strings('node'))} nodes "
+              f"in {store.n_blocks} blocks into {args.store}", file=sys.stderr)
+        return
+
+    n_problems = 0
+    for file_path, sent_id, message in iter_block_problems(file_paths, jobs=jobs, errors=errors):
+        print(f"{file_path}\t{sent_id}\t{message}")
+        n_problems += 1
+    report_errors(errors, sys.stderr)
+    print(f"{n_problems} alignment problems found", file=sys.stderr)
+    sys.exit(1 if n_problems or errors else 0)
+
+if __name__ == "__main__":
+    main()
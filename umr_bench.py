@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the parsing, statistics and export entry points.
+
+Each benchmark runs one entry point over a fixed subset of the corpus (kukama, english and a
+slice of czech) in a fresh worker process, and reports files/s, blocks/s, MB/s and the peak
+resident set size of that process. Results can be saved as JSON and compared with an earlier
+run, e.g. one from the previous commit:
+
+    python umr_bench.py run --output bench_before.json
+    python umr_bench.py run --compare bench_before.json
+
+For stress runs, `generate` writes a synthetic corpus that repeats every file up to 10 times:
+
+    python umr_bench.py generate --scale 10 --output /tmp/umr_x10
+    python umr_bench.py run --root-dir /tmp/umr_x10 --czech-files 2000
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import contextlib
+import resource
+import subprocess
+import multiprocessing
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from parse_umr_to_json import UMRDocument, parse_umr_file, filter_files, load_filtered_file, iter_umr_files
+from umr_stats import parse_blocks_from_file, analyze_block
+from umr_sources import UMR_SUFFIX, is_plain, language_of, logical_name, read_source, split_archive_path
+
+# Subset name -> (language directory, maximum number of files or None for all of them)
+SUBSETS = {
+    'kukama': ('kukama', None),
+    'english': ('english', None),
+    'czech': ('czech', 200),
+}
+
+MAX_SCALE = 10
+
+def bench_parse(file_paths: List[str]) -> None:
+    """parse_umr_file on every file."""
+    for file_path in file_paths:
+        parse_umr_file(file_path)
+
+def bench_parse_mmap(file_paths: List[str]) -> None:
+    """parse_umr_file over memory-mapped files."""
+    for file_path in file_paths:
+        parse_umr_file(file_path, use_mmap=True)
+
+def bench_stats(file_paths: List[str]) -> None:
+    """parse_blocks_from_file + analyze_block on every file, as statistics.py does."""
+    for file_path in file_paths:
+        for block in parse_blocks_from_file(file_path):
+            analyze_block(block, file_path)
+
+def bench_filter(file_paths: List[str]) -> None:
+    """The export filter path: lazy probes (load_filtered_file), then filter_files on the result."""
+    parsed_files = [parsed for parsed in (load_filtered_file(file_path, has_partial_conversion=False)
+                                          for file_path in file_paths) if parsed is not None]
+    filter_files(parsed_files, has_partial_conversion=False)
+
+def bench_json(file_paths: List[str]) -> Callable[[], None]:
+    """json.dump of the parsed files, as in the default export; parsing is not timed."""
+    parsed_files = [parse_umr_file(file_path) for file_path in file_paths]
+    return lambda: json.dump(parsed_files, io.StringIO())
+
+# Benchmark name -> function. A function that needs untimed set-up returns a callable,
+# and only the callable is timed.
+BENCHMARKS = {
+    'parse': bench_parse,
+    'parse_mmap': bench_parse_mmap,
+    'stats': bench_stats,
+    'filter': bench_filter,
+    'json': bench_json,
+}
+
+def subset_files(root_dir: str, subset: str, czech_files: Optional[int] = None) -> List[str]:
+    """The file paths of a subset, in corpus order."""
+    language, limit = SUBSETS[subset]
+    if subset == 'czech' and czech_files is not None:
+        limit = czech_files
+    file_paths = list(iter_umr_files(root_dir, language))
+    return file_paths if limit is None else file_paths[:limit]
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on Linux, bytes on macOS)."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+def run_benchmark(task: Tuple[str, List[str], int]) -> Dict[str, Any]:
+    """
+    Worker entry point: run one benchmark `repeat` times over the files and return the
+    best wall time together with the peak RSS of the worker.
+    Anything the entry point prints (e.g. analyze_block's DecodeError messages) is discarded.
+    """
+    name, file_paths, repeat = task
+    func = BENCHMARKS[name]
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            timed = func(file_paths)
+            if timed is not None:
+                start = time.perf_counter()
+                timed()
+            times.append(time.perf_counter() - start)
+    return {"seconds": min(times), "all_seconds": times, "peak_rss_mb": peak_rss_mb()}
+
+def count_blocks(file_paths: List[str]) -> int:
+    """Number of blocks with at least one annotation section, i.e. the blocks the JSON export holds."""
+    return sum(sum(1 for _ in UMRDocument(file_path).exported_blocks()) for file_path in file_paths)
+
+def count_bytes(file_paths: List[str]) -> int:
+    """
+    Size of the files as the entry points read them: compressed files and archive members
+    (see umr_sources) count with their decompressed size, which takes reading them.
+    """
+    return sum(os.path.getsize(file_path) if is_plain(file_path) else len(read_source(file_path))
+               for file_path in file_paths)
+
+def measure(name: str, subset: str, file_paths: List[str], n_blocks: int, n_bytes: int,
+            repeat: int) -> Dict[str, Any]:
+    """
+    Run a benchmark in a fresh process (so peak RSS is per benchmark) and derive the rates.
+    Rates are relative to the whole subset, whatever share of it the entry point had to read.
+    """
+    with multiprocessing.Pool(1) as pool:
+        result = pool.apply(run_benchmark, ((name, file_paths, repeat),))
+    seconds = result["seconds"] or 1e-9
+    return {
+        "benchmark": name,
+        "subset": subset,
+        "files": len(file_paths),
+        "blocks": n_blocks,
+        "bytes": n_bytes,
+        "seconds": round(result["seconds"], 6),
+        "all_seconds": [round(t, 6) for t in result["all_seconds"]],
+        "files_per_s": round(len(file_paths) / seconds, 2),
+        "blocks_per_s": round(n_blocks / seconds, 2),
+        "mb_per_s": round(n_bytes / (1024 * 1024) / seconds, 3),
+        "peak_rss_mb": round(result["peak_rss_mb"], 1),
+    }
+
+def git_commit(root_dir: str) -> Optional[str]:
+    """The current git commit of the repository holding this script, if any."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(root_dir: str, subsets: List[str], benchmarks: List[str], repeat: int = 3,
+              czech_files: Optional[int] = None) -> Dict[str, Any]:
+    """Run every benchmark on every subset and return the results with run metadata."""
+    results = []
+    for subset in subsets:
+        file_paths = subset_files(root_dir, subset, czech_files)
+        if not file_paths:
+            print(f"Skipping {subset}: no files under {root_dir}", file=sys.stderr)
+            continue
+        n_blocks = count_blocks(file_paths)
+        n_bytes = count_bytes(file_paths)
+        for name in benchmarks:
+            result = measure(name, subset, file_paths, n_blocks, n_bytes, repeat)
+            print(f"{name:>10} {subset:>8}: {result['files']:>5} files {result['seconds']:>8.3f}s "
+                  f"{result['files_per_s']:>9.1f} files/s {result['blocks_per_s']:>10.1f} blocks/s "
+                  f"{result['mb_per_s']:>7.2f} MB/s  peak RSS {result['peak_rss_mb']:.1f} MB",
+                  file=sys.stderr)
+            results.append(result)
+    return {
+        "commit": git_commit(os.path.dirname(os.path.abspath(__file__))),
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "root_dir": os.path.abspath(root_dir),
+        "repeat": repeat,
+        "results": results,
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print the speed-up of every benchmark relative to a baseline report (>1 means faster)."""
+    base = {(r["benchmark"], r["subset"]): r for r in baseline["results"]}
+    print(f"Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')}):", file=sys.stderr)
+    for result in report["results"]:
+        old = base.get((result["benchmark"], result["subset"]))
+        if old is None or old["files"] != result["files"]:
+            continue
+        speedup = old["seconds"] / (result["seconds"] or 1e-9)
+        rss_delta = result["peak_rss_mb"] - old["peak_rss_mb"]
+        print(f"{result['benchmark']:>10} {result['subset']:>8}: {old['seconds']:.3f}s -> {result['seconds']:.3f}s "
+              f"({speedup:.2f}x), peak RSS {rss_delta:+.1f} MB", file=sys.stderr)
+
+def generate_corpus(root_dir: str, output_dir: str, scale: int, languages: Optional[List[str]] = None) -> int:
+    """
+    Write a synthetic corpus to output_dir with the same <language>/umr_data layout, in which every
+    file of root_dir appears `scale` times (copy k of x.umr is x-k.umr). Compressed files and
+    archive members (see umr_sources) are written out as plain .umr copies of their content.
+    Returns the number of files.
+    """
+    n_files = 0
+    for file_path in iter_umr_files(root_dir):
+        language = language_of(file_path)
+        if languages and language not in languages:
+            continue
+        # Archive members are '/'-separated paths inside the archive, e.g. czech/umr_data/x.umr
+        member = split_archive_path(file_path)[1].replace('/', os.sep)
+        data_dir = os.path.basename(os.path.dirname(member))
+        target_dir = os.path.join(output_dir, language, data_dir)
+        os.makedirs(target_dir, exist_ok=True)
+        stem = logical_name(os.path.basename(member))[:-len(UMR_SUFFIX)]
+        data = None if is_plain(file_path) else read_source(file_path)
+        for copy in range(1, scale + 1):
+            # Copies keep the name order of their originals, so subsets slice the same files
+            target_path = os.path.join(target_dir, f"{stem}-{copy:02d}{UMR_SUFFIX}")
+            if data is None:
+                shutil.copyfile(file_path, target_path)
+            else:
+                with open(target_path, 'wb') as f:
+                    f.write(data)
+            n_files += 1
+    return n_files
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark UMR parsing, statistics and export throughput')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    default_root = os.path.dirname(os.path.abspath(__file__))
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('--root-dir', type=str, default=default_root,
+                            help='Root directory containing language subdirectories (default: the script directory)')
+    run_parser.add_argument('--subsets', nargs='+', choices=list(SUBSETS), default=list(SUBSETS),
+                            help='Corpus subsets to run on (default: all)')
+    run_parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                            help='Benchmarks to run (default: all)')
+    run_parser.add_argument('--czech-files', type=int, default=SUBSETS['czech'][1],
+                            help=f"Number of files in the czech slice (default: {SUBSETS['czech'][1]})")
+    run_parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per benchmark; the fastest is reported (default: 3)')
+    run_parser.add_argument('--output', type=str, help='Save the results to this JSON file')
+    run_parser.add_argument('--compare', type=str, metavar='BASELINE',
+                            help='Compare with results saved by an earlier run')
+
+    generate_parser = subparsers.add_parser('generate', help='Write a scaled-up synthetic corpus')
+    generate_parser.add_argument('--root-dir', type=str, default=default_root,
+                                 help='Corpus to scale up (default: the script directory)')
+    generate_parser.add_argument('--output', type=str, required=True, help='Directory to write the corpus to')
+    generate_parser.add_argument('--scale', type=int, default=MAX_SCALE,
+                                 help=f'Number of copies of every file, 1 to {MAX_SCALE} (default: {MAX_SCALE})')
+    generate_parser.add_argument('--languages', nargs='+',
+                                 help='Only scale up these languages (default: all)')
+
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        if not 1 <= args.scale <= MAX_SCALE:
+            parser.error(f"--scale must be between 1 and {MAX_SCALE}")
+        if os.path.abspath(args.output) == os.path.abspath(args.root_dir):
+            parser.error("--output must differ from --root-dir")
+        n_files = generate_corpus(args.root_dir, args.output, args.scale, args.languages)
+        print(f"Wrote {n_files} files to {args.output}", file=sys.stderr)
+        return
+
+    if args.repeat < 1:
+        parser.error("--repeat must be >= 1")
+    if args.czech_files is not None and args.czech_files < 1:
+        parser.error("--czech-files must be >= 1")
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = run_suite(args.root_dir, args.subsets, args.benchmarks, repeat=args.repeat,
+                       czech_files=args.czech_files)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    if baseline is not None:
+        compare(report, baseline)
+
+if __name__ == "__main__":
+    main()
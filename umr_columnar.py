@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Columnar exports (Parquet and Arrow IPC) with one row per block, for training pipelines.
+
+`parse_umr_to_json.py --format parquet` (or `--format arrow`) streams the parsed files into a
+table with these columns:
+
+    language, filename        the file of the block (dictionary-encoded with --dictionary)
+    block_index               position of the block among the exported blocks of its file
+    sent_id, meta_info        the meta-info line and the sent_id in it (null if it has none)
+    partial_conversion        meta-info has type = partial_conversion
+    words                     the tokens of the Words: line (list<string>)
+    sentence_info             every sentence information line, as in the JSON (map<string, string>)
+    sentence_annotation       the sentence level graph
+    alignment                 the alignment section
+    document_annotation       the document level graph
+    has_document_annotation   as in the JSON (null for blocks without a document section)
+    doc_temporal, doc_modal, doc_coref   document relations per type (see umr_graph.count_doc_relations)
+    doc_other                 document relations under any other group (null for blocks without a document section)
+
+Blocks are buffered and written one row group (Parquet) or record batch (Arrow) of at most
+`row_group_size` blocks at a time, so memory stays bounded whatever the size of the corpus.
+Readers then load only the columns and row groups they need, memory-mapped:
+
+    import pyarrow.parquet as pq
+    table = pq.read_table('umr_blocks.parquet', columns=['sent_id', 'words', 'sentence_annotation'],
+                          filters=[('language', '=', 'english')], memory_map=True)
+
+    import pyarrow as pa
+    with pa.memory_map('umr_blocks.arrow') as source:
+        table = pa.ipc.open_file(source).read_all()   # zero-copy
+
+Requires the optional `pyarrow` package.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+from umr_scanner import SENT_ID_RE
+from umr_graph import DOC_RELATION_TYPES
+
+DEFAULT_ROW_GROUP_SIZE = 16384
+
+# Columns that --dictionary encodes: few distinct values, repeated on every block of a file
+DICTIONARY_COLUMNS = ('language', 'filename')
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("columnar exports require the pyarrow package (pip install pyarrow)") from None
+    return pyarrow
+
+def block_schema(dictionary: bool = False):
+    """The Arrow schema of the block table; with `dictionary`, DICTIONARY_COLUMNS are dictionary-encoded."""
+    pa = _pyarrow()
+    name_type = pa.dictionary(pa.int32(), pa.string()) if dictionary else pa.string()
+    return pa.schema([
+        ('language', name_type),
+        ('filename', name_type),
+        ('block_index', pa.int32()),
+        ('sent_id', pa.string()),
+        ('meta_info', pa.string()),
+        ('partial_conversion', pa.bool_()),
+        ('words', pa.list_(pa.string())),
+        ('sentence_info', pa.map_(pa.string(), pa.string())),
+        ('sentence_annotation', pa.string()),
+        ('alignment', pa.string()),
+        ('document_annotation', pa.string()),
+        ('has_document_annotation', pa.bool_()),
+        ('doc_temporal', pa.int32()),
+        ('doc_modal', pa.int32()),
+        ('doc_coref', pa.int32()),
+        ('doc_other', pa.int32()),
+    ])
+
+def block_row(parsed_file: Dict[str, Any], block_index: int, block: Dict[str, Any]) -> Dict[str, Any]:
+    """The table row of one block of a parsed file (see parse_umr_to_json.block_to_dict)."""
+    meta_info = block["meta_info"]
+    sent_id = SENT_ID_RE.search(meta_info)
+    sentence_info = block["sentence_info"]
+    doc_counts = block.get("document_relation_counts") or {}
+    return {
+        "language": parsed_file["language"],
+        "filename": parsed_file["filename"],
+        "block_index": block_index,
+        "sent_id": sent_id.group(1) if sent_id else None,
+        "meta_info": meta_info,
+        "partial_conversion": "type = partial_conversion" in meta_info,
+        "words": sentence_info.get("Words", "").split(),
+        "sentence_info": list(sentence_info.items()),
+        "sentence_annotation": block["sentence_annotation"],
+        "alignment": block["alignment"],
+        "document_annotation": block["document_annotation"],
+        "has_document_annotation": block.get("has_document_annotation"),
+        "doc_temporal": doc_counts.get("temporal"),
+        "doc_modal": doc_counts.get("modal"),
+        "doc_coref": doc_counts.get("coref"),
+        # Relations under any other group ('other', or a group name outside DOC_RELATION_TYPES)
+        "doc_other": sum(n for relation_type, n in doc_counts.items() if relation_type not in DOC_RELATION_TYPES)
+                     if doc_counts else None,
+    }
+
+class ColumnarWriter:
+    """
+    Write block rows to a Parquet or Arrow IPC file, one row group (record batch) of at most
+    `row_group_size` blocks at a time. Use as a context manager, or call close().
+    """
+
+    def __init__(self, output_path: str, output_format: str = 'parquet',
+                 row_group_size: int = DEFAULT_ROW_GROUP_SIZE, dictionary: bool = False):
+        if output_format not in ('parquet', 'arrow'):
+            raise ValueError(f"unknown columnar format {output_format!r}, expected 'parquet' or 'arrow'")
+        if row_group_size < 1:
+            raise ValueError("row_group_size must be >= 1")
+        pa = _pyarrow()
+        self.output_path = output_path
+        self.row_group_size = row_group_size
+        self.schema = block_schema(dictionary)
+        self.n_rows = 0
+        self.n_row_groups = 0
+        self._columns: Dict[str, List[Any]] = {name: [] for name in self.schema.names}
+        self._buffered = 0
+        self._tmp_path = f"{output_path}.tmp"
+        if output_format == 'parquet':
+            # Dictionary pages for the repeated name columns only; free text compresses better plain
+            use_dictionary = list(DICTIONARY_COLUMNS) if dictionary else False
+            self._writer = pa.parquet.ParquetWriter(self._tmp_path, self.schema, use_dictionary=use_dictionary)
+        else:
+            # Dictionaries grow as new files come in; the file format accepts deltas, not replacements
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self._writer = pa.ipc.new_file(self._tmp_path, self.schema, options=options)
+        self._dictionaries = {name: {} for name in DICTIONARY_COLUMNS} if dictionary else None
+
+    def __enter__(self) -> 'ColumnarWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._writer.close()
+            os.remove(self._tmp_path)
+
+    def add_file(self, parsed_file: Dict[str, Any]) -> int:
+        """Buffer the blocks of a parsed file, writing full row groups; returns the number of blocks."""
+        for block_index, block in enumerate(parsed_file["blocks"]):
+            for name, value in block_row(parsed_file, block_index, block).items():
+                self._columns[name].append(value)
+            self._buffered += 1
+            if self._buffered >= self.row_group_size:
+                self.flush()
+        return len(parsed_file["blocks"])
+
+    def flush(self) -> None:
+        """Write the buffered blocks as one row group (record batch)."""
+        if not self._buffered:
+            return
+        pa = _pyarrow()
+        arrays = []
+        for field in self.schema:
+            values = self._columns[field.name]
+            if self._dictionaries is not None and field.name in self._dictionaries:
+                arrays.append(self._dictionary_array(field.name, values))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if isinstance(self._writer, pa.parquet.ParquetWriter):
+            self._writer.write_batch(batch, row_group_size=self._buffered)
+        else:
+            self._writer.write_batch(batch)
+        self.n_rows += self._buffered
+        self.n_row_groups += 1
+        self._columns = {name: [] for name in self.schema.names}
+        self._buffered = 0
+
+    def _dictionary_array(self, name: str, values: List[str]):
+        """
+        A dictionary array over all values seen so far in the column, so every batch's dictionary
+        extends the previous one (an Arrow IPC delta) and the codes agree across row groups.
+        """
+        pa = _pyarrow()
+        codes = self._dictionaries[name]
+        indices = [codes.setdefault(value, len(codes)) for value in values]
+        return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()),
+                                              pa.array(list(codes), type=pa.string()))
+
+    def close(self) -> None:
+        """Write the last row group and move the finished file into place."""
+        self.flush()
+        self._writer.close()
+        os.replace(self._tmp_path, self.output_path)
+
+def write_columnar(parsed_files: Iterable[Dict[str, Any]], output_path: str, output_format: str = 'parquet',
+                   row_group_size: int = DEFAULT_ROW_GROUP_SIZE, dictionary: bool = False) -> Tuple[int, int, int]:
+    """
+    Stream parsed files (see parse_umr_to_json.iter_parsed_files) into a Parquet or Arrow file.
+    Returns (number of files, number of blocks, number of row groups).
+    """
+    n_files = 0
+    with ColumnarWriter(output_path, output_format, row_group_size, dictionary) as writer:
+        for parsed_file in parsed_files:
+            writer.add_file(parsed_file)
+            n_files += 1
+    return n_files, writer.n_rows, writer.n_row_groups
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Lightweight PENMAN helpers for UMR sentence graphs (and the relations of document-level graphs).
+
+count_graph_triples tokenizes a graph with the same token patterns as penman and counts
+instance and relation triples directly, without building a penman Graph. Anything the
+tokenizer does not accept as a well-formed graph (missing concept or target, unbalanced
+parentheses, trailing tokens, ...) is reported as malformed so that callers can fall back
+to penman, which has its own recovery rules for such input.
+
+Run this file directly to check the fast counter against penman over the whole corpus:
+
+    python umr_graph.py --root-dir .
+"""
+import os
+import re
+import sys
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+# Token patterns, in the same order of precedence as penman's lexer.
+# penman lexes line by line, so strings never span lines here either.
+_TOKEN_RE = re.compile(r'''
+    (?P<COMMENT>\#.*$)
+   |(?P<STRING>"[^"\\\n]*(?:\\.[^"\\\n]*)*")
+   |(?P<LPAREN>\()
+   |(?P<RPAREN>\))
+   |(?P<SLASH>/)
+   |(?P<ROLE>:[^ \t\r\n\v\f"()/:~]*)
+   |(?P<SYMBOL>[^ \t\r\n\v\f"()/:~]+)
+   |(?P<ALIGNMENT>~(?:[a-z]\.?)?[0-9]+(?:,[0-9]+)*)
+   |(?P<UNEXPECTED>[^ \t\r\n\v\f])
+''', re.VERBOSE | re.MULTILINE)
+
+# Czech graphs have placeholder nodes like (s234x21 / /) that penman cannot read
+_EMPTY_CONCEPT_RE = re.compile(r"\((s\d+x\d+) / /\)")
+
+# Relation groups of a document-level graph: '(s1s0 / sentence :temporal (...) :modal (...) :coref (...))'
+DOC_RELATION_TYPES = ('temporal', 'modal', 'coref')
+
+# A group role followed by its list of relations (or a single relation), or a '(head :relation tail)' relation
+_DOC_TOKEN_RE = re.compile(r'''
+    :(?P<group>[^\s()/:~"]+)(?=\s*\()
+   |\(\s*(?P<head>[^\s()/:]+)\s*(?P<relation>:[^\s()]+)\s+(?P<tail>[^\s()]+)\s*\)
+''', re.VERBOSE)
+
+# Parser states
+_VAR, _SLASH, _CONCEPT, _EDGES, _TARGET = range(5)
+
+def clean_graph_text(graph_text: str) -> str:
+    """Apply the corpus-specific clean-up needed before a UMR sentence graph can be read as PENMAN."""
+    if '#' in graph_text:
+        graph_text = graph_text.replace("#", "")  # czech has concepts starts with #
+    if '/ /)' in graph_text:
+        graph_text = _EMPTY_CONCEPT_RE.sub(r"\1", graph_text)  # czech has nodes like (s234x21 / /)
+    return graph_text
+
+def count_graph_triples(graph_text: str) -> Optional[Tuple[int, int]]:
+    """
+    Count the triples of a cleaned PENMAN graph (see clean_graph_text).
+    Returns (concepts_count, relations_count), i.e. the number of ':instance' and of other triples
+    penman.decode would produce, or None if the graph is malformed.
+    """
+    concepts = 0
+    relations = 0
+    depth = 0
+    state = None
+
+    for match in _TOKEN_RE.finditer(graph_text):
+        kind = match.lastgroup
+
+        if state is None:
+            # Only the first top-level node is read; leading comments are allowed
+            if kind == 'COMMENT' and depth == 0 and concepts == 0:
+                continue
+            if kind != 'LPAREN' or concepts:
+                return None
+            concepts += 1
+            depth = 1
+            state = _VAR
+        elif state == _EDGES:
+            if kind == 'ROLE':
+                relations += 1
+                state = _TARGET
+            elif kind == 'RPAREN':
+                depth -= 1
+                if depth == 0:
+                    state = None
+            elif kind != 'ALIGNMENT':
+                return None
+        elif state == _TARGET:
+            if kind == 'SYMBOL' or kind == 'STRING':
+                state = _EDGES
+            elif kind == 'LPAREN':
+                concepts += 1
+                depth += 1
+                state = _VAR
+            elif kind != 'ALIGNMENT':
+                return None
+        elif state == _VAR:
+            if kind != 'SYMBOL':
+                return None
+            state = _SLASH
+        elif state == _SLASH:
+            if kind == 'SLASH':
+                state = _CONCEPT
+            elif kind == 'ROLE':
+                relations += 1
+                state = _TARGET
+            elif kind == 'RPAREN':
+                depth -= 1
+                state = None if depth == 0 else _EDGES
+            else:
+                return None
+        else:  # _CONCEPT
+            if kind != 'SYMBOL' and kind != 'STRING':
+                return None
+            state = _EDGES
+
+    if depth != 0 or concepts == 0:
+        return None
+    return concepts, relations
+
+def graph_branches(graph_text: str) -> Optional[List[Tuple[str, str, str]]]:
+    """
+    List the branches of a cleaned PENMAN graph as written, in document order: (variable, '/',
+    concept) for every node and (variable, role, target) for every edge or attribute, where the
+    target of an edge to a new node is that node's variable. Roles are kept as written (':ARG0-of'
+    is not inverted) and alignments are dropped. Returns None if the graph is malformed (see
+    count_graph_triples); penman.parse then gives the same branches, if it can read the graph.
+    """
+    branches: List[Tuple[str, str, str]] = []
+    stack: List[str] = []
+    nodes = 0
+    role = None
+    state = None
+
+    for match in _TOKEN_RE.finditer(graph_text):
+        kind = match.lastgroup
+        token = match.group()
+
+        if state is None:
+            if kind == 'COMMENT' and nodes == 0:
+                continue
+            if kind != 'LPAREN' or nodes:
+                return None
+            state = _VAR
+        elif state == _EDGES:
+            if kind == 'ROLE':
+                role = token
+                state = _TARGET
+            elif kind == 'RPAREN':
+                stack.pop()
+                if not stack:
+                    state = None
+            elif kind != 'ALIGNMENT':
+                return None
+        elif state == _TARGET:
+            if kind == 'SYMBOL' or kind == 'STRING':
+                branches.append((stack[-1], role, token))
+                state = _EDGES
+            elif kind == 'LPAREN':
+                state = _VAR
+            elif kind != 'ALIGNMENT':
+                return None
+        elif state == _VAR:
+            if kind != 'SYMBOL':
+                return None
+            if stack:
+                branches.append((stack[-1], role, token))
+            stack.append(token)
+            nodes += 1
+            state = _SLASH
+        elif state == _SLASH:
+            if kind == 'SLASH':
+                state = _CONCEPT
+            elif kind == 'ROLE':
+                role = token
+                state = _TARGET
+            elif kind == 'RPAREN':
+                stack.pop()
+                state = None if not stack else _EDGES
+            else:
+                return None
+        else:  # _CONCEPT
+            if kind != 'SYMBOL' and kind != 'STRING':
+                return None
+            branches.append((stack[-1], '/', token))
+            state = _EDGES
+
+    if stack or nodes == 0:
+        return None
+    return branches
+
+def lenient_graph_branches(graph_text: str) -> List[Tuple[str, str, Optional[str]]]:
+    """
+    Best-effort graph_branches for graphs it finds malformed (and that penman may not read either):
+    every '(' and symbol opens a node, a symbol or string after '/' is its concept, and a role
+    branches to the following symbol, string or node; a role without a target gets None.
+    Unbalanced parentheses, stray slashes and trailing tokens are skipped.
+    """
+    branches: List[Tuple[str, str, Optional[str]]] = []
+    stack: List[str] = []
+    role = None
+    previous = None
+
+    for match in _TOKEN_RE.finditer(graph_text):
+        kind = match.lastgroup
+        token = match.group()
+        if kind == 'COMMENT' or kind == 'ALIGNMENT':
+            continue
+        if previous == 'ROLE' and kind in ('ROLE', 'RPAREN') and stack:
+            branches.append((stack[-1], role, None))
+        if kind == 'SYMBOL' and previous == 'LPAREN':
+            if stack and role is not None:
+                branches.append((stack[-1], role, token))
+            stack.append(token)
+            role = None
+        elif (kind == 'SYMBOL' or kind == 'STRING') and stack:
+            if previous == 'SLASH':
+                branches.append((stack[-1], '/', token))
+            elif previous == 'ROLE':
+                branches.append((stack[-1], role, token))
+                role = None
+        elif kind == 'ROLE':
+            role = token
+        elif kind == 'RPAREN' and stack:
+            stack.pop()
+            role = None
+        previous = kind
+    if previous == 'ROLE' and stack:
+        branches.append((stack[-1], role, None))
+    return branches
+
+def doc_graph_triples(doc_text: str) -> List[Tuple[str, str, str, str]]:
+    """
+    Read the relations of a document-level graph in one regex pass, as (type, head, relation, tail)
+    tuples in document order: '(s1s0 / sentence :temporal ((document-creation-time :before s1l)))'
+    gives ('temporal', 'document-creation-time', ':before', 's1l'). The type is the group role the
+    relation is listed under (see DOC_RELATION_TYPES), or 'other' if it is not under one.
+    """
+    triples = []
+    relation_type = 'other'
+    for match in _DOC_TOKEN_RE.finditer(doc_text):
+        group = match.group('group')
+        if group is not None:
+            relation_type = group
+        else:
+            triples.append((relation_type, match.group('head'), match.group('relation'), match.group('tail')))
+    return triples
+
+def count_doc_relations(doc_text: Optional[str]) -> Dict[str, int]:
+    """The number of document-level relations per type: {'temporal': n, 'modal': n, 'coref': n, ...}."""
+    counts = dict.fromkeys(DOC_RELATION_TYPES, 0)
+    if doc_text:
+        for relation_type, _, _, _ in doc_graph_triples(doc_text):
+            counts[relation_type] = counts.get(relation_type, 0) + 1
+    return counts
+
+def count_graph_triples_penman(graph_text: str) -> Tuple[int, int]:
+    """
+    Count the triples of a cleaned PENMAN graph with penman.decode.
+    Raises penman's DecodeError if the graph cannot be decoded.
+    """
+    import penman
+    triples = penman.decode(graph_text).triples
+    concepts = sum(1 for triple in triples if triple[1] == ':instance')
+    return concepts, len(triples) - concepts
+
+def validate_corpus(root_dir: str) -> int:
+    """
+    Compare count_graph_triples with penman for every sentence graph under root_dir.
+    Prints every mismatch and returns the number of mismatches.
+    """
+    import logging
+    from penman.exceptions import DecodeError
+    from umr_scanner import scan_umr_file
+
+    logging.getLogger('penman').setLevel(logging.ERROR)
+    graphs = fallbacks = mismatches = 0
+    for lang in sorted(os.listdir(root_dir)):
+        data_dir = os.path.join(root_dir, lang, 'umr_data')
+        if not os.path.isdir(data_dir):
+            continue
+        for fname in sorted(os.listdir(data_dir)):
+            if not fname.endswith('.umr'):
+                continue
+            file_path = os.path.join(data_dir, fname)
+            for block in scan_umr_file(file_path):
+                graph_text = block.section_text('sentence_graph')
+                if not graph_text:
+                    continue
+                graphs += 1
+                graph_text = clean_graph_text(graph_text)
+                fast = count_graph_triples(graph_text)
+                if fast is None:
+                    fallbacks += 1
+                    continue
+                try:
+                    expected = count_graph_triples_penman(graph_text)
+                except DecodeError:
+                    expected = None
+                if fast != expected:
+                    mismatches += 1
+                    print(f"{file_path} block {block.index}: fast={fast} penman={expected}")
+    print(f"{graphs} graphs checked, {fallbacks} left to penman as malformed, {mismatches} mismatches")
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the fast PENMAN triple counter against penman')
+    parser.add_argument('--root-dir', type=str, default=os.path.dirname(os.path.abspath(__file__)),
+                        help='Root directory containing language subdirectories (default: the script directory)')
+    args = parser.parse_args()
+    sys.exit(1 if validate_corpus(args.root_dir) else 0)
+
+if __name__ == "__main__":
+    main()
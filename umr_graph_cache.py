@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Cache of decoded PENMAN graphs, so that repeated analyses, notebook sessions and review tools
+do not re-decode the same sentence graphs.
+
+Graphs are keyed by (file, block index, content hash): the hash is a SHA-1 of the graph text
+that is decoded, so an edited graph is never served from the cache even if its file and block
+index are unchanged. There are two tiers:
+
+  - an in-memory LRU of at most `maxsize` graphs, and
+  - an optional on-disk tier (`cache_dir`), one pickled penman.Graph per key, which outlives
+    the process and is shared by worker processes.
+
+    from umr_graph_cache import GraphCache
+
+    cache = GraphCache(maxsize=4096, cache_dir='.umr_graph_cache')
+    graph = cache.decode('english/umr_data/english_umr-0001.umr', 0, graph_text)
+    cache.info()   # CacheInfo(hits=..., disk_hits=..., misses=..., maxsize=4096, currsize=...)
+"""
+import os
+import pickle
+import hashlib
+from collections import OrderedDict, namedtuple
+from typing import Any, Optional, Tuple
+
+from umr_graph import clean_graph_text
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'disk_hits', 'misses', 'maxsize', 'currsize'])
+
+# Bump whenever the pickled representation changes, so old disk entries are ignored
+DISK_FORMAT_VERSION = 1
+
+def content_hash(graph_text: str) -> str:
+    """SHA-1 of a graph text, the content part of a cache key."""
+    return hashlib.sha1(graph_text.encode('utf-8')).hexdigest()
+
+class GraphCache:
+    """Two-tier (memory LRU + optional disk) cache of penman.Graph objects."""
+
+    def __init__(self, maxsize: int = 1024, cache_dir: Optional[str] = None):
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0")
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._graphs: 'OrderedDict[Tuple[str, int, str], Any]' = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, file_path: str, block_index: int, graph_text: str) -> Tuple[str, int, str]:
+        """The cache key of a graph: (absolute file path, block index, content hash)."""
+        return os.path.abspath(file_path), block_index, content_hash(graph_text)
+
+    def decode(self, file_path: str, block_index: int, graph_text: str):
+        """
+        Return the penman.Graph for a (cleaned) graph text, decoding it only on a cache miss.
+        Raises penman's DecodeError if the graph cannot be decoded; failures are not cached.
+        """
+        key = self.key(file_path, block_index, graph_text)
+        graph = self._graphs.get(key)
+        if graph is not None:
+            self._graphs.move_to_end(key)
+            self.hits += 1
+            return graph
+
+        graph = self._load(key)
+        if graph is not None:
+            self.disk_hits += 1
+        else:
+            import penman
+            graph = penman.decode(graph_text)
+            self.misses += 1
+            self._store(key, graph)
+        self._remember(key, graph)
+        return graph
+
+    def decode_block(self, file_path: str, block):
+        """
+        Return the decoded sentence graph of a UMRBlock or LazyBlock, after the same clean-up
+        statistics.py applies (see umr_graph.clean_graph_text), or None if the block has no graph.
+        """
+        graph_text = block.section_text('sentence_graph')
+        if not graph_text:
+            return None
+        return self.decode(file_path, block.index, clean_graph_text(graph_text))
+
+    def info(self) -> CacheInfo:
+        """Hit/miss counters, in the spirit of functools.lru_cache's cache_info()."""
+        return CacheInfo(self.hits, self.disk_hits, self.misses, self.maxsize, len(self._graphs))
+
+    def clear(self) -> None:
+        """Empty the in-memory tier and reset the counters; the disk tier is kept."""
+        self._graphs.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def _remember(self, key: Tuple[str, int, str], graph) -> None:
+        if self.maxsize == 0:
+            return
+        self._graphs[key] = graph
+        if len(self._graphs) > self.maxsize:
+            self._graphs.popitem(last=False)
+
+    def _disk_path(self, key: Tuple[str, int, str]) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        name = hashlib.sha1(f"{key[0]}\0{key[1]}\0{key[2]}".encode('utf-8')).hexdigest()
+        # Two-level layout keeps directories small on large corpora
+        return os.path.join(self.cache_dir, name[:2], name + '.pickle')
+
+    def _load(self, key: Tuple[str, int, str]):
+        path = self._disk_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                version, stored_key, graph = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return None
+        # The file name is a hash of the key; the stored key guards against collisions
+        if version != DISK_FORMAT_VERSION or tuple(stored_key) != key:
+            return None
+        return graph
+
+    def _store(self, key: Tuple[str, int, str], graph) -> None:
+        path = self._disk_path(key)
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a per-process temporary file first, so concurrent workers never see a partial pickle
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((DISK_FORMAT_VERSION, key, graph), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+_default_cache: Optional[GraphCache] = None
+
+def default_graph_cache() -> GraphCache:
+    """The process-wide in-memory cache used when no cache is passed explicitly."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GraphCache()
+    return _default_cache
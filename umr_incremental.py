@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Incremental JSON and JSON Lines exports.
+
+`parse_umr_to_json.py --incremental` keeps a manifest next to the output (`<output>.manifest.json`
+by default). For every source file, the manifest records the file's signature (mtime, size and
+SHA-1 of its content) and the byte range of its output in the export: one element of the JSON
+array, or its JSON Lines. Files that are filtered out have no range. The next run checks every
+file against its signature:
+
+  - mtime and size unchanged: the file is reused as is;
+  - mtime or size changed but the content hash is the same (a touched file): reused as well;
+  - otherwise, and for files that are new: the file is re-parsed.
+
+The new output is then assembled in corpus order. It copies the byte ranges of the reused files
+from the previous export and writes the re-parsed files in between. Files that were removed are
+dropped, so the result is byte-identical to a full export with the same options. Only
+the changed files are parsed; the rest of the export is a sequential copy.
+
+The manifest also records the export options and the size and mtime of the output. If they do
+not match (other filters or format, an output that was edited or replaced, or a newer
+EXPORT_VERSION), every file is re-parsed.
+"""
+import os
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from umr_sources import archive_of, file_sha1
+
+# Bump whenever the exported JSON changes (see parse_umr_to_json.block_to_dict), so that
+# outputs written by an older version are re-parsed instead of reused
+EXPORT_VERSION = 1
+
+# Opening, separator and closing bytes of an export, and the export of no files, per layout (see export_layout)
+_LAYOUTS = {
+    'json': (b'[', b', ', b']', b'[]'),
+    'pretty': (b'[\n', b',\n', b'\n]', b'[]'),
+    'jsonl': (b'', b'', b'', b''),
+}
+
+def default_manifest_path(output_path: str) -> str:
+    """Where the manifest of an incremental export is kept by default."""
+    return f"{output_path}.manifest.json"
+
+def export_layout(output_format: str, pretty: bool = False) -> str:
+    """The layout of an export: 'json' (one line), 'pretty' (indented JSON) or 'jsonl'."""
+    if output_format == 'jsonl':
+        return 'jsonl'
+    return 'pretty' if pretty else 'json'
+
+def render_json_item(parsed_file: Dict[str, Any], pretty: bool = False) -> str:
+    """A parsed file as an element of the exported JSON array, exactly as json.dump writes it."""
+    if not pretty:
+        return json.dumps(parsed_file)
+    # JSON strings never hold a raw newline, so every line can be indented by one level
+    return '  ' + json.dumps(parsed_file, indent=2).replace('\n', '\n  ')
+
+def source_signature(file_path: str) -> Dict[str, int]:
+    """mtime and size of a source file; archive members are signed with their archive."""
+    st = os.stat(archive_of(file_path) or file_path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+def source_sha1(file_path: str, signature: Dict[str, int]) -> str:
+    """SHA-1 of a source file (or of its archive), hashed once per signature."""
+    return file_sha1(archive_of(file_path) or file_path, signature["mtime_ns"], signature["size"])
+
+def _output_signature(output_path: str) -> Optional[Dict[str, int]]:
+    try:
+        st = os.stat(output_path)
+    except OSError:
+        return None
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+def load_manifest(manifest_path: str, output_path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Load the manifest of a previous export, or return an empty one if it is missing, unreadable,
+    written for other options or by another EXPORT_VERSION, or if the output changed since.
+    """
+    empty = {"version": EXPORT_VERSION, "options": options, "files": {}}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if manifest.get("version") != EXPORT_VERSION or manifest.get("options") != options:
+        return empty
+    if manifest.get("output") != _output_signature(output_path):
+        return empty
+    return manifest
+
+def plan_export(file_paths: Iterable[str], manifest: Dict[str, Any]) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[str], int]:
+    """
+    Check every file against the manifest. Returns (entries, changed, removed): entries are
+    (path, manifest entry) pairs in corpus order, where the entry of a file that has to be
+    re-parsed holds only its new signature; `changed` lists those files, and `removed` is the
+    number of manifest files that no longer exist.
+    """
+    previous = manifest.get("files", {})
+    entries, changed = [], []
+    seen = 0
+    for file_path in file_paths:
+        key = os.path.abspath(file_path)
+        signature = source_signature(file_path)
+        entry = previous.get(key)
+        if entry is not None:
+            seen += 1
+            if entry["mtime_ns"] == signature["mtime_ns"] and entry["size"] == signature["size"]:
+                entries.append((file_path, entry))
+                continue
+        signature["sha1"] = source_sha1(file_path, signature)
+        if entry is not None and entry.get("sha1") == signature["sha1"]:
+            entries.append((file_path, dict(entry, **signature)))
+            continue
+        entries.append((file_path, signature))
+        changed.append(file_path)
+    return entries, changed, len(previous) - seen
+
+def write_export(entries: List[Tuple[str, Dict[str, Any]]], rendered: Iterable[Dict[str, Any]],
+                 output_path: str, manifest_path: str, layout: str,
+                 options: Dict[str, Any]) -> Tuple[int, List[str]]:
+    """
+    Assemble the export from the reused byte ranges of the previous output and the `rendered`
+    re-parsed files, in the order of `entries` (see plan_export), then write the new manifest.
+    `rendered` yields {"path", "text"} for the changed files, in the same order; "text" is the
+    file's output (see render_json_item), or None if the file is filtered out. Changed files
+    that are missing from `rendered` failed to parse: they are left out of the export and of
+    the manifest, so the next run tries them again.
+    Returns (number of files written, paths of the changed files that were left out).
+    """
+    opening, separator, closing, empty = _LAYOUTS[layout]
+    rendered = iter(rendered)
+    pending = next(rendered, None)
+    files: Dict[str, Dict[str, Any]] = {}
+    failed = []
+    written = 0
+
+    tmp_path = f"{output_path}.tmp"
+    previous = open(output_path, 'rb') if os.path.exists(output_path) else None
+    try:
+        with open(tmp_path, 'wb') as out:
+            for file_path, entry in entries:
+                if _is_reused(entry):
+                    text = None
+                    if entry["offset"] is not None:
+                        previous.seek(entry["offset"])
+                        text = previous.read(entry["length"])
+                else:
+                    if pending is None or pending["path"] != file_path:
+                        failed.append(file_path)
+                        continue
+                    text = pending["text"].encode('utf-8') if pending["text"] is not None else None
+                    pending = next(rendered, None)
+                record = {"mtime_ns": entry["mtime_ns"], "size": entry["size"], "sha1": entry.get("sha1"),
+                          "offset": None, "length": 0}
+                if text is not None:
+                    out.write(separator if written else opening)
+                    record["offset"] = out.tell()
+                    record["length"] = len(text)
+                    out.write(text)
+                    written += 1
+                files[os.path.abspath(file_path)] = record
+            out.write(closing if written else empty)
+    finally:
+        if previous is not None:
+            previous.close()
+    os.replace(tmp_path, output_path)
+
+    manifest = {"version": EXPORT_VERSION, "options": options,
+                "output": _output_signature(output_path), "files": files}
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(tmp_path, manifest_path)
+    return written, failed
+
+def _is_reused(entry: Dict[str, Any]) -> bool:
+    """True for manifest entries carried over from the previous export (they know their byte range)."""
+    return "offset" in entry
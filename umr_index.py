@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Random-access block index: fetch a single block by sent_id (or by file and snt number)
+without scanning the corpus.
+
+The index is a corpus snapshot (see umr_snapshot.py): for every block it records the file,
+the byte offset and length of the block, its sent_id and snt number, plus a sent_id-sorted
+permutation that is binary-searched straight from the memory-mapped file. A lookup then
+seeks to the block in its source file and scans only that block.
+
+    python umr_index.py build
+    python umr_index.py lookup DF-225-195986-849_0285.2
+    python umr_index.py lookup u_tree-cs-s2-root --language czech --file czech_umr-0001.umr
+    python umr_index.py lookup --file english_umr-0001.umr --snt 2
+"""
+import os
+import sys
+import json
+import argparse
+from typing import Any, Dict, List, Optional
+
+from umr_scanner import UMRBlock, scan_lines
+from umr_snapshot import UMRSnapshot, build_snapshot, scan_file_record
+from umr_sources import source_stat, read_range
+from parse_umr_to_json import block_to_dict, iter_umr_files, iter_parsed_files, report_errors
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'umr_index.umrsnap')
+
+def find_blocks(snapshot: UMRSnapshot, sent_id: str,
+                language: Optional[str] = None, filename: Optional[str] = None) -> List[int]:
+    """
+    Return the ids of all blocks with the given sent_id, in corpus order, optionally restricted
+    to one language and/or file name. sent_ids are not unique across files.
+    """
+    key = sent_id.encode('utf-8')
+    order = snapshot.column('sent_id_order')
+
+    # Binary search for the first block whose sent_id is >= key
+    lo, hi = 0, snapshot.n_blocks
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if snapshot.sent_id_bytes(order[mid]) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    block_file = snapshot.column('file')
+    block_ids = []
+    while lo < snapshot.n_blocks and snapshot.sent_id_bytes(order[lo]) == key:
+        block_id = order[lo]
+        file_id = block_file[block_id]
+        if (language is None or snapshot.file_language(file_id) == language) and \
+                (filename is None or snapshot.file_name(file_id) == filename):
+            block_ids.append(block_id)
+        lo += 1
+    return block_ids
+
+def find_block_by_snt(snapshot: UMRSnapshot, filename: str, snt: int,
+                      language: Optional[str] = None) -> Optional[int]:
+    """Return the id of the block numbered `snt` (from '# :: sntN') in a file, or None."""
+    snts = snapshot.column('snt')
+    for file_id in range(snapshot.n_files):
+        if snapshot.file_name(file_id) != filename:
+            continue
+        if language is not None and snapshot.file_language(file_id) != language:
+            continue
+        for block_id in snapshot.file_blocks(file_id):
+            if snts[block_id] == snt:
+                return block_id
+    return None
+
+def read_block(snapshot: UMRSnapshot, block_id: int) -> UMRBlock:
+    """
+    Seek to a block in its source file and scan only that block.
+    Raises ValueError if the file changed since the index was built.
+    """
+    file_id = snapshot.column('file')[block_id]
+    file_path = snapshot.file_path(file_id)
+    st = source_stat(file_path)
+    if st.st_size != snapshot.column('file_size')[file_id] or \
+            st.st_mtime_ns != snapshot.column('file_mtime_ns')[file_id]:
+        raise ValueError(f"{file_path} changed since the index was built; rebuild it with `umr_index.py build`")
+
+    start = snapshot.column('block_start')[block_id]
+    data = read_range(file_path, start, snapshot.column('block_len')[block_id])
+    block = next(scan_lines(data.splitlines(keepends=True), offset=start))
+    block.index = snapshot.column('index')[block_id]
+    return block
+
+def lookup(snapshot: UMRSnapshot, block_id: int) -> Dict[str, Any]:
+    """Read a block and return it in the parse_umr_to_json.py output format, with its location."""
+    file_id = snapshot.column('file')[block_id]
+    result = {
+        "filename": snapshot.file_name(file_id),
+        "language": snapshot.file_language(file_id),
+        "block_index": snapshot.column('index')[block_id],
+    }
+    result.update(block_to_dict(read_block(snapshot, block_id)))
+    return result
+
+def build_index(root_dir: str, output_path: str, jobs: int = 1) -> None:
+    """Scan every UMR file under root_dir and write the index to output_path."""
+    errors = []
+    records = iter_parsed_files(iter_umr_files(root_dir), jobs=jobs, errors=errors,
+                                parse_func=scan_file_record)
+    n_files, n_blocks = build_snapshot(records, output_path, root_dir)
+    report_errors(errors, sys.stderr)
+    print(f"Indexed {n_blocks} blocks from {n_files} files into {output_path}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the random-access UMR block index')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Build the index')
+    build_parser.add_argument('--root-dir', type=str, default=os.path.dirname(DEFAULT_INDEX_PATH),
+                              help='Root directory containing language subdirectories (default: the script directory)')
+    build_parser.add_argument('--output', type=str, default=DEFAULT_INDEX_PATH,
+                              help=f'Index file path (default: {os.path.basename(DEFAULT_INDEX_PATH)})')
+    build_parser.add_argument('--jobs', type=int, default=1,
+                              help='Number of worker processes; 0 uses all CPUs (default: 1)')
+
+    lookup_parser = subparsers.add_parser('lookup', help='Print blocks as JSON Lines')
+    lookup_parser.add_argument('sent_ids', nargs='*', metavar='SENT_ID',
+                               help='sent_id(s) to look up')
+    lookup_parser.add_argument('--index', type=str, default=DEFAULT_INDEX_PATH,
+                               help=f'Index file path (default: {os.path.basename(DEFAULT_INDEX_PATH)})')
+    lookup_parser.add_argument('--language', type=str, help='Only return blocks of this language')
+    lookup_parser.add_argument('--file', type=str, help='Only return blocks of this file name')
+    lookup_parser.add_argument('--snt', type=int, help='Look up block sntN of --file instead of a sent_id')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if args.jobs < 0:
+            parser.error("--jobs must be >= 0")
+        build_index(os.path.abspath(args.root_dir), args.output, jobs=args.jobs or os.cpu_count() or 1)
+        return
+
+    if args.snt is not None and not args.file:
+        parser.error("--snt requires --file")
+    if args.snt is None and not args.sent_ids:
+        parser.error("give at least one SENT_ID, or --file and --snt")
+
+    found = False
+    with UMRSnapshot(args.index) as snapshot:
+        if args.snt is not None:
+            block_id = find_block_by_snt(snapshot, args.file, args.snt, language=args.language)
+            block_ids = [] if block_id is None else [block_id]
+        else:
+            block_ids = [block_id for sent_id in args.sent_ids
+                         for block_id in find_blocks(snapshot, sent_id, args.language, args.file)]
+        for block_id in block_ids:
+            print(json.dumps(lookup(snapshot, block_id), ensure_ascii=False))
+            found = True
+    if not found:
+        print("No matching block found", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
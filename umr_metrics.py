@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Columnar per-block metrics for statistics.py.
+
+A BlockTable holds one compact NumPy array per metric, with one entry per block of the corpus
+(file id, partial flag, word count, graph flags, relation/concept/doc-relation counts per type,
+source prefix), plus a small file table (path, language). Every statistics table is a vectorized
+group-by over these columns, so a new breakdown is a grouping, not a new set of counters:
+
+    table = BlockTable.from_file_rows([("english", path, rows), ...])
+    labels, counters = table.counters('language')   # counters['words'][i] = [non-partial, partial]
+    labels, counters = table.counters('source')     # the same tables per sent_id source ('DF-', 'u_tree-', ...)
+    labels, bins, counts = table.histogram('language')   # sentence graphs by number of concepts
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Fields of a block row (see umr_stats.analyze_block), in the order they are stored in the
+# statistics cache; all but the source prefix are integer (or boolean) metrics
+BLOCK_FIELDS = [
+    "is_partial", "word_count", "has_sentence_graph", "has_doc_graph",
+    "relations_count", "concepts_count", "doc_relations_count",
+    "doc_temporal_count", "doc_modal_count", "doc_coref_count", "source",
+]
+METRIC_FIELDS = BLOCK_FIELDS[:-1]
+_BOOL_FIELDS = {"is_partial", "has_sentence_graph", "has_doc_graph"}
+
+# Counters computed per group and category (non-partial, partial); see BlockTable.counters
+COUNTERS = ["docs", "sentences", "words", "sentence_graphs", "doc_graphs",
+            "relations", "concepts", "doc_relations", "doc_temporal", "doc_modal", "doc_coref"]
+
+# Groupings understood by BlockTable.counters and BlockTable.histogram
+GROUP_BY = ("language", "file", "source")
+
+# The source of a sent_id: its leading word(s) and separator, e.g. 'DF-', 'u_tree-', 'lpp_'
+SOURCE_PREFIX_RE = re.compile(r'[A-Za-z]+(?:_[A-Za-z]+)*[-_]?')
+
+# Lower bounds of the graph size bins (concepts per sentence graph); the last bin is open
+GRAPH_SIZE_BINS = [0, 1, 6, 11, 21, 51, 101]
+
+def source_prefix(sent_id: Optional[str]) -> str:
+    """The source prefix of a sent_id ('u_tree-' for 'u_tree-cs-s2-root'), or '' if it has none."""
+    if not sent_id:
+        return ''
+    match = SOURCE_PREFIX_RE.match(sent_id)
+    return match.group(0) if match else ''
+
+def bin_labels(bins: Sequence[int]) -> List[str]:
+    """Readable labels of histogram bins: '0', '1-5', ..., '101+'."""
+    labels = []
+    for lower, upper in zip(bins, list(bins[1:]) + [None]):
+        if upper is None:
+            labels.append(f"{lower}+")
+        elif upper - lower == 1:
+            labels.append(str(lower))
+        else:
+            labels.append(f"{lower}-{upper - 1}")
+    return labels
+
+def group_sum(groups: np.ndarray, n_groups: int, values: Optional[np.ndarray] = None) -> np.ndarray:
+    """Sum `values` per group id (0 <= id < n_groups), or count the rows of each group if no values are given."""
+    if values is None:
+        return np.bincount(groups, minlength=n_groups)
+    # bincount sums in float64, which is exact for counts far beyond the size of the corpus
+    return np.rint(np.bincount(groups, weights=values, minlength=n_groups)).astype(np.int64)
+
+class BlockTable:
+    """
+    Per-block metric columns (NumPy arrays of equal length) and the file table they refer to.
+    Columns: 'file' (file id), 'source' (id into `sources`) and the METRIC_FIELDS.
+    """
+
+    def __init__(self, languages: List[str], files: List[str], file_language: np.ndarray,
+                 sources: List[str], columns: Dict[str, np.ndarray]):
+        self.languages = languages
+        self.files = files
+        # Language id of every file; files without blocks still count as documents
+        self.file_language = file_language
+        self.sources = sources
+        self.columns = columns
+
+    @property
+    def n_files(self) -> int:
+        return len(self.files)
+
+    @property
+    def n_blocks(self) -> int:
+        return len(self.columns["file"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    @classmethod
+    def from_file_rows(cls, file_rows: Iterable[Tuple[str, str, List[list]]],
+                       languages: Sequence[str] = ()) -> 'BlockTable':
+        """
+        Build a table from (language, file path, block rows) triples, each row holding the
+        BLOCK_FIELDS of one block. `languages` fixes the order (and presence) of languages
+        that may have no files.
+        """
+        language_ids = {language: i for i, language in enumerate(languages)}
+        source_ids: Dict[str, int] = {}
+        files, file_language, block_file, block_source, metrics = [], [], [], [], []
+        for language, file_path, rows in file_rows:
+            file_id = len(files)
+            files.append(file_path)
+            file_language.append(language_ids.setdefault(language, len(language_ids)))
+            block_file.extend([file_id] * len(rows))
+            for row in rows:
+                metrics.append(row[:-1])
+                block_source.append(source_ids.setdefault(row[-1], len(source_ids)))
+
+        values = np.array(metrics, dtype=np.int64).reshape(len(metrics), len(METRIC_FIELDS))
+        columns = {
+            "file": np.array(block_file, dtype=np.int32),
+            "source": np.array(block_source, dtype=np.int32),
+        }
+        for i, field in enumerate(METRIC_FIELDS):
+            columns[field] = values[:, i].astype(bool if field in _BOOL_FIELDS else np.int32)
+        return cls(list(language_ids), files, np.array(file_language, dtype=np.int32),
+                   list(source_ids), columns)
+
+    def _groups(self, by: str) -> Tuple[List[str], np.ndarray, Optional[np.ndarray]]:
+        """(labels, group id of every block, group id of every file or None if blocks of a file may differ)."""
+        file_ids = self.columns["file"]
+        if by == "language":
+            return self.languages, self.file_language[file_ids], self.file_language
+        if by == "file":
+            return self.files, file_ids, np.arange(self.n_files)
+        if by == "source":
+            return self.sources, self.columns["source"], None
+        raise ValueError(f"unknown grouping {by!r}, expected one of {GROUP_BY}")
+
+    def counters(self, by: str = "language") -> Tuple[List[str], Dict[str, np.ndarray]]:
+        """
+        Group the blocks by 'language', 'file' or 'source' and return (labels, counters): every
+        COUNTERS entry is an (n_groups, 2) array of [non-partial, partial] values, and 'all_docs'
+        is the number of documents per group. A document counts once in each group and category
+        in which it has a block; grouped by language or file, documents without blocks count too.
+        """
+        labels, groups, file_groups = self._groups(by)
+        n = len(labels)
+        keys = groups.astype(np.int64) * 2 + self.columns["is_partial"]
+
+        def split(values: Optional[np.ndarray] = None) -> np.ndarray:
+            return group_sum(keys, 2 * n, values).reshape(n, 2)
+
+        counters = {
+            "sentences": split(),
+            "words": split(self.columns["word_count"]),
+            "sentence_graphs": split(self.columns["has_sentence_graph"]),
+            "doc_graphs": split(self.columns["has_doc_graph"]),
+            "relations": split(self.columns["relations_count"]),
+            "concepts": split(self.columns["concepts_count"]),
+            "doc_relations": split(self.columns["doc_relations_count"]),
+            "doc_temporal": split(self.columns["doc_temporal_count"]),
+            "doc_modal": split(self.columns["doc_modal_count"]),
+            "doc_coref": split(self.columns["doc_coref_count"]),
+        }
+        # Distinct (file, group, category) triples are the documents of each group and category
+        file_keys = np.unique(self.columns["file"].astype(np.int64) * (2 * n) + keys)
+        counters["docs"] = group_sum(file_keys % (2 * n), 2 * n).reshape(n, 2)
+        if file_groups is not None:
+            counters["all_docs"] = group_sum(file_groups, n)
+        else:
+            # (file, group) pairs, whatever the category
+            counters["all_docs"] = group_sum(np.unique(file_keys // 2) % n, n)
+        return labels, counters
+
+    def histogram(self, by: str = "language", column: str = "concepts_count",
+                  bins: Sequence[int] = GRAPH_SIZE_BINS) -> Tuple[List[str], List[str], np.ndarray]:
+        """
+        Histogram of a column over the blocks that have a sentence graph (by default: graph size
+        in concepts), per group. Returns (group labels, bin labels, (n_groups, n_bins) counts).
+        """
+        labels, groups, _ = self._groups(by)
+        has_graph = self.columns["has_sentence_graph"]
+        bin_ids = np.searchsorted(np.asarray(bins), self.columns[column][has_graph], side='right') - 1
+        # Values below the first bound (none, for the default bins) go to the first bin
+        bin_ids = np.maximum(bin_ids, 0)
+        keys = groups[has_graph].astype(np.int64) * len(bins) + bin_ids
+        counts = group_sum(keys, len(labels) * len(bins)).reshape(len(labels), len(bins))
+        return labels, bin_labels(bins), counts
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Opt-in per-stage profiling for statistics.py and parse_umr_to_json.py (their --profile option).
+
+Code is instrumented with the shared `PROFILER`:
+
+    with PROFILER.stage('read') as stage:
+        data = f.read()
+        stage.nbytes = len(data)
+
+records the wall time, call count and bytes of the 'read' stage, and
+
+    PROFILER.item('file', file_path, seconds, nbytes)
+
+keeps the slowest files (or blocks) seen. Until PROFILER.enable() is called, stage() returns a
+shared no-op context manager and item() returns at once, so the instrumentation costs a method
+call per stage and nothing is recorded.
+"""
+import sys
+import json
+import time
+import heapq
+import cProfile
+from typing import Any, Dict, List, Optional, TextIO
+
+class _NullStage:
+    """The context manager returned while profiling is off."""
+    __slots__ = ()
+    nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    """Times one stage call and adds it to the profiler when it exits."""
+    __slots__ = ('profiler', 'name', 'nbytes', 'start')
+
+    def __init__(self, profiler: 'Profiler', name: str, nbytes: int):
+        self.profiler = profiler
+        self.name = name
+        # May be set inside the `with` block once the size is known
+        self.nbytes = nbytes
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.perf_counter() - self.start, self.nbytes)
+        return False
+
+class Profiler:
+    """Per-stage wall time, call counts and bytes, plus the slowest files and blocks."""
+
+    def __init__(self, top_n: int = 20):
+        self.enabled = False
+        self.top_n = top_n
+        self.start = None
+        # Stage name -> [seconds, calls, bytes], in order of first use
+        self.stages: Dict[str, List[float]] = {}
+        # Item kind (e.g. 'file', 'block') -> min-heap of (seconds, label, bytes)
+        self.slowest: Dict[str, list] = {}
+        self._cprofile: Optional[cProfile.Profile] = None
+
+    def enable(self, top_n: Optional[int] = None, cprofile: bool = False) -> None:
+        """Start recording; with `cprofile`, also run cProfile until dump_cprofile()."""
+        self.enabled = True
+        if top_n is not None:
+            self.top_n = top_n
+        self.start = time.perf_counter()
+        if cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stage(self, name: str, nbytes: int = 0):
+        """Context manager timing one call of a stage."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, nbytes)
+
+    def add(self, name: str, seconds: float, nbytes: int = 0, calls: int = 1) -> None:
+        """Add time (and bytes) to a stage directly, e.g. for time measured by the caller."""
+        if not self.enabled:
+            return
+        totals = self.stages.get(name)
+        if totals is None:
+            totals = self.stages[name] = [0.0, 0, 0]
+        totals[0] += seconds
+        totals[1] += calls
+        totals[2] += nbytes
+
+    def item(self, kind: str, label: str, seconds: float, nbytes: int = 0) -> None:
+        """Offer a file or block to the list of the slowest `top_n` items of its kind."""
+        if not self.enabled:
+            return
+        heap = self.slowest.setdefault(kind, [])
+        entry = (seconds, label, nbytes)
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def report(self) -> Dict[str, Any]:
+        """The machine-readable report: wall time, stages, and slowest items (slowest first)."""
+        wall = time.perf_counter() - self.start if self.start is not None else 0.0
+        return {
+            "wall_seconds": round(wall, 6),
+            "stages": {
+                name: {
+                    "seconds": round(seconds, 6),
+                    "calls": calls,
+                    "bytes": nbytes,
+                    "share": round(seconds / wall, 4) if wall else 0.0,
+                }
+                for name, (seconds, calls, nbytes) in self.stages.items()
+            },
+            "slowest": {
+                kind: [{"label": label, "seconds": round(seconds, 6), "bytes": nbytes}
+                       for seconds, label, nbytes in sorted(heap, reverse=True)]
+                for kind, heap in self.slowest.items()
+            },
+        }
+
+    def write_report(self, path: str, summary: TextIO = sys.stderr) -> Dict[str, Any]:
+        """Write the JSON report to `path` (or stdout for '-') and a readable summary to `summary`."""
+        report = self.report()
+        if path == '-':
+            json.dump(report, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        print(format_report(report), file=summary)
+        if path != '-':
+            print(f"Profile written to {path}", file=summary)
+        return report
+
+    def dump_cprofile(self, path: str) -> None:
+        """Stop cProfile and write its stats (pstats format, readable by snakeviz or flameprof) to `path`."""
+        if self._cprofile is None:
+            return
+        self._cprofile.disable()
+        self._cprofile.dump_stats(path)
+        self._cprofile = None
+
+def format_report(report: Dict[str, Any], top: int = 5) -> str:
+    """A plain-text summary of a report: one line per stage, then the slowest items of each kind."""
+    lines = [f"Profile: {report['wall_seconds']:.3f}s wall time",
+             f"  {'stage':<22}{'seconds':>10}{'share':>8}{'calls':>10}{'MB':>10}"]
+    for name, stage in report["stages"].items():
+        lines.append(f"  {name:<22}{stage['seconds']:>10.3f}{stage['share']:>8.1%}"
+                     f"{stage['calls']:>10}{stage['bytes'] / (1024 * 1024):>10.2f}")
+    for kind, items in report["slowest"].items():
+        lines.append(f"  slowest {kind}s:")
+        for item in items[:top]:
+            lines.append(f"    {item['seconds']:>8.4f}s {item['bytes']:>9} B  {item['label']}")
+    return '\n'.join(lines)
+
+# The profiler shared by all modules; disabled unless a script's --profile option enables it
+PROFILER = Profiler()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Corpus-wide search for concepts, relations and attribute values in sentence graphs.
+
+`build` scans the corpus once and writes two files: a block index (the umr_index.py snapshot,
+which records where every block is) and an inverted index from graph terms to the ids of the
+blocks that contain them. The terms of a sentence graph are:
+
+    concept:have-degree-91          a node concept
+    role::modal-strength            a role, edge or attribute, as written (':ARG0-of' stays inverted)
+    attr::polarity=-                an attribute: role and constant value
+    value:Tacloban                  a constant value, whatever its role (string quotes dropped)
+
+The term index stores the terms sorted, each with a sorted array of block ids (its postings),
+and is memory-mapped when opened, so a query binary-searches a few terms and combines their
+postings with NumPy set operations instead of scanning the corpus:
+
+    python umr_query.py build
+    python umr_query.py search 'concept:have-degree-91 AND role::modal-strength'
+    python umr_query.py search '(concept:say-01 OR concept:tell-01) AND NOT attr::polarity=-' --language english
+    python umr_query.py search 'concept:have-*' --count
+    python umr_query.py terms 'role::ARG*'
+
+A query combines terms with AND, OR, NOT and parentheses (adjacent terms are ANDed); a bare
+word is a concept, and a trailing '*' matches every term with that prefix.
+"""
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import struct
+import argparse
+import functools
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from umr_graph import clean_graph_text, graph_branches, lenient_graph_branches
+from umr_snapshot import UMRSnapshot, build_snapshot, scan_file_record
+from umr_index import DEFAULT_INDEX_PATH, lookup
+from parse_umr_to_json import iter_umr_files, iter_parsed_files, report_errors
+
+MAGIC = b'UMRTERM\0'
+FORMAT_VERSION = 1
+
+DEFAULT_TERMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'umr_terms.umrterms')
+
+TERM_KINDS = ('concept', 'role', 'attr', 'value')
+
+TERM_COLUMNS = [('term_off', 'I'), ('term_len', 'I'), ('post_off', 'Q'), ('post_len', 'I')]
+
+# Constant targets that are really node references: variables like s1p3, and the Czech
+# placeholders (s234x21 / /) that clean_graph_text turns into a bare variable
+_VARIABLE_RE = re.compile(r's\d+[a-z]\w*$')
+
+_QUERY_TOKEN_RE = re.compile(r'\s*(?:(?P<paren>[()])|(?P<term>(?:[^\s()"]|"[^"]*")+))')
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1]
+    return value
+
+def graph_terms(graph_text: str) -> List[str]:
+    """The sorted, distinct terms (see the module docstring) of a sentence graph text."""
+    clean_text = clean_graph_text(graph_text)
+    branches = graph_branches(clean_text)
+    if branches is None:
+        branches = lenient_graph_branches(clean_text)
+    variables = {source for source, _, _ in branches}
+    terms = set()
+    for source, role, target in branches:
+        if role == '/':
+            terms.add(f"concept:{_unquote(target)}")
+            continue
+        terms.add(f"role:{role}")
+        if target is not None and target not in variables and not _VARIABLE_RE.match(target):
+            value = _unquote(target)
+            terms.add(f"attr:{role}={value}")
+            terms.add(f"value:{value}")
+    return sorted(terms)
+
+def block_terms(block) -> Dict[str, Any]:
+    """The scan_file_record block_extra that adds the terms of a block's sentence graph."""
+    graph_text = block.section_text('sentence_graph')
+    return {"terms": graph_terms(graph_text) if graph_text else []}
+
+def normalize_term(token: str) -> str:
+    """
+    Turn a query term into the stored form: 'have-degree-91' -> 'concept:have-degree-91',
+    'role:ARG0' -> 'role::ARG0', 'value:"New York"' -> 'value:New York'.
+    """
+    kind, sep, rest = token.partition(':')
+    if not sep or kind not in TERM_KINDS:
+        kind, rest = 'concept', token
+    if kind in ('role', 'attr') and not rest.startswith(':'):
+        rest = ':' + rest
+    if kind == 'attr':
+        role, sep, value = rest.partition('=')
+        if sep:
+            rest = f"{role}={_unquote(value)}"
+    else:
+        rest = _unquote(rest)
+    return f"{kind}:{rest}"
+
+def build_term_index(records: Iterable[Dict[str, Any]], output_path: str, snapshot_path: str,
+                     root_dir: str) -> Tuple[int, int, int]:
+    """
+    Write the block snapshot of the given file records (see scan_file_record with block_terms)
+    to snapshot_path and their term index to output_path.
+    Returns (number of files, number of blocks, number of distinct terms).
+    """
+    postings: Dict[str, array] = {}
+
+    def collect(records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        # build_snapshot numbers the blocks in the order it receives them
+        block_id = 0
+        for record in records:
+            for block in record["blocks"]:
+                for term in block["terms"]:
+                    term_postings = postings.get(term)
+                    if term_postings is None:
+                        term_postings = postings[term] = array('I')
+                    term_postings.append(block_id)
+                block_id += 1
+            yield record
+
+    n_files, n_blocks = build_snapshot(collect(records), snapshot_path, root_dir)
+
+    columns = {name: array(code) for name, code in TERM_COLUMNS}
+    heap = bytearray()
+    all_postings = array('I')
+    for encoded, term in sorted((term.encode('utf-8'), term) for term in postings):
+        columns['term_off'].append(len(heap))
+        columns['term_len'].append(len(encoded))
+        heap += encoded
+        columns['post_off'].append(len(all_postings))
+        columns['post_len'].append(len(postings[term]))
+        all_postings.extend(postings[term])
+    columns['postings'] = all_postings
+
+    st = os.stat(snapshot_path)
+    header = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "snapshot": {"path": os.path.abspath(snapshot_path), "n_blocks": n_blocks,
+                     "size": st.st_size, "mtime_ns": st.st_mtime_ns},
+        "n_terms": len(postings),
+        "columns": {},
+    }
+    # The header size depends on the offsets it contains, so lay out twice with room to spare
+    for _ in range(2):
+        header_bytes = json.dumps(header).encode('utf-8')
+        offset = _align(len(MAGIC) + 4 + len(header_bytes) + 256)
+        for name, column in columns.items():
+            header["columns"][name] = [column.typecode, offset, len(column)]
+            offset = _align(offset + len(column) * column.itemsize)
+        header["heap"] = [offset, len(heap)]
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = header["columns"][TERM_COLUMNS[0][0]][1]
+    header_bytes += b' ' * (data_start - len(MAGIC) - 4 - len(header_bytes))
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('=I', len(header_bytes)))
+        f.write(header_bytes)
+        for name, column in columns.items():
+            f.seek(header["columns"][name][1])
+            f.write(column.tobytes())
+        f.seek(header["heap"][0])
+        f.write(heap)
+    os.replace(tmp_path, output_path)
+    return n_files, n_blocks, len(postings)
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+class TermIndex:
+    """
+    A memory-mapped term index and the block snapshot it refers to.
+
+        with TermIndex('umr_terms.umrterms') as index:
+            block_ids = index.search('concept:have-degree-91 AND role::modal-strength', languages=['english'])
+            for block_id in block_ids:
+                print(index.location(block_id))
+    """
+
+    def __init__(self, path: str, snapshot_path: Optional[str] = None):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self._mm[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a UMR term index")
+            header_len, = struct.unpack_from('=I', self._mm, len(MAGIC))
+            start = len(MAGIC) + 4
+            header = json.loads(bytes(self._mm[start:start + header_len]))
+            if header.get("version") != FORMAT_VERSION:
+                raise ValueError(f"{path} has term index version {header.get('version')}, expected {FORMAT_VERSION}")
+            if header.get("byteorder") != sys.byteorder:
+                raise ValueError(f"{path} was written on a {header.get('byteorder')}-endian machine")
+            expected = header["snapshot"]
+            snapshot_path = snapshot_path or expected["path"]
+            st = os.stat(snapshot_path)
+            if (st.st_size, st.st_mtime_ns) != (expected["size"], expected["mtime_ns"]):
+                raise ValueError(f"{snapshot_path} changed since {path} was built; "
+                                 f"rebuild both with `umr_query.py build`")
+        except Exception:
+            self._mm.close()
+            raise
+        self.header = header
+        self.n_terms: int = header["n_terms"]
+        self.snapshot = UMRSnapshot(snapshot_path)
+        self._columns = {name: np.frombuffer(self._mm, dtype=code, count=count, offset=offset)
+                         for name, (code, offset, count) in header["columns"].items()}
+        self._heap_start = header["heap"][0]
+        self._block_file = np.frombuffer(self.snapshot.column('file'), dtype=np.uint32)
+        self._file_lang = np.frombuffer(self.snapshot.column('file_lang'), dtype=np.uint16)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Unmap the term index and close the block snapshot."""
+        self._columns.clear()
+        self._block_file = self._file_lang = None
+        self.snapshot.close()
+        self._mm.close()
+
+    def term(self, term_id: int) -> str:
+        off = self._heap_start + int(self._columns['term_off'][term_id])
+        return str(self._mm[off:off + int(self._columns['term_len'][term_id])], 'utf-8')
+
+    def _term_bytes(self, term_id: int) -> bytes:
+        off = self._heap_start + int(self._columns['term_off'][term_id])
+        return self._mm[off:off + int(self._columns['term_len'][term_id])]
+
+    def _lower_bound(self, key: bytes) -> int:
+        """The id of the first term whose UTF-8 bytes are >= key."""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def match_terms(self, pattern: str) -> range:
+        """The ids of the terms equal to a normalized term, or starting with it if it ends with '*'."""
+        if pattern.endswith('*'):
+            prefix = pattern[:-1].encode('utf-8')
+            first = self._lower_bound(prefix)
+            last = first
+            while last < self.n_terms and self._term_bytes(last).startswith(prefix):
+                last += 1
+            return range(first, last)
+        key = pattern.encode('utf-8')
+        first = self._lower_bound(key)
+        if first < self.n_terms and self._term_bytes(first) == key:
+            return range(first, first + 1)
+        return range(first, first)
+
+    def postings(self, term_id: int) -> np.ndarray:
+        """The sorted ids of the blocks that contain a term, as a zero-copy array."""
+        off = int(self._columns['post_off'][term_id])
+        return self._columns['postings'][off:off + int(self._columns['post_len'][term_id])]
+
+    def term_blocks(self, pattern: str) -> np.ndarray:
+        """The sorted ids of the blocks that contain a (normalized) term, or any term matching a prefix pattern."""
+        term_ids = self.match_terms(pattern)
+        if len(term_ids) == 1:
+            # A copy, so results do not pin the mapping
+            return self.postings(term_ids[0]).copy()
+        if not term_ids:
+            return np.empty(0, dtype=np.uint32)
+        return np.unique(np.concatenate([self.postings(term_id) for term_id in term_ids]))
+
+    def search(self, query: str, languages: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        Evaluate a query (see the module docstring) and return the sorted ids of the matching
+        blocks, restricted to the given languages if any. Raises ValueError for a malformed query.
+        """
+        block_ids = _QueryParser(query, self).parse()
+        if languages:
+            language_ids = [i for i, language in enumerate(self.snapshot.languages) if language in languages]
+            block_ids = block_ids[np.isin(self._file_lang[self._block_file[block_ids]], language_ids)]
+        return block_ids
+
+    def location(self, block_id: int) -> Dict[str, Any]:
+        """Where a block is: language, file name, block index (in the file) and sent_id."""
+        snapshot = self.snapshot
+        file_id = snapshot.column('file')[block_id]
+        return {
+            "language": snapshot.file_language(file_id),
+            "filename": snapshot.file_name(file_id),
+            "block_index": snapshot.column('index')[block_id],
+            "sent_id": snapshot.sent_id(block_id),
+        }
+
+class _QueryParser:
+    """
+    Recursive-descent evaluator of a query:
+
+        query := and_query ('OR' and_query)*
+        and_query := not_query (['AND'] not_query)*
+        not_query := 'NOT' not_query | '(' query ')' | term
+    """
+
+    def __init__(self, query: str, index: TermIndex):
+        self.index = index
+        self.tokens: List[str] = []
+        position = 0
+        query = query.rstrip()
+        while position < len(query):
+            match = _QUERY_TOKEN_RE.match(query, position)
+            if match is None:
+                raise ValueError(f"cannot read the query at {query[position:]!r} (unbalanced quotes?)")
+            self.tokens.append(match.group('paren') or match.group('term'))
+            position = match.end()
+        self.position = 0
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> Optional[str]:
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def parse(self) -> np.ndarray:
+        if not self.tokens:
+            raise ValueError("empty query")
+        result = self._query()
+        if self._peek() is not None:
+            raise ValueError(f"unexpected {self._peek()!r} in the query")
+        return result
+
+    def _query(self) -> np.ndarray:
+        result = self._and_query()
+        while self._peek() == 'OR':
+            self._next()
+            result = np.union1d(result, self._and_query())
+        return result
+
+    def _and_query(self) -> np.ndarray:
+        result = self._not_query()
+        while self._peek() not in (None, 'OR', ')'):
+            if self._peek() == 'AND':
+                self._next()
+            result = np.intersect1d(result, self._not_query(), assume_unique=True)
+        return result
+
+    def _not_query(self) -> np.ndarray:
+        token = self._next()
+        if token == 'NOT':
+            return np.setdiff1d(np.arange(self.index.snapshot.n_blocks, dtype=np.uint32),
+                                self._not_query(), assume_unique=True)
+        if token == '(':
+            result = self._query()
+            if self._next() != ')':
+                raise ValueError("missing ')' in the query")
+            return result
+        if token is None or token in ('AND', 'OR', ')'):
+            raise ValueError(f"expected a term, found {token or 'the end of the query'!r}")
+        return self.index.term_blocks(normalize_term(token))
+
+def build_index(root_dir: str, output_path: str, snapshot_path: str, jobs: int = 1) -> None:
+    """Scan every UMR file under root_dir and write the block snapshot and the term index."""
+    errors = []
+    records = iter_parsed_files(iter_umr_files(root_dir), jobs=jobs, errors=errors,
+                                parse_func=functools.partial(scan_file_record, block_extra=block_terms))
+    n_files, n_blocks, n_terms = build_term_index(records, output_path, snapshot_path, root_dir)
+    report_errors(errors, sys.stderr)
+    print(f"Indexed {n_terms} terms of {n_blocks} blocks from {n_files} files into {output_path} "
+          f"(blocks in {snapshot_path})", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the UMR concept and relation index')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Build the block snapshot and the term index')
+    build_parser.add_argument('--root-dir', type=str, default=os.path.dirname(DEFAULT_TERMS_PATH),
+                              help='Root directory containing language subdirectories (default: the script directory)')
+    build_parser.add_argument('--jobs', type=int, default=1,
+                              help='Number of worker processes; 0 uses all CPUs (default: 1)')
+
+    search_parser = subparsers.add_parser('search', help='Print the blocks matching a query')
+    search_parser.add_argument('query', help="Query, e.g. 'concept:have-degree-91 AND role::modal-strength'")
+    search_parser.add_argument('--language', action='append',
+                               help='Only return blocks of this language (repeatable)')
+    search_parser.add_argument('--count', action='store_true', help='Only print the number of matching blocks')
+    search_parser.add_argument('--limit', type=int, help='Print at most this many blocks')
+    search_parser.add_argument('--json', action='store_true',
+                               help='Print the matching blocks as JSON Lines (read from the .umr files, '
+                                    'as `umr_index.py lookup` does) instead of their locations')
+
+    terms_parser = subparsers.add_parser('terms', help='List indexed terms and their block counts')
+    terms_parser.add_argument('pattern', help="Term or prefix pattern, e.g. 'concept:have-*'")
+
+    for sub in (build_parser, search_parser, terms_parser):
+        sub.add_argument('--index', type=str, default=DEFAULT_TERMS_PATH,
+                         help=f'Term index path (default: {os.path.basename(DEFAULT_TERMS_PATH)})')
+    build_parser.add_argument('--snapshot', type=str, default=DEFAULT_INDEX_PATH,
+                              help=f'Block snapshot path (default: {os.path.basename(DEFAULT_INDEX_PATH)}, '
+                                   'the umr_index.py index)')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if args.jobs < 0:
+            parser.error("--jobs must be >= 0")
+        build_index(os.path.abspath(args.root_dir), args.index, args.snapshot,
+                    jobs=args.jobs or os.cpu_count() or 1)
+        return
+
+    with TermIndex(args.index) as index:
+        if args.command == 'terms':
+            for term_id in index.match_terms(normalize_term(args.pattern)):
+                print(f"{index.term(term_id)}\t{len(index.postings(term_id))}")
+            return
+
+        start = time.perf_counter()
+        try:
+            block_ids = index.search(args.query, languages=args.language)
+        except ValueError as e:
+            parser.error(str(e))
+        elapsed = time.perf_counter() - start
+        if args.count:
+            print(len(block_ids))
+        else:
+            for block_id in block_ids[:args.limit]:
+                block_id = int(block_id)
+                if args.json:
+                    print(json.dumps(lookup(index.snapshot, block_id), ensure_ascii=False))
+                else:
+                    location = index.location(block_id)
+                    print('\t'.join(str(location[key]) for key in ('language', 'filename', 'block_index', 'sent_id')))
+        print(f"{len(block_ids)} blocks matched in {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
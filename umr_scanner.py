@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Single-pass, line-oriented scanner for UMR files, shared by parse_umr_to_json.py and statistics.py.
+
+A UMR file is a sequence of blocks separated by a line of 80 hash signs. Inside a block,
+lines starting with '#' are headers: '# meta-info ...' and '# :: sntN' lines carry the meta
+information, and '# sentence level graph:', '# alignment:' and '# document level annotation:'
+open a section that runs until the next header. Lines between the meta information and the
+first section are the sentence information (Index, Words, ...).
+
+The scanner reads each line once and slices every section out as it goes, so no whole-file
+string is built and no section is searched for twice. Blocks and sections also record the
+byte range they occupy in the file, so they can later be read back with a single seek.
+"""
+import re
+import mmap
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from umr_sources import is_stream, open_umr
+
+BLOCK_DELIMITER = '#' * 80
+
+# Section kinds, keyed by the header text that opens them
+SECTION_HEADERS = {
+    'sentence level graph:': 'sentence_graph',
+    'alignment:': 'alignment',
+    'document level annotation:': 'document_annotation',
+}
+
+SENT_ID_RE = re.compile(r'sent_id\s*=\s*(\S+)')
+SNT_RE = re.compile(r'::\s*snt(\d+)')
+
+class Section:
+    """One '# <header>:' section of a block and the lines that follow it."""
+    __slots__ = ('kind', 'header_rest', 'lines', 'start', 'end')
+
+    def __init__(self, kind: str, header_rest: str = '', start: int = 0):
+        self.kind = kind
+        # Text after the header on the same line, e.g. '# alignment: s1a: 1-1'
+        self.header_rest = header_rest
+        self.lines: List[str] = []
+        # Byte range of the section in the file, from its header line to its last line
+        self.start = start
+        self.end = start
+
+    @property
+    def text(self) -> str:
+        """The section content with surrounding whitespace stripped."""
+        if self.header_rest:
+            return '\n'.join([self.header_rest] + self.lines).strip()
+        return '\n'.join(self.lines).strip()
+
+    def nonempty_lines(self) -> List[str]:
+        """The stripped, non-empty lines of the section."""
+        return [line.strip() for line in self.lines if line.strip()]
+
+def decode_lines(buffer, start: int, end: int) -> str:
+    """
+    Decode buffer[start:end] (bytes or mmap) as UTF-8 lines joined by '\n', i.e. with every line
+    terminator normalized the way the line scanner splits lines.
+    """
+    text = buffer[start:end].decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+class SectionView:
+    """
+    A section as a view into the file buffer: the (offset, length) of its header and content,
+    and nothing else. Its text is decoded from the buffer only when it is asked for.
+    """
+    __slots__ = ('buffer', 'kind', 'offset', 'length', 'body_offset', 'rest_offset')
+
+    def __init__(self, buffer, kind: str, offset: int, body_offset: int, end: int,
+                 rest_offset: Optional[int] = None):
+        self.buffer = buffer
+        self.kind = kind
+        # Byte range of the section (header line included) and where the lines after the header start
+        self.offset = offset
+        self.length = end - offset
+        self.body_offset = body_offset
+        # Where the text after the header keyword starts on the header line, if the caller knows it
+        self.rest_offset = rest_offset
+
+    @property
+    def raw(self) -> memoryview:
+        """The section bytes, header line included, as a zero-copy memoryview."""
+        return memoryview(self.buffer)[self.offset:self.offset + self.length]
+
+    @property
+    def header_rest(self) -> str:
+        """Text after the header on the same line (see Section.header_rest)."""
+        if self.rest_offset is not None:
+            return decode_lines(self.buffer, self.rest_offset, self.body_offset).strip()
+        header = decode_lines(self.buffer, self.offset, self.body_offset).strip()
+        return classify_header(header)[1]
+
+    @property
+    def text(self) -> str:
+        """The section content with surrounding whitespace stripped, equal to Section.text."""
+        body = decode_lines(self.buffer, self.body_offset, self.offset + self.length)
+        header_rest = self.header_rest
+        if header_rest:
+            return (header_rest + '\n' + body).strip()
+        return body.strip()
+
+class UMRBlock:
+    """A block (one sentence) of a UMR file, split into meta, sentence information and sections."""
+    __slots__ = ('index', 'meta_lines', 'sentence_lines', 'sections',
+                 'start', 'end', 'meta_span', 'sentence_span')
+
+    def __init__(self, index: int, start: int = 0):
+        self.index = index
+        self.meta_lines: List[str] = []
+        self.sentence_lines: List[str] = []
+        # First section of each kind; repeated headers of the same kind are ignored
+        self.sections: Dict[str, Section] = {}
+        # Byte ranges in the file: the whole block (without delimiters), the meta lines
+        # and the sentence information lines (None if the block has none)
+        self.start = start
+        self.end = start
+        self.meta_span: Optional[Tuple[int, int]] = None
+        self.sentence_span: Optional[Tuple[int, int]] = None
+
+    @property
+    def meta_info(self) -> str:
+        """The first meta line without its leading '#', e.g. 'meta-info :: sent_id = ...'."""
+        if not self.meta_lines:
+            return ''
+        return self.meta_lines[0].strip()[1:].strip()
+
+    @property
+    def sent_id(self) -> Optional[str]:
+        """The sent_id from the meta-info line, if any."""
+        for line in self.meta_lines:
+            match = SENT_ID_RE.search(line)
+            if match:
+                return match.group(1)
+        return None
+
+    @property
+    def snt(self) -> Optional[int]:
+        """The sentence number from the '# :: sntN' line, if any."""
+        for line in self.meta_lines:
+            match = SNT_RE.search(line)
+            if match:
+                return int(match.group(1))
+        return None
+
+    @property
+    def is_partial(self) -> bool:
+        """True if the block's meta-info marks it as type = partial_conversion."""
+        return any(line.startswith('# meta-info') and 'type = partial_conversion' in line
+                   for line in self.meta_lines)
+
+    @property
+    def sentence_text(self) -> str:
+        """The sentence information lines as a single string."""
+        return '\n'.join(self.sentence_lines).strip()
+
+    @property
+    def words_line(self) -> Optional[str]:
+        """The 'Words:' line of the sentence information, if any."""
+        for line in self.sentence_lines:
+            if line.startswith('Words:'):
+                return line
+        return None
+
+    @property
+    def has_sections(self) -> bool:
+        """True if the block has at least one annotation section."""
+        return bool(self.sections)
+
+    def section(self, kind: str) -> Optional[Section]:
+        """Return the section of the given kind, or None if the block has none."""
+        return self.sections.get(kind)
+
+    def section_text(self, kind: str) -> Optional[str]:
+        """Return the stripped text of the section of the given kind, or None if absent."""
+        section = self.sections.get(kind)
+        return section.text if section is not None else None
+
+def has_document_level_annotation(document_annotation: str) -> bool:
+    """
+    Check if the document has meaningful document level annotation, i.e. at least one relation
+    (see umr_graph.doc_graph_triples); an empty graph such as (s1s0 / sentence) has none.
+    """
+    if not document_annotation:
+        return False
+    from umr_graph import doc_graph_triples
+    return bool(doc_graph_triples(document_annotation))
+
+def classify_header(stripped_line: str):
+    """Return (kind, header_rest) for a header line; kind is 'meta' for meta lines."""
+    content = stripped_line.lstrip('#').strip()
+    if content.startswith('meta-info') or content.startswith('::'):
+        return 'meta', content
+    for header, kind in SECTION_HEADERS.items():
+        if content.startswith(header):
+            return kind, content[len(header):].strip()
+    return 'other', content
+
+def _extend(span: Optional[Tuple[int, int]], start: int, end: int) -> Tuple[int, int]:
+    return (start, end) if span is None else (span[0], end)
+
+def scan_lines(lines: Iterable[Union[str, bytes]], offset: int = 0) -> Iterator[UMRBlock]:
+    """
+    Scan an iterable of lines and yield one UMRBlock per block.
+    Every non-empty run of lines between delimiters is a block, even if it holds no annotation.
+    Lines may be bytes (e.g. a file opened in binary mode), in which case they are decoded as
+    UTF-8; either way, spans are byte offsets counted from `offset`.
+    """
+    block = None
+    section = None
+    index = 0
+
+    for raw in lines:
+        if isinstance(raw, bytes):
+            line_start = offset
+            offset += len(raw)
+            line = raw.decode('utf-8').rstrip('\r\n')
+        else:
+            line_start = offset
+            offset += len(raw.encode('utf-8'))
+            line = raw.rstrip('\r\n')
+        stripped = line.strip()
+
+        if stripped.startswith(BLOCK_DELIMITER):
+            if block is not None:
+                yield block
+                index += 1
+            block = None
+            section = None
+            continue
+
+        if block is None:
+            block = UMRBlock(index, line_start)
+        block.end = offset
+
+        if stripped.startswith('#'):
+            kind, header_rest = classify_header(stripped)
+            if kind == 'meta':
+                block.meta_lines.append(line)
+                block.meta_span = _extend(block.meta_span, line_start, offset)
+                section = None
+            else:
+                section = Section(kind, header_rest, line_start)
+                section.end = offset
+                block.sections.setdefault(kind, section)
+        elif section is not None:
+            section.lines.append(line)
+            section.end = offset
+        else:
+            block.sentence_lines.append(line)
+            block.sentence_span = _extend(block.sentence_span, line_start, offset)
+
+    if block is not None:
+        yield block
+
+def scan_umr_file(file_path: str, data=None) -> Iterator[UMRBlock]:
+    """
+    Scan a UMR file and yield its blocks one at a time.
+    If the file content was already read or mapped (e.g. by umr_prefetch), pass it as `data`
+    (bytes or mmap); it may also be an open binary stream (see umr_sources), which is scanned
+    as it is read. Compressed files and archive members are decompressed on the fly.
+    """
+    if is_stream(data):
+        yield from scan_lines(data)
+        return
+    if isinstance(data, mmap.mmap):
+        data.seek(0)
+        yield from scan_lines(iter(data.readline, b''))
+        return
+    if data is not None:
+        yield from scan_lines(data.splitlines(keepends=True))
+        return
+    with open_umr(file_path) as f:
+        yield from scan_lines(f)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Sharded JSON Lines exports with a deterministic train/dev/test split, for distributed loaders.
+
+`parse_umr_to_json.py --format jsonl --shard-dir DIR` writes the export as a set of JSON Lines
+shards instead of one file. Every document (a .umr file) is assigned to a split by hashing
+its key, `<language>/<filename>` (plus an optional seed). The same document therefore always
+lands in the same split, whatever the other files, the order or the number of worker processes,
+and a document never straddles two splits. Within a split, documents are appended to shards
+named `<split>-00000.jsonl`, `<split>-00001.jsonl`, ... A new shard is started before a
+document that would take the current one past `max_blocks` blocks or `max_bytes` bytes, so
+shards never cut a document in two either.
+
+DIR/manifest.json describes the result, for loaders to pick and verify their shards:
+
+    {"version": 1, "records": "block", "key": "language/filename", "seed": "",
+     "splits": {"train": {"fraction": 0.8, "documents": ..., "blocks": ..., "shards": 12}, ...},
+     "shards": [{"path": "train-00000.jsonl", "split": "train", "documents": 41, "blocks": 9987,
+                 "bytes": 31337, "sha256": "..."}, ...]}
+"""
+import os
+import json
+import queue
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+DEFAULT_SHARD_BLOCKS = 10000
+
+# Documents a split writer may fall behind before the producer waits
+_QUEUE_DEPTH = 64
+
+# Split used when no --split is given
+ALL_SPLIT = [('all', 1.0)]
+
+_SIZE_SUFFIXES = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+def parse_split(spec: str) -> List[Tuple[str, float]]:
+    """
+    Parse a split specification such as 'train=0.8,dev=0.1,test=0.1' into (name, fraction)
+    pairs, in the given order. Weights are normalized, so 'train=8,dev=1,test=1' is the same.
+    Raises ValueError for malformed specifications.
+    """
+    splits = []
+    for part in spec.split(','):
+        name, sep, weight = part.partition('=')
+        name = name.strip()
+        if not sep or not name:
+            raise ValueError(f"expected NAME=WEIGHT, got {part.strip()!r}")
+        try:
+            value = float(weight)
+        except ValueError:
+            raise ValueError(f"weight of split {name!r} is not a number: {weight.strip()!r}") from None
+        if value < 0:
+            raise ValueError(f"weight of split {name!r} is negative")
+        if any(name == existing for existing, _ in splits):
+            raise ValueError(f"split {name!r} is given twice")
+        splits.append((name, value))
+    total = sum(value for _, value in splits)
+    if total <= 0:
+        raise ValueError("split weights add up to zero")
+    return [(name, value / total) for name, value in splits]
+
+def parse_size(text: str) -> int:
+    """Parse a byte size such as '500000', '64K', '256M' or '1G'."""
+    text = text.strip().upper()
+    factor = _SIZE_SUFFIXES.get(text[-1:], 1)
+    number = text[:-1] if text[-1:] in _SIZE_SUFFIXES else text
+    size = int(float(number) * factor)
+    if size < 1:
+        raise ValueError("size must be at least 1 byte")
+    return size
+
+def document_key(language: str, filename: str) -> str:
+    """The key a document is split on: '<language>/<filename>'."""
+    return f"{language}/{filename}"
+
+def assign_split(key: str, splits: List[Tuple[str, float]], seed: str = '') -> str:
+    """
+    The split of a document: the first 8 bytes of SHA-1(seed + key), as a fraction of 2**64,
+    fall into one of the cumulative split fractions. Stable across runs, machines and Python versions.
+    """
+    point = int.from_bytes(hashlib.sha1((seed + key).encode('utf-8')).digest()[:8], 'big') / 2 ** 64
+    cumulative = 0.0
+    for name, fraction in splits:
+        cumulative += fraction
+        if point < cumulative:
+            return name
+    # Rounding can leave the last few points above the cumulative sum
+    return splits[-1][0]
+
+class _SplitWriter:
+    """
+    The shards of one split, written by a thread of its own: documents are queued with submit()
+    and appended in order, starting a new shard when the current one is full. The writers of
+    the splits run in parallel (file writes and SHA-256 release the GIL).
+    """
+
+    def __init__(self, out_dir: str, split: str, max_blocks: Optional[int], max_bytes: Optional[int]):
+        self.out_dir = out_dir
+        self.split = split
+        self.max_blocks = max_blocks
+        self.max_bytes = max_bytes
+        self.shards: List[Dict[str, Any]] = []
+        self._file = None
+        self._digest = None
+        self._current: Optional[Dict[str, Any]] = None
+        self._error: Optional[BaseException] = None
+        self._queue: 'queue.Queue[Optional[Tuple[bytes, int]]]' = queue.Queue(maxsize=_QUEUE_DEPTH)
+        self._thread = threading.Thread(target=self._run, name=f"shard-writer-{split}", daemon=True)
+        self._thread.start()
+
+    def submit(self, data: bytes, n_blocks: int) -> None:
+        """Queue a document for writing; blocks while the writer is _QUEUE_DEPTH documents behind."""
+        if self._error is not None:
+            raise self._error
+        self._queue.put((data, n_blocks))
+
+    def close(self) -> None:
+        """Write the queued documents, close the last shard and re-raise any write error."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self) -> None:
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                self._add(*item)
+            self._close_shard()
+        except BaseException as e:
+            self._error = e
+            # Keep draining so that submit() never blocks on a dead writer
+            while self._queue.get() is not None:
+                pass
+
+    def _full(self, n_blocks: int, n_bytes: int) -> bool:
+        current = self._current
+        if current is None:
+            return True
+        if self.max_blocks is not None and current["blocks"] + n_blocks > self.max_blocks:
+            return True
+        return self.max_bytes is not None and current["bytes"] + n_bytes > self.max_bytes
+
+    def _add(self, data: bytes, n_blocks: int) -> None:
+        if self._full(n_blocks, len(data)):
+            self._close_shard()
+            name = f"{self.split}-{len(self.shards):05d}.jsonl"
+            self._current = {"path": name, "split": self.split, "documents": 0, "blocks": 0, "bytes": 0}
+            self._file = open(os.path.join(self.out_dir, name), 'wb')
+            self._digest = hashlib.sha256()
+        self._file.write(data)
+        self._digest.update(data)
+        self._current["documents"] += 1
+        self._current["blocks"] += n_blocks
+        self._current["bytes"] += len(data)
+
+    def _close_shard(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        self._current["sha256"] = self._digest.hexdigest()
+        self.shards.append(self._current)
+        self._file = self._current = self._digest = None
+
+def _remove_previous_shards(out_dir: str) -> None:
+    """Delete the shards listed by a previous manifest in out_dir, so no stale shard is left behind."""
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return
+    for shard in previous.get("shards", []):
+        path = os.path.join(out_dir, os.path.basename(shard.get("path", "")))
+        if os.path.isfile(path):
+            os.remove(path)
+
+def write_shards(rendered: Iterable[Dict[str, Any]], out_dir: str,
+                 splits: List[Tuple[str, float]] = ALL_SPLIT, seed: str = '',
+                 max_blocks: Optional[int] = DEFAULT_SHARD_BLOCKS, max_bytes: Optional[int] = None,
+                 records: str = 'document') -> Dict[str, Any]:
+    """
+    Write rendered documents to split shards in out_dir and return the manifest, which is also
+    saved as out_dir/manifest.json. `rendered` yields {"language", "filename", "blocks", "text"}
+    per document in corpus order (see parse_umr_to_json.render_file); documents whose "text" is
+    None (filtered out) are skipped. `records` ('document' or 'block') is recorded in the manifest.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    _remove_previous_shards(out_dir)
+    writers = {name: _SplitWriter(out_dir, name, max_blocks, max_bytes) for name, _ in splits}
+    documents = dict.fromkeys(writers, 0)
+    blocks = dict.fromkeys(writers, 0)
+    for item in rendered:
+        if item["text"] is None:
+            continue
+        split = assign_split(document_key(item["language"], item["filename"]), splits, seed)
+        writers[split].submit(item["text"].encode('utf-8'), item["blocks"])
+        documents[split] += 1
+        blocks[split] += item["blocks"]
+
+    shards = []
+    for writer in writers.values():
+        writer.close()
+        shards.extend(writer.shards)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "records": records,
+        "key": "language/filename",
+        "seed": seed,
+        "max_blocks": max_blocks,
+        "max_bytes": max_bytes,
+        "splits": {name: {"fraction": fraction, "documents": documents[name], "blocks": blocks[name],
+                          "shards": len(writers[name].shards)}
+                   for name, fraction in splits},
+        "shards": shards,
+    }
+    tmp_path = os.path.join(out_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_NAME))
+    return manifest
+
+def verify_shards(out_dir: str) -> List[str]:
+    """Check every shard of out_dir against its manifest entry; returns one message per mismatch."""
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    problems = []
+    for shard in manifest["shards"]:
+        path = os.path.join(out_dir, shard["path"])
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            problems.append(f"{shard['path']}: {e}")
+            continue
+        if len(data) != shard["bytes"] or hashlib.sha256(data).hexdigest() != shard["sha256"]:
+            problems.append(f"{shard['path']}: checksum mismatch")
+    return problems
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Compiled, memory-mappable corpus snapshots.
+
+A snapshot stores one row per block in fixed-width columns (file, flags, word, concept and
+relation counts, sent_id, and the byte range of the block and of each of its sections in the
+source file), a small file table and a string heap. It is written by
+`parse_umr_to_json.py --format snapshot` and can be opened with UMRSnapshot, which maps the
+file and exposes every column as a zero-copy memoryview, so opening the full corpus costs
+almost nothing until a column is read.
+
+File layout (native byte order, recorded in the header):
+
+    b'UMRSNAP\\0' | uint32 header length | JSON header | columns (8-byte aligned) | string heap
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from umr_scanner import scan_umr_file, has_document_level_annotation
+from umr_stats import analyze_block
+from umr_sources import source_stat, logical_name, language_of, read_range
+
+MAGIC = b'UMRSNAP\0'
+FORMAT_VERSION = 3
+
+# Block flags
+PARTIAL = 1                  # meta-info has type = partial_conversion
+SENTENCE_GRAPH = 2           # non-empty sentence level graph
+DOC_GRAPH = 4                # document level graph with at least one relation (see statistics.py)
+DOCUMENT_ANNOTATION = 8      # has_document_annotation as reported by parse_umr_to_json.py
+HAS_SECTIONS = 16            # block has at least one annotation section (exported to JSON)
+
+# Section byte ranges stored per block; each gets a <name>_start (Q) and <name>_len (I) column
+SECTION_COLUMNS = ['meta', 'sentence', 'sentence_graph', 'alignment', 'document_annotation']
+
+BLOCK_COLUMNS = [
+    ('file', 'I'), ('index', 'I'), ('snt', 'I'), ('flags', 'B'),
+    ('words', 'I'), ('concepts', 'I'), ('relations', 'I'), ('doc_relations', 'I'),
+    ('doc_temporal', 'I'), ('doc_modal', 'I'), ('doc_coref', 'I'),
+    ('sent_id_off', 'I'), ('sent_id_len', 'I'),
+    ('block_start', 'Q'), ('block_len', 'I'),
+    # Permutation of the block ids sorted by sent_id, for binary search (see umr_index.py)
+    ('sent_id_order', 'I'),
+] + [(f'{name}_{part}', code) for name in SECTION_COLUMNS for part, code in (('start', 'Q'), ('len', 'I'))]
+
+FILE_COLUMNS = [
+    ('file_lang', 'H'), ('file_name_off', 'I'), ('file_name_len', 'I'),
+    ('file_path_off', 'I'), ('file_path_len', 'I'),
+    ('file_first_block', 'I'), ('file_n_blocks', 'I'),
+    ('file_size', 'Q'), ('file_mtime_ns', 'Q'),
+]
+
+def scan_file_record(file_path: str, data: Optional[bytes] = None,
+                     block_extra: Optional[Callable[[Any], Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Scan one .umr file into a snapshot record. The record looks like a parse_umr_file result
+    ("filename", "language", "blocks" with "meta_info" and "has_document_annotation"), so it
+    can be filtered with parse_umr_to_json.file_matches, plus the columns stored per block.
+    `data` is the file content, if it was already read, or an open stream (see umr_sources).
+    `block_extra(block)`, if given, returns more fields for each block record (e.g. the
+    terms indexed by umr_query.py), computed in the same pass.
+    """
+    # Compressed files and archive members are recorded with the size and mtime of the file that holds them
+    st = source_stat(file_path)
+    blocks = []
+    for block in scan_umr_file(file_path, data):
+        info = analyze_block(block)
+        flags = 0
+        if info["is_partial"]:
+            flags |= PARTIAL
+        if info["has_sentence_graph"]:
+            flags |= SENTENCE_GRAPH
+        if info["has_doc_graph"]:
+            flags |= DOC_GRAPH
+        if block.has_sections:
+            flags |= HAS_SECTIONS
+        record = {
+            "meta_info": block.meta_info,
+            "index": block.index,
+            "snt": block.snt or 0,
+            "sent_id": block.sent_id or "",
+            "flags": flags,
+            "words": info["word_count"],
+            "concepts": info["concepts_count"],
+            "relations": info["relations_count"],
+            "doc_relations": info["doc_relations_count"],
+            "doc_temporal": info["doc_temporal_count"],
+            "doc_modal": info["doc_modal_count"],
+            "doc_coref": info["doc_coref_count"],
+            "block": (block.start, block.end),
+            "meta": block.meta_span,
+            "sentence": block.sentence_span,
+        }
+        for kind in SECTION_COLUMNS[2:]:
+            section = block.section(kind)
+            record[kind] = (section.start, section.end) if section is not None else None
+        doc_annotation = block.section_text('document_annotation')
+        if doc_annotation is not None:
+            record["has_document_annotation"] = has_document_level_annotation(doc_annotation)
+            if record["has_document_annotation"]:
+                record["flags"] |= DOCUMENT_ANNOTATION
+        if block_extra is not None:
+            record.update(block_extra(block))
+        blocks.append(record)
+
+    return {
+        "path": os.path.abspath(file_path),
+        "filename": logical_name(os.path.basename(file_path)),
+        "language": language_of(file_path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "blocks": blocks,
+    }
+
+class _StringHeap:
+    """Deduplicating UTF-8 string heap used while building a snapshot."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, text: str) -> Tuple[int, int]:
+        ref = self.offsets.get(text)
+        if ref is None:
+            encoded = text.encode('utf-8')
+            ref = (len(self.data), len(encoded))
+            self.data += encoded
+            self.offsets[text] = ref
+        return ref
+
+def build_snapshot(records: Iterable[Dict[str, Any]], output_path: str, root_dir: str) -> Tuple[int, int]:
+    """
+    Write a snapshot of the given file records (see scan_file_record) to output_path.
+    File paths are stored relative to root_dir. Returns (number of files, number of blocks).
+    """
+    columns = {name: array(code) for name, code in BLOCK_COLUMNS + FILE_COLUMNS}
+    heap = _StringHeap()
+    languages: List[str] = []
+    language_ids: Dict[str, int] = {}
+    n_blocks = 0
+
+    for record in records:
+        lang_id = language_ids.get(record["language"])
+        if lang_id is None:
+            lang_id = language_ids[record["language"]] = len(languages)
+            languages.append(record["language"])
+        file_id = len(columns['file_lang'])
+        columns['file_lang'].append(lang_id)
+        for prefix, text in (('file_name', record["filename"]),
+                             ('file_path', os.path.relpath(record["path"], root_dir))):
+            off, length = heap.add(text)
+            columns[f'{prefix}_off'].append(off)
+            columns[f'{prefix}_len'].append(length)
+        columns['file_first_block'].append(n_blocks)
+        columns['file_n_blocks'].append(len(record["blocks"]))
+        columns['file_size'].append(record["size"])
+        columns['file_mtime_ns'].append(record["mtime_ns"])
+
+        for block in record["blocks"]:
+            columns['file'].append(file_id)
+            for name in ('index', 'snt', 'flags', 'words', 'concepts', 'relations', 'doc_relations',
+                         'doc_temporal', 'doc_modal', 'doc_coref'):
+                columns[name].append(block[name])
+            off, length = heap.add(block["sent_id"])
+            columns['sent_id_off'].append(off)
+            columns['sent_id_len'].append(length)
+            start, end = block["block"]
+            columns['block_start'].append(start)
+            columns['block_len'].append(end - start)
+            for name in SECTION_COLUMNS:
+                span = block[name]
+                columns[f'{name}_start'].append(span[0] if span else 0)
+                columns[f'{name}_len'].append(span[1] - span[0] if span else 0)
+            n_blocks += 1
+
+    # Sort block ids by the UTF-8 bytes of their sent_id, ties in block order
+    sent_id_off, sent_id_len = columns['sent_id_off'], columns['sent_id_len']
+    columns['sent_id_order'] = array('I', sorted(
+        range(n_blocks), key=lambda b: (heap.data[sent_id_off[b]:sent_id_off[b] + sent_id_len[b]], b)))
+
+    # Lay out the header, the 8-byte aligned columns and the heap
+    layout = {}
+    header = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "root_dir": os.path.abspath(root_dir),
+        "languages": languages,
+        "n_files": len(columns['file_lang']),
+        "n_blocks": n_blocks,
+        "columns": layout,
+    }
+    # The header size depends on the offsets it contains, so lay out twice with room to spare
+    for _ in range(2):
+        header_bytes = json.dumps(header).encode('utf-8')
+        offset = _align(len(MAGIC) + 4 + len(header_bytes) + 1024)
+        for name, code in BLOCK_COLUMNS + FILE_COLUMNS:
+            column = columns[name]
+            layout[name] = [code, offset, len(column)]
+            offset = _align(offset + len(column) * column.itemsize)
+        header["heap"] = [offset, len(heap.data)]
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = layout[BLOCK_COLUMNS[0][0]][1]
+    header_bytes += b' ' * (data_start - len(MAGIC) - 4 - len(header_bytes))
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('=I', len(header_bytes)))
+        f.write(header_bytes)
+        for name, code in BLOCK_COLUMNS + FILE_COLUMNS:
+            f.seek(layout[name][1])
+            f.write(columns[name].tobytes())
+        f.seek(header["heap"][0])
+        f.write(heap.data)
+    os.replace(tmp_path, output_path)
+    return header["n_files"], n_blocks
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+class UMRSnapshot:
+    """
+    A memory-mapped snapshot. Columns are exposed as memoryviews over the mapping, e.g.
+    snapshot.column('words')[i] is the word count of block i.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a UMR snapshot")
+        header_len, = struct.unpack_from('=I', self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(self._mm[start:start + header_len]))
+        if header.get("version") != FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} has snapshot version {header.get('version')}, expected {FORMAT_VERSION}")
+        if header.get("byteorder") != sys.byteorder:
+            self._mm.close()
+            raise ValueError(f"{path} was written on a {header.get('byteorder')}-endian machine")
+        self.header = header
+        self.root_dir: str = header["root_dir"]
+        self.languages: List[str] = header["languages"]
+        self.n_files: int = header["n_files"]
+        self.n_blocks: int = header["n_blocks"]
+        self._view = memoryview(self._mm)
+        self._columns: Dict[str, memoryview] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Release all column views and unmap the file."""
+        for column in self._columns.values():
+            column.release()
+        self._columns.clear()
+        self._view.release()
+        self._mm.close()
+
+    def column(self, name: str) -> memoryview:
+        """Return a column as a typed, zero-copy memoryview."""
+        column = self._columns.get(name)
+        if column is None:
+            code, offset, count = self.header["columns"][name]
+            column = self._view[offset:offset + count * struct.calcsize(code)].cast(code)
+            self._columns[name] = column
+        return column
+
+    def _string(self, off: int, length: int) -> str:
+        heap_start = self.header["heap"][0]
+        return str(self._mm[heap_start + off:heap_start + off + length], 'utf-8')
+
+    def file_name(self, file_id: int) -> str:
+        return self._string(self.column('file_name_off')[file_id], self.column('file_name_len')[file_id])
+
+    def file_path(self, file_id: int) -> str:
+        """Absolute path of a source file, resolved against the snapshot's root directory."""
+        rel = self._string(self.column('file_path_off')[file_id], self.column('file_path_len')[file_id])
+        return os.path.join(self.root_dir, rel)
+
+    def file_language(self, file_id: int) -> str:
+        return self.languages[self.column('file_lang')[file_id]]
+
+    def file_blocks(self, file_id: int) -> range:
+        """Range of the block ids of a file."""
+        first = self.column('file_first_block')[file_id]
+        return range(first, first + self.column('file_n_blocks')[file_id])
+
+    def sent_id(self, block_id: int) -> str:
+        return self._string(self.column('sent_id_off')[block_id], self.column('sent_id_len')[block_id])
+
+    def sent_id_bytes(self, block_id: int) -> bytes:
+        """The sent_id of a block as raw UTF-8 bytes (the sort key of the sent_id_order column)."""
+        off = self.header["heap"][0] + self.column('sent_id_off')[block_id]
+        return self._mm[off:off + self.column('sent_id_len')[block_id]]
+
+    def read_section(self, block_id: int, name: str = 'block') -> Optional[bytes]:
+        """
+        Read the raw bytes of a block ('block') or of one of its SECTION_COLUMNS from the source
+        file with a single seek (compressed sources are decompressed up to the block).
+        Returns None if the block has no such section.
+        """
+        length = self.column(f'{name}_len')[block_id]
+        if not length:
+            return None
+        return read_range(self.file_path(self.column('file')[block_id]),
+                          self.column(f'{name}_start')[block_id], length)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Compressed and archived UMR sources, read as decompressing streams.
+
+Besides plain `.umr` files, both pipelines accept
+
+  - single compressed files, `<name>.umr.gz` and `<name>.umr.zst`, anywhere a `.umr` file may be, and
+  - whole-language archives next to the language folders, `<language>.tar`, `.tar.gz` / `.tgz`,
+    `.tar.zst` or `.zip`, holding `[<language>/]umr_data/*.umr` (members may be compressed too).
+
+A member of an archive is addressed by a virtual path, the archive path joined with the member
+name (e.g. `czech.tar.gz/czech/umr_data/czech_umr-0001.umr`), so it can be passed around, sharded
+and cached like any other file path. open_umr() returns a binary stream that decompresses as it is
+read; nothing is extracted to disk and no decompressed copy of a whole file is kept.
+
+Tar archives can only be read front to back, so open_sources() reads all requested members of a
+tar in a single pass, in archive order; zip members can be opened in any order. Reading `.zst`
+requires the optional `zstandard` package.
+"""
+import io
+import os
+import sys
+import mmap
+import gzip
+import hashlib
+import tarfile
+import zipfile
+import functools
+import itertools
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from umr_prefetch import DEFAULT_PREFETCH_DEPTH, prefetch_files, read_file
+
+UMR_SUFFIX = '.umr'
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.zst')
+ARCHIVE_SUFFIXES = TAR_SUFFIXES + ('.zip',)
+
+# Folders of a language directory (or archive) that hold UMR files
+DATA_DIRS = ('umr_data', 'formatted_data')
+
+_CHUNK_SIZE = 1 << 20
+
+def is_umr_name(name: str) -> bool:
+    """True for `.umr` file names and their compressed variants (`.umr.gz`, `.umr.zst`)."""
+    return name.endswith(UMR_SUFFIX) or any(name.endswith(UMR_SUFFIX + suffix) for suffix in COMPRESSED_SUFFIXES)
+
+def logical_name(name: str) -> str:
+    """The file name without its compression suffix, e.g. 'x.umr' for 'x.umr.gz'."""
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(UMR_SUFFIX + suffix):
+            return name[:-len(suffix)]
+    return name
+
+def archive_language(name: str) -> Optional[str]:
+    """The language an archive is named after ('czech' for 'czech.tar.gz'), or None if `name` is not an archive."""
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return None
+
+def split_archive_path(path: str) -> Tuple[Optional[str], str]:
+    """
+    Split a virtual archive member path into (archive path, member name); plain paths give
+    (None, path). A path component counts as an archive if it has an archive suffix and is a file.
+    """
+    parts = path.split(os.sep)
+    # Only components with an archive suffix cost a stat, so plain paths are never checked on disk
+    for i in range(1, len(parts) - 1):
+        if archive_language(parts[i]) is not None:
+            archive = os.sep.join(parts[:i + 1])
+            if os.path.isfile(archive):
+                return archive, '/'.join(parts[i + 1:])
+    return None, path
+
+def archive_of(path: str) -> Optional[str]:
+    """The archive holding a virtual member path, or None for files on disk."""
+    return split_archive_path(path)[0]
+
+def tar_archive_of(path: str) -> Optional[str]:
+    """The tar archive holding a member path, or None; such members can only be read in archive order."""
+    archive = archive_of(path)
+    return archive if archive is not None and archive.endswith(TAR_SUFFIXES) else None
+
+def is_plain(path: str) -> bool:
+    """True for an uncompressed `.umr` file on disk, which can be read, mapped and seeked directly."""
+    return not path.endswith(COMPRESSED_SUFFIXES) and archive_of(path) is None
+
+def language_of(path: str) -> str:
+    """
+    The language of a UMR file: the folder above its data folder, as for `<language>/umr_data/x.umr`.
+    For archive members without a language folder, the archive name.
+    """
+    archive, member = split_archive_path(path)
+    if archive is not None:
+        parts = member.split('/')
+        if len(parts) >= 3:
+            return parts[-3]
+        return archive_language(os.path.basename(archive)) or ''
+    return os.path.basename(os.path.dirname(os.path.dirname(path)))
+
+def source_stat(path: str) -> os.stat_result:
+    """os.stat of the file that holds a UMR file: the file itself, or its archive."""
+    return os.stat(archive_of(path) or path)
+
+def is_stream(data) -> bool:
+    """True if `data` is an open binary stream rather than an in-memory buffer (bytes or mmap)."""
+    return not isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)) and hasattr(data, 'readline')
+
+def buffer_size(data) -> int:
+    """The size of a buffer, or 0 for a stream, whose size is not known until it is read."""
+    return 0 if is_stream(data) else len(data)
+
+class _OwningReader(io.BufferedReader):
+    """A buffered reader that also closes the objects its stream was opened from (archive, file)."""
+
+    def __init__(self, raw, owners: List):
+        super().__init__(raw, buffer_size=_CHUNK_SIZE)
+        self._owners = owners
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            for owner in self._owners:
+                owner.close()
+            self._owners = []
+
+def _zstd_reader(raw):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("reading .zst files requires the zstandard package (pip install zstandard)") from None
+    reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+    return io.BufferedReader(reader, buffer_size=_CHUNK_SIZE)
+
+def _decompress(raw, name: str):
+    """Wrap a binary stream in a decompressing reader chosen by the file name (which takes ownership of it)."""
+    if name.endswith('.gz'):
+        return _OwningReader(gzip.GzipFile(fileobj=raw, mode='rb'), [raw])
+    if name.endswith('.zst'):
+        return _zstd_reader(raw)
+    return raw
+
+def _open_tar(archive: str) -> tarfile.TarFile:
+    """Open a tar archive for a single front-to-back pass (stream mode), whatever its compression."""
+    raw = open(archive, 'rb')
+    try:
+        if archive.endswith('.tar.zst'):
+            raw = _zstd_reader(raw)
+        mode = 'r|gz' if archive.endswith(('.tar.gz', '.tgz')) else 'r|'
+        tar = tarfile.open(fileobj=raw, mode=mode)
+    except BaseException:
+        raw.close()
+        raise
+    # tarfile does not close a fileobj it was given; keep it around so callers can
+    tar.source = raw
+    return tar
+
+def _close_tar(tar: tarfile.TarFile) -> None:
+    try:
+        tar.close()
+    finally:
+        tar.source.close()
+
+def open_umr(path: str):
+    """
+    Open a UMR file, compressed file or archive member as a binary stream that decompresses as
+    it is read. A tar member is found by reading the archive up to it; to read many members,
+    use open_sources(), which reads each archive only once.
+    """
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return _decompress(open(path, 'rb'), path)
+    if archive.endswith('.zip'):
+        # The member stream keeps the archive file open after the ZipFile itself is closed
+        with zipfile.ZipFile(archive) as zf:
+            return _decompress(zf.open(member), member)
+    tar = _open_tar(archive)
+    try:
+        for info in tar:
+            if info.name == member and info.isfile():
+                return _decompress(_OwningReader(tar.extractfile(info), [tar, tar.source]), member)
+    except BaseException:
+        _close_tar(tar)
+        raise
+    _close_tar(tar)
+    raise FileNotFoundError(f"{member} not found in {archive}")
+
+def read_source(path: str) -> bytes:
+    """The whole decompressed content of a UMR file, for callers that need random access to it."""
+    if is_plain(path):
+        return read_file(path)
+    with open_umr(path) as f:
+        return f.read()
+
+def read_range(path: str, start: int, length: int) -> bytes:
+    """
+    Read `length` bytes at offset `start` of the decompressed content: a single seek for plain
+    files, and for compressed ones by decompressing (and dropping) everything before `start`.
+    """
+    with open_umr(path) as f:
+        if is_plain(path):
+            f.seek(start)
+        else:
+            remaining = start
+            while remaining > 0:
+                skipped = len(f.read(min(remaining, _CHUNK_SIZE)))
+                if not skipped:
+                    break
+                remaining -= skipped
+        return f.read(length)
+
+@functools.lru_cache(maxsize=64)
+def file_sha1(path: str, mtime_ns: int, size: int) -> str:
+    """
+    SHA-1 of a file's raw content, read in chunks. The mtime and size are part of the cache key,
+    so an archive shared by many members is hashed once per version.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, _CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _is_data_member(name: str, data_dirs: Tuple[str, ...]) -> bool:
+    parts = name.split('/')
+    return len(parts) >= 2 and parts[-2] in data_dirs and is_umr_name(parts[-1])
+
+def iter_archive_umr_files(archive_path: str, data_dirs: Tuple[str, ...] = DATA_DIRS) -> Iterator[str]:
+    """
+    Yield the virtual paths of the UMR files in an archive's data folders, in archive order
+    (the order in which open_sources reads a tar). Listing a compressed tar decompresses it once.
+    An archive that cannot be read is reported on stderr and lists no files.
+    """
+    try:
+        if archive_path.endswith('.zip'):
+            with zipfile.ZipFile(archive_path) as zf:
+                names = [info.filename for info in zf.infolist() if not info.is_dir()]
+        else:
+            tar = _open_tar(archive_path)
+            try:
+                names = [info.name for info in tar if info.isfile()]
+            finally:
+                _close_tar(tar)
+    except (OSError, EOFError, ImportError, tarfile.TarError, zipfile.BadZipFile) as e:
+        print(f"Error reading archive {archive_path}: {type(e).__name__}: {e}", file=sys.stderr)
+        return
+    for name in names:
+        if _is_data_member(name, data_dirs):
+            yield os.path.join(archive_path, *name.split('/'))
+
+def _loaded(value) -> Callable:
+    return lambda: value
+
+def _failed_load(error: BaseException) -> Callable:
+    def load():
+        raise error
+    return load
+
+def _iter_zip_members(archive: str, file_paths: List[str]) -> Iterator[Tuple[str, Callable]]:
+    try:
+        zf = zipfile.ZipFile(archive)
+    except (OSError, zipfile.BadZipFile) as e:
+        for path in file_paths:
+            yield path, _failed_load(e)
+        return
+    with zf:
+        for path in file_paths:
+            try:
+                stream = _decompress(zf.open(split_archive_path(path)[1]), path)
+            except (KeyError, OSError, ImportError, zipfile.BadZipFile) as e:
+                yield path, _failed_load(e)
+                continue
+            with stream:
+                yield path, _loaded(stream)
+
+def _iter_tar_members(archive: str, file_paths: List[str]) -> Iterator[Tuple[str, Callable]]:
+    # A tar is read front to back: members come in archive order, whatever order they were asked in
+    wanted = {split_archive_path(path)[1]: path for path in file_paths}
+    error = None
+    try:
+        tar = _open_tar(archive)
+    except (OSError, ImportError, tarfile.TarError) as e:
+        tar, error = None, e
+    if tar is not None:
+        try:
+            members = iter(tar)
+            while wanted:
+                try:
+                    info = next(members, None)
+                    if info is None:
+                        break
+                    path = wanted.pop(info.name, None)
+                    if path is None or not info.isfile():
+                        continue
+                    stream = _decompress(tar.extractfile(info), info.name)
+                except (OSError, EOFError, ImportError, tarfile.TarError) as e:
+                    # A damaged archive: the members not read yet cannot be reached
+                    error = e
+                    break
+                with stream:
+                    yield path, _loaded(stream)
+        finally:
+            _close_tar(tar)
+    for member, path in wanted.items():
+        yield path, _failed_load(error or FileNotFoundError(f"{member} not found in {archive}"))
+
+def _fetch(read: Callable[[str], bytes], path: str):
+    """
+    The prefetch read function for files on disk: plain files are read with `read`, and
+    compressed ones are fetched as compressed bytes and handed over as a decompressing stream.
+    """
+    if is_plain(path):
+        return read(path)
+    return _decompress(io.BytesIO(read_file(path)), path)
+
+def open_sources(file_paths: Iterable[str], depth: int = DEFAULT_PREFETCH_DEPTH,
+                 read: Callable[[str], bytes] = read_file) -> Iterator[Tuple[str, Callable]]:
+    """
+    Like umr_prefetch.prefetch_files, yield (file_path, load) pairs, for any mix of plain files,
+    compressed files and archive members. load() returns the content of a plain file (read with
+    `read`, e.g. map_file), or an open decompressing stream, valid until the next pair is taken,
+    for the others. Files on disk are prefetched (compressed ones as compressed bytes); runs of
+    members of one archive are read in a single pass over it.
+    """
+    for archive, group in itertools.groupby(file_paths, key=archive_of):
+        if archive is None:
+            yield from prefetch_files(group, depth, read=functools.partial(_fetch, read))
+        else:
+            iter_members = _iter_zip_members if archive.endswith('.zip') else _iter_tar_members
+            yield from iter_members(archive, list(group))
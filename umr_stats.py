@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+The analysis behind statistics.py, as an importable module: the statistics.py script shares its
+name with the standard library's statistics module, so other modules import this one instead.
+
+analyze_block reads the counters of one block (words, graphs, relations, concepts, document
+relations per type, sent_id source); analyze_file_blocks returns them for every block of a
+file as rows in umr_metrics.BLOCK_FIELDS order, ready for a BlockTable:
+
+    from umr_stats import analyze_file_blocks
+    from umr_metrics import BlockTable
+
+    rows = analyze_file_blocks('english/umr_data/english_umr-0001.umr')
+    table = BlockTable.from_file_rows([('english', 'english_umr-0001.umr', rows)])
+
+collect_block_table does the same for a whole corpus (see find_language_files), across a
+process pool and with an optional per-file cache (load_stats_cache); stats_by and summary_rows
+turn the table into the counters and summary rows that statistics.py prints:
+
+    languages, files_by_lang = find_language_files('.')
+    table = collect_block_table(files_by_lang, jobs=4, languages=languages)
+    stats_by(table)['english']['partial_sentences']
+"""
+import os
+import sys
+import json
+import time
+import itertools
+import multiprocessing
+from pathlib import Path
+
+import numpy as np
+import penman
+from penman.exceptions import DecodeError
+
+from umr_scanner import scan_umr_file, scan_lines
+from umr_graph import clean_graph_text, count_graph_triples, count_doc_relations
+from umr_graph_cache import GraphCache
+from umr_profile import PROFILER
+from umr_prefetch import DEFAULT_PREFETCH_DEPTH
+from umr_metrics import BlockTable, BLOCK_FIELDS, COUNTERS, source_prefix
+from umr_sources import (ARCHIVE_SUFFIXES, is_umr_name, is_stream, buffer_size, archive_language, archive_of,
+                         tar_archive_of, iter_archive_umr_files, open_sources, open_umr, file_sha1)
+
+# Cache of graphs decoded with Penman (see umr_graph_cache.py), opened by init_worker with --graph-cache.
+# Every worker process opens its own, and they share its disk tier.
+graph_cache = None
+
+# Number of upcoming files each shard reads ahead in background threads (see umr_prefetch.py),
+# set by init_worker with --prefetch; 0 reads each file only when it is analyzed
+prefetch_depth = DEFAULT_PREFETCH_DEPTH
+
+# Counters returned by analyze_file / analyze_folder, in table order
+STAT_KEYS = [
+    "all_docs",
+    "partial_docs", "partial_sentences", "partial_words", "partial_sentence_graphs",
+    "partial_doc_graphs", "partial_relations", "partial_concepts", "partial_doc_relations",
+    "partial_doc_temporal", "partial_doc_modal", "partial_doc_coref",
+    "nonpartial_docs", "nonpartial_sentences", "nonpartial_words", "nonpartial_sentence_graphs",
+    "nonpartial_doc_graphs", "nonpartial_relations", "nonpartial_concepts", "nonpartial_doc_relations",
+    "nonpartial_doc_temporal", "nonpartial_doc_modal", "nonpartial_doc_coref",
+]
+
+# Bump whenever analyze_block changes what it counts, so stale cache entries are discarded.
+# The analyze_block fields are stored in umr_metrics.BLOCK_FIELDS order.
+CACHE_VERSION = 3
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / ".umr_stats_cache.json"
+
+def parse_blocks_from_file(file_path):
+    """
+    Reads the .umr file and returns its blocks as UMRBlock records (see umr_scanner).
+    Each block is separated by lines starting with '################################################################################'.
+    """
+    return list(scan_umr_file(file_path))
+
+def analyze_block(block, file_path=None, graph_cache=None):
+    """
+    Analyze a single UMRBlock and return a dictionary with:
+      - is_partial: bool (True if :: type = partial_conversion)
+      - word_count: int (# of words in the 'Words:' line)
+      - has_sentence_graph: bool
+      - has_doc_graph: bool (doc-level graph with at least one relation)
+      - relations_count: int (# of relations in the sentence-level graph)
+      - concepts_count: int (# of concepts in the sentence-level graph)
+      - doc_relations_count: int (# of relations in the document-level graph)
+      - doc_temporal_count, doc_modal_count, doc_coref_count: int (# of :temporal, :modal and
+        :coref relations in the document-level graph)
+      - source: str (the sent_id prefix naming the source, e.g. 'DF-' or 'u_tree-'; see umr_metrics)
+    If `file_path` and a `graph_cache` (see umr_graph_cache) are given, graphs that need Penman
+    are decoded through the cache.
+    """
+    word_count = 0
+    has_sentence_graph = False
+    has_doc_graph = False
+    relations_count = 0
+    concepts_count = 0
+    doc_relations_count = 0
+
+    # 1) Check if partial_conversion
+    is_partial = block.is_partial
+
+    # 2) Count words from the "Words:" line
+    with PROFILER.stage("words"):
+        words_line = block.words_line
+        if words_line is not None:
+            # Extract everything after "Words:"
+            words_part = words_line.replace("Words:", "").strip()
+            word_count = len(words_part.split())
+
+    # 3) Parse the sentence-level graph
+    #    We'll count "has_sentence_graph" if there's at least one line of graph text
+    #    after '# sentence level graph:'.
+    graph_text = block.section_text("sentence_graph")
+    if graph_text:
+        has_sentence_graph = True
+        with PROFILER.stage("graph_count", len(graph_text)):
+            clean_text = clean_graph_text(graph_text)
+            # Count triples with the fast tokenizer, and only decode with Penman if it finds the graph malformed
+            counts = count_graph_triples(clean_text)
+        if counts is not None:
+            concepts_count, relations_count = counts
+        else:
+            try:
+                with PROFILER.stage("penman_decode", len(clean_text)):
+                    if graph_cache is not None and file_path is not None:
+                        g = graph_cache.decode(file_path, block.index, clean_text)
+                    else:
+                        g = penman.decode(clean_text)
+                triples = g.triples
+                # Count concepts vs. relations
+                relations_count = sum(1 for triple in triples if triple[1] != ':instance')
+                concepts_count = sum(1 for triple in triples if triple[1] == ':instance')
+            except DecodeError as e:
+                # One line per graph; umr_validate.py reports these (and other problems) as a table
+                location = f"{file_path} block {block.index}" if file_path is not None else f"block {block.index}"
+                print(f"DecodeError in {location} ({block.sent_id}): {e.message}", file=sys.stderr)
+
+
+    # 4) Read the relations of the document-level graph, e.g. (s1l :overlap s1d) under :temporal.
+    #    An empty graph such as (s1s0 / sentence) has none and does not count as a doc graph.
+    with PROFILER.stage("doc_graph"):
+        doc_counts = count_doc_relations(block.section_text("document_annotation"))
+    doc_relations_count = sum(doc_counts.values())
+    has_doc_graph = doc_relations_count > 0
+
+
+    return {
+        "is_partial": is_partial,
+        "word_count": word_count,
+        "has_sentence_graph": has_sentence_graph,
+        "has_doc_graph": has_doc_graph,
+        "relations_count": relations_count,
+        "concepts_count": concepts_count,
+        "doc_relations_count": doc_relations_count,
+        "doc_temporal_count": doc_counts["temporal"],
+        "doc_modal_count": doc_counts["modal"],
+        "doc_coref_count": doc_counts["coref"],
+        "source": source_prefix(block.sent_id),
+    }
+
+def analyze_file_blocks(file_path, data=None, graph_cache=None):
+    """
+    Parse one .umr file and return one row per block with the analyze_block values in BLOCK_FIELDS order.
+    `data` is the file content, if it was already read.
+    """
+    if PROFILER.enabled:
+        return profile_file_blocks(file_path, data, graph_cache)
+    rows = []
+    for block in scan_umr_file(file_path, data):
+        info = analyze_block(block, file_path, graph_cache)
+        rows.append([info[field] for field in BLOCK_FIELDS])
+    return rows
+
+def profile_file_blocks(file_path, data=None, graph_cache=None):
+    """
+    analyze_file_blocks for --profile runs: the file is read before it is scanned, so that
+    I/O and block splitting are timed as separate stages, and every block and file is timed.
+    """
+    file_start = time.perf_counter()
+    if data is None:
+        with PROFILER.stage("read") as stage:
+            with open_umr(file_path) as f:
+                data = f.read()
+            stage.nbytes = len(data)
+    elif is_stream(data):
+        # Compressed sources are decompressed whole here, so that decompression is timed on its own
+        with PROFILER.stage("decompress") as stage:
+            data = data.read()
+            stage.nbytes = len(data)
+    with PROFILER.stage("scan", len(data)):
+        blocks = list(scan_lines(data.splitlines(keepends=True)))
+    rows = []
+    for block in blocks:
+        block_start = time.perf_counter()
+        info = analyze_block(block, file_path, graph_cache)
+        rows.append([info[field] for field in BLOCK_FIELDS])
+        PROFILER.item("block", f"{file_path} block {block.index} ({block.sent_id})",
+                      time.perf_counter() - block_start, block.end - block.start)
+    PROFILER.item("file", file_path, time.perf_counter() - file_start, len(data))
+    return rows
+
+def stats_from_counters(counters, i):
+    """
+    Return the counters of group `i` of a BlockTable.counters() result as a STAT_KEYS dictionary.
+    """
+    stats = {"all_docs": int(counters["all_docs"][i])}
+    for name in COUNTERS:
+        nonpartial, partial = counters[name][i]
+        stats["partial_" + name] = int(partial)
+        stats["nonpartial_" + name] = int(nonpartial)
+    return stats
+
+def stats_by(table, by="language"):
+    """
+    Return {group label: counters (see STAT_KEYS)} for a BlockTable grouped by 'language', 'file' or 'source'.
+    """
+    labels, counters = table.counters(by)
+    return {label: stats_from_counters(counters, i) for i, label in enumerate(labels)}
+
+def analyze_file(file_path):
+    """
+    Parse one .umr file and return its counters (see STAT_KEYS), categorized into partial vs. non-partial.
+    """
+    table = BlockTable.from_file_rows([(file_path, file_path, analyze_file_blocks(file_path))])
+    return stats_by(table)[file_path]
+
+def list_umr_files(folder_path):
+    """
+    Return the paths of all .umr files (plain or compressed: .umr.gz, .umr.zst) in a folder.
+    `folder_path` may also be a language archive (see umr_sources), whose umr_data members are
+    returned as virtual paths, in archive order.
+    """
+    with PROFILER.stage("list_files"):
+        if str(folder_path).endswith(ARCHIVE_SUFFIXES) and os.path.isfile(folder_path):
+            return list(iter_archive_umr_files(str(folder_path), data_dirs=("umr_data",)))
+        return [os.path.join(folder_path, fname) for fname in os.listdir(folder_path) if is_umr_name(fname)]
+
+def find_language_files(root_dir, list_files=None):
+    """
+    Find the language folders (and language archives) under root_dir and their .umr files.
+    Returns (languages, {language: [file paths]}); languages without a umr_data folder or
+    archive are listed but have no files. `list_files` lists one folder or archive
+    (default: list_umr_files).
+    """
+    list_files = list_files or list_umr_files
+    # Find all language folders in ready_to_release directory
+    # (__pycache__ appears next to the script once the umr_* helper modules are imported)
+    languages = [d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d))
+                 and not d.startswith('.') and d != '__pycache__']
+    # Whole-language archives (e.g. czech.tar.gz, see umr_sources) stand in for or add to a folder
+    archives = {}
+    for name in sorted(os.listdir(root_dir)):
+        lang = archive_language(name)
+        if lang is not None and os.path.isfile(os.path.join(root_dir, name)):
+            archives.setdefault(lang, []).append(os.path.join(root_dir, name))
+            if lang not in languages:
+                languages.append(lang)
+
+    # Collect the files of every language up front so one pool can work across all of them
+    files_by_lang = {}
+    for lang in languages:
+        umr_data_path = Path(root_dir) / lang / "umr_data"
+        if umr_data_path.exists() and umr_data_path.is_dir():
+            files_by_lang[lang] = list_files(umr_data_path)
+        for archive_path in archives.get(lang, []):
+            files_by_lang.setdefault(lang, []).extend(list_files(archive_path))
+    return languages, files_by_lang
+
+def file_signature(file_path, use_hash=False):
+    """
+    Return the cache signature of a file: mtime and size, plus a SHA-1 of the content if `use_hash` is set.
+    Archive members are signed with their archive, so any change to an archive re-analyzes all of its
+    members (and the archive is hashed only once).
+    """
+    container = archive_of(file_path) or file_path
+    st = os.stat(container)
+    signature = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+    if use_hash:
+        signature["sha1"] = file_sha1(container, st.st_mtime_ns, st.st_size)
+    return signature
+
+def load_stats_cache(cache_path):
+    """
+    Load the per-file block rows cache, returning an empty cache if it is missing, unreadable or outdated.
+    The cache maps each file path to {"mtime_ns", "size", ["sha1"], "blocks": [block rows]}.
+    """
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {"version": CACHE_VERSION, "files": {}}
+    if cache.get("version") != CACHE_VERSION or cache.get("fields") != BLOCK_FIELDS:
+        return {"version": CACHE_VERSION, "files": {}}
+    return cache
+
+def save_stats_cache(cache_path, cache):
+    """
+    Atomically write the statistics cache to disk.
+    """
+    cache["version"] = CACHE_VERSION
+    cache["fields"] = BLOCK_FIELDS
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, separators=(',', ':'))
+    os.replace(tmp_path, cache_path)
+
+def cache_lookup(entry, signature):
+    """
+    Return True if a cache entry is still valid for a file with the given signature.
+    In content-hash mode a matching hash is enough, even if the file was touched;
+    entries written without a hash fall back to mtime and size.
+    """
+    if entry is None:
+        return False
+    if "sha1" in signature and "sha1" in entry:
+        return entry["sha1"] == signature["sha1"]
+    return entry.get("mtime_ns") == signature["mtime_ns"] and entry.get("size") == signature["size"]
+
+def init_worker(graph_cache_dir=None, depth=DEFAULT_PREFETCH_DEPTH):
+    """
+    Set up the analysis state of this process: open a graph cache in `graph_cache_dir`, if given,
+    and read `depth` files ahead.
+    collect_block_table runs it in the main process for a serial run and as the pool initializer
+    otherwise, since workers started with spawn (the macOS and Windows default) re-import this
+    module and would not see settings made in __main__.
+    """
+    global graph_cache, prefetch_depth
+    graph_cache = GraphCache(cache_dir=graph_cache_dir) if graph_cache_dir else None
+    prefetch_depth = depth
+
+def analyze_shard(shard):
+    """
+    Worker entry point: analyze a (key, file_paths) shard and return (key, rows), where `rows`
+    maps each file path to its block rows (see BLOCK_FIELDS).
+    """
+    key, file_paths = shard
+    rows_by_file = {}
+    for file_path, load in open_sources(file_paths, prefetch_depth):
+        with PROFILER.stage("read") as stage:
+            data = load()
+            stage.nbytes = buffer_size(data)
+        rows_by_file[file_path] = analyze_file_blocks(file_path, data, graph_cache)
+    return key, rows_by_file
+
+def make_shards(files_by_key, shard_size):
+    """
+    Split {key: [file paths]} into (key, file_paths) shards of at most `shard_size` files.
+    Shards of large folders are interleaved with small ones so that no worker gets a whole language.
+    Members of a tar archive can only be read in one pass over it, so they always form a single shard.
+    """
+    shards = []
+    for key, file_paths in files_by_key.items():
+        for tar, run in itertools.groupby(file_paths, key=tar_archive_of):
+            run = list(run)
+            if tar is not None:
+                shards.append((key, run))
+                continue
+            for i in range(0, len(run), shard_size):
+                shards.append((key, run[i:i + shard_size]))
+    # Biggest shards first so the pool does not finish on a long tail
+    shards.sort(key=lambda shard: len(shard[1]), reverse=True)
+    return shards
+
+def collect_block_table(files_by_key, jobs=1, shard_size=64, cache=None, use_hash=False, languages=None,
+                        graph_cache_dir=None, prefetch=DEFAULT_PREFETCH_DEPTH):
+    """
+    Analyze every file of {key: [file paths]} (e.g. one key per language) and return the block
+    rows of all files as a umr_metrics.BlockTable, with the keys as its languages, in input order
+    (`languages`, if given, fixes the language order and may add languages without files).
+    With jobs > 1 the files are sharded across a process pool, and each shard returns its block rows.
+    If a cache (see load_stats_cache) is given, only files whose signature changed are
+    re-analyzed; the cache is updated in place and entries for files not seen are dropped.
+    With `graph_cache_dir`, every process decodes graphs through a graph cache in that directory.
+    Every process reads `prefetch` files ahead of the one it analyzes.
+    """
+    rows_by_file = {}
+    to_analyze = files_by_key
+    signatures = {}
+
+    if cache is not None:
+        cached_files = cache.get("files", {})
+        fresh_files = {}
+        to_analyze = {}
+        for key, file_paths in files_by_key.items():
+            for file_path in file_paths:
+                cache_key = os.path.abspath(file_path)
+                signature = file_signature(file_path, use_hash)
+                entry = cached_files.get(cache_key)
+                if cache_lookup(entry, signature):
+                    entry.update(signature)
+                    fresh_files[cache_key] = entry
+                    rows_by_file[file_path] = entry["blocks"]
+                else:
+                    signatures[cache_key] = signature
+                    to_analyze.setdefault(key, []).append(file_path)
+        cache["files"] = fresh_files
+        reanalyzed = sum(len(file_paths) for file_paths in to_analyze.values())
+        print(f"Statistics cache: {len(fresh_files)} files reused, {reanalyzed} files to analyze")
+
+    shards = make_shards(to_analyze, shard_size)
+
+    worker_args = (graph_cache_dir, prefetch)
+    if jobs > 1 and len(shards) > 1:
+        with multiprocessing.Pool(min(jobs, len(shards)), initializer=init_worker, initargs=worker_args) as pool:
+            shard_results = list(pool.imap_unordered(analyze_shard, shards))
+    else:
+        init_worker(*worker_args)
+        shard_results = [analyze_shard(shard) for shard in shards]
+
+    for key, shard_rows in shard_results:
+        rows_by_file.update(shard_rows)
+        if cache is not None:
+            for file_path, rows in shard_rows.items():
+                cache_key = os.path.abspath(file_path)
+                cache["files"][cache_key] = dict(signatures[cache_key], blocks=rows)
+
+    # Rows are assembled in input order, whatever order the shards finished in
+    return BlockTable.from_file_rows(
+        ((key, file_path, rows_by_file[file_path])
+         for key, file_paths in files_by_key.items() for file_path in file_paths),
+        languages=languages if languages is not None else list(files_by_key))
+
+def collect_stats(files_by_key, jobs=1, shard_size=64, cache=None, use_hash=False):
+    """
+    Compute counters (see STAT_KEYS) for every key of {key: [file paths]}; see collect_block_table.
+    """
+    table = collect_block_table(files_by_key, jobs=jobs, shard_size=shard_size, cache=cache, use_hash=use_hash)
+    return stats_by(table)
+
+# Columns of the summary table after the group label
+SUMMARY_HEADERS = ["Documents", "Sentences", "Words", "Sentence Graphs", "Doc Graphs", "Relations", "Concepts"]
+
+def summary_rows(labels, counters):
+    """
+    Rows of a summary table for grouped counters (see BlockTable.counters): partial and non-partial
+    counts are added up, and relations include document-level relations. Rows are sorted by
+    document count (descending) and followed by a TOTAL row.
+    """
+    columns = np.column_stack([
+        counters["all_docs"],
+        counters["sentences"].sum(axis=1),
+        counters["words"].sum(axis=1),
+        counters["sentence_graphs"].sum(axis=1),
+        counters["doc_graphs"].sum(axis=1),
+        (counters["relations"] + counters["doc_relations"]).sum(axis=1),
+        counters["concepts"].sum(axis=1),
+    ]).reshape(len(labels), len(SUMMARY_HEADERS))
+    order = np.argsort(-columns[:, 0], kind="stable")
+    rows = [[labels[i]] + columns[i].tolist() for i in order]
+    rows.append(["TOTAL"] + columns.sum(axis=0).tolist())
+    return rows
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Corpus validation with a machine-readable report.
+
+Every block of every file is checked, and each problem is reported as one
+(file, sent_id, check, message) row. The checks are:
+
+    parse            the file cannot be read or scanned
+    snt              a block has no '# :: sntN' line, or its number does not follow the previous block's
+    graph            the sentence graph cannot be decoded (by the fast counter or, failing that, by penman)
+    node-prefix      a node of the sentence graph is not named after its sentence (s3x1 in snt3)
+    alignment        an alignment line is unreadable, repeated or out of the Index: range (see umr_alignment)
+    alignment-node   the alignment section lists a node that is not in the sentence graph
+
+Files are validated by a process pool and problems are streamed as each file is done, in corpus
+order, as TSV (with a header line) or JSON Lines:
+
+    python umr_validate.py --jobs 0 --output umr_validation.tsv
+    python umr_validate.py --language english --check snt --check node-prefix
+    python umr_validate.py --fail-fast --format jsonl
+
+The exit status is 1 if any problem was found, which makes it usable as a pre-release lint.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import functools
+import collections
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, TextIO, Tuple
+
+from umr_scanner import scan_umr_file
+from umr_graph import clean_graph_text, graph_branches, lenient_graph_branches
+from umr_alignment import block_alignment, index_token_count
+
+# Check names and what they report, in the order they are run on a block
+CHECKS = {
+    'parse': "the file cannot be read or scanned",
+    'snt': "missing or out-of-sequence '# :: sntN' numbers",
+    'graph': "sentence graphs that cannot be decoded",
+    'node-prefix': "graph nodes not named after their sentence (sN...)",
+    'alignment': "unreadable, repeated or out-of-range alignments",
+    'alignment-node': "aligned nodes that are not in the sentence graph",
+}
+
+REPORT_FIELDS = ('file', 'sent_id', 'check', 'message')
+
+class Problem(NamedTuple):
+    """One row of the validation report."""
+    file: str
+    sent_id: str
+    check: str
+    message: str
+
+def _graph_nodes(graph_text: str) -> Tuple[List[str], Optional[str]]:
+    """
+    (node variables, decode error) of a sentence graph. Graphs the fast reader finds malformed are
+    read leniently and decoded with penman, which has its own recovery rules; the error is None
+    if penman accepts them.
+    """
+    clean_text = clean_graph_text(graph_text)
+    branches = graph_branches(clean_text)
+    if branches is not None:
+        return [source for source, role, _ in branches if role == '/'], None
+    branches = lenient_graph_branches(clean_text)
+    nodes = [source for source, role, _ in branches if role == '/']
+    import penman
+    from penman.exceptions import DecodeError
+    try:
+        penman.decode(clean_text)
+    except DecodeError as e:
+        return nodes, f"{e.message} (graph line {e.lineno})" if e.lineno is not None else e.message
+    return nodes, None
+
+def validate_block(block, expected_snt: Optional[int], checks: Set[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Run the block-level checks on a scanned block and yield (check, message) pairs.
+    `expected_snt` is the sentence number that follows the previous block's (None for no expectation).
+    """
+    snt = block.snt
+    if 'snt' in checks:
+        if snt is None:
+            yield 'snt', "the block has no '# :: sntN' line"
+        elif expected_snt is not None and snt != expected_snt:
+            yield 'snt', f"snt{snt} follows snt{expected_snt - 1}, expected snt{expected_snt}"
+
+    graph_text = block.section_text('sentence_graph')
+    nodes: List[str] = []
+    if graph_text:
+        nodes, error = _graph_nodes(graph_text)
+        if error is not None and 'graph' in checks:
+            yield 'graph', f"cannot decode the sentence graph: {error}"
+        if 'node-prefix' in checks and snt is not None:
+            prefix = f"s{snt}"
+            wrong = [node for node in nodes
+                     if not node.startswith(prefix) or node[len(prefix):len(prefix) + 1].isdigit()]
+            if wrong:
+                yield 'node-prefix', f"{len(wrong)} of {len(nodes)} nodes are not named s{snt}...: {' '.join(wrong[:5])}" + \
+                                     (" ..." if len(wrong) > 5 else "")
+
+    if 'alignment' in checks or 'alignment-node' in checks:
+        table = block_alignment(block)
+        if 'alignment' in checks:
+            for message in table.validate(index_token_count(block.sentence_text)):
+                yield 'alignment', message
+        if 'alignment-node' in checks and table.nodes:
+            if not graph_text:
+                yield 'alignment-node', "the block has alignments but no sentence graph"
+            else:
+                known = set(nodes)
+                missing = [node for node in table.nodes if node not in known]
+                if missing:
+                    yield 'alignment-node', f"aligned nodes not in the graph: {' '.join(missing[:5])}" + \
+                                            (" ..." if len(missing) > 5 else "")
+
+def validate_file(file_path: str, checks: Sequence[str] = tuple(CHECKS), data=None) -> Dict[str, Any]:
+    """
+    Validate every annotated block of a file (blocks without sections are skipped, as in the
+    JSON export). Returns {"path", "problems": [(sent_id, check, message), ...]}.
+    Runs in pool workers (see iter_problems).
+    """
+    checks = set(checks)
+    problems = []
+    expected_snt = 1
+    for block in scan_umr_file(file_path, data):
+        if not block.has_sections:
+            continue
+        sent_id = block.sent_id or f"block {block.index}"
+        for check, message in validate_block(block, expected_snt, checks):
+            problems.append((sent_id, check, message))
+        if block.snt is not None:
+            expected_snt = block.snt + 1
+    return {"path": file_path, "problems": problems}
+
+def iter_problems(file_paths: Iterable[str], checks: Sequence[str] = tuple(CHECKS), jobs: int = 1,
+                  chunk_size: int = 16) -> Iterator[Problem]:
+    """
+    Validate files (in parallel with jobs > 1) and yield their problems as each file is done,
+    in input order. Files that cannot be parsed are reported by the 'parse' check.
+    Closing the iterator early (e.g. to fail fast) stops the workers.
+    """
+    from parse_umr_to_json import iter_parsed_files
+
+    errors: List[Tuple[str, str]] = []
+    parse_func = functools.partial(_validate_file_data, tuple(checks))
+    for record in iter_parsed_files(file_paths, jobs=jobs, chunk_size=chunk_size, errors=errors,
+                                    parse_func=parse_func):
+        yield from _parse_problems(errors, checks)
+        for sent_id, check, message in record["problems"]:
+            yield Problem(record["path"], sent_id, check, message)
+    yield from _parse_problems(errors, checks)
+
+def _validate_file_data(checks: Tuple[str, ...], file_path: str, data=None) -> Dict[str, Any]:
+    return validate_file(file_path, checks, data=data)
+
+def _parse_problems(errors: List[Tuple[str, str]], checks: Sequence[str]) -> Iterator[Problem]:
+    """Drain the parse errors collected so far into 'parse' problems."""
+    while errors:
+        file_path, error = errors.pop(0)
+        if 'parse' in checks:
+            yield Problem(file_path, '', 'parse', error)
+
+class ReportWriter:
+    """Write Problems to a stream as TSV (with a header line) or JSON Lines, flushing after each row."""
+
+    def __init__(self, out: TextIO, report_format: str = 'tsv'):
+        self.out = out
+        self.format = report_format
+        if report_format == 'tsv':
+            out.write('\t'.join(REPORT_FIELDS) + '\n')
+
+    def write(self, problem: Problem) -> None:
+        if self.format == 'jsonl':
+            self.out.write(json.dumps(problem._asdict(), ensure_ascii=False) + '\n')
+        else:
+            # Keep one problem per line, even for messages quoting malformed input
+            self.out.write('\t'.join(field.replace('\t', ' ').replace('\n', ' ') for field in problem) + '\n')
+        self.out.flush()
+
+def main():
+    from parse_umr_to_json import iter_umr_files
+
+    parser = argparse.ArgumentParser(description='Validate UMR files and write a machine-readable problem report')
+    parser.add_argument('--root-dir', type=str, default=os.path.dirname(os.path.abspath(__file__)),
+                        help='Root directory containing language subdirectories (default: the script directory)')
+    parser.add_argument('--language', type=str, help='Only validate this language')
+    parser.add_argument('--check', type=str, action='append', choices=list(CHECKS), metavar='CHECK',
+                        help=f'Only run this check; repeat for several (default: all of {", ".join(CHECKS)})')
+    parser.add_argument('--output', type=str, default='-',
+                        help="Report file path, or '-' for stdout (default: -)")
+    parser.add_argument('--format', type=str, choices=['tsv', 'jsonl'], default='tsv',
+                        help='Report format: tab-separated with a header line, or JSON Lines (default: tsv)')
+    parser.add_argument('--fail-fast', action='store_true',
+                        help='Stop at the first problem')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of worker processes; 0 uses all CPUs (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=16,
+                        help='Number of files handed to a worker at a time when --jobs > 1 (default: 16)')
+    args = parser.parse_args()
+
+    if args.jobs < 0:
+        parser.error("--jobs must be >= 0")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be >= 1")
+    jobs = args.jobs or os.cpu_count() or 1
+    checks = args.check or list(CHECKS)
+    # penman logs the graphs it repairs; the report already lists the ones it cannot decode
+    logging.getLogger('penman').setLevel(logging.ERROR)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    counts = collections.Counter()
+    try:
+        writer = ReportWriter(out, args.format)
+        problems = iter_problems(iter_umr_files(os.path.abspath(args.root_dir), args.language),
+                                 checks, jobs=jobs, chunk_size=args.chunk_size)
+        for problem in problems:
+            writer.write(problem)
+            counts[problem.check] += 1
+            if args.fail_fast:
+                problems.close()
+                break
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    summary = ', '.join(f"{counts[check]} {check}" for check in CHECKS if counts[check])
+    print(f"{sum(counts.values())} problems found" + (f" ({summary})" if summary else "")
+          + (", stopped at the first one" if args.fail_fast and counts else ""), file=sys.stderr)
+    sys.exit(1 if counts else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Watch mode for statistics.py: a long-running process that keeps the statistics tables of the
+corpus up to date while annotators edit .umr files, and serves them over local HTTP as JSON.
+
+On start, every file is analyzed once (with --jobs workers, and warm from the statistics.py
+cache with --cache) and the per-file counters are kept in memory. Every table is a sum of
+per-file counters, so the process then polls the language folders every --interval seconds
+and only re-analyzes files whose mtime or size changed. It subtracts their old counters from
+their language's totals and adds the new ones. Added and removed files are handled the same way.
+
+    python umr_watch.py --jobs 0 --cache
+    curl -s localhost:8765/stats                # every language, plus the summary table
+    curl -s localhost:8765/stats/english        # the counters of one language (see umr_stats.STAT_KEYS)
+    curl -s localhost:8765/summary              # the SUMMARY ACROSS ALL LANGUAGES table
+
+Responses are rendered once per update and served from memory. Every response has a "version"
+that increases with each update, and the time of that update.
+Language archives (see umr_sources) are watched as a whole: if one changes, all its members are re-analyzed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import umr_stats
+from umr_metrics import COUNTERS
+from umr_sources import archive_of
+
+DEFAULT_PORT = 8765
+DEFAULT_INTERVAL = 1.0
+
+class CorpusStats:
+    """
+    Per-file statistics counters of a corpus and their per-language totals, updated in place.
+    The counters of a file (or language) are an (len(COUNTERS), 2) array of [non-partial, partial]
+    values, in umr_metrics.COUNTERS order. All methods are safe to call from several threads.
+    """
+
+    def __init__(self, root_dir: str, jobs: int = 1, shard_size: int = 64, cache_path: Optional[str] = None):
+        self.root_dir = root_dir
+        self.jobs = jobs
+        self.shard_size = shard_size
+        self.cache_path = cache_path
+        self.languages: List[str] = []
+        # path -> (language, signature, counters)
+        self._files: Dict[str, Tuple[str, Tuple[int, int], np.ndarray]] = {}
+        self._totals: Dict[str, np.ndarray] = {}
+        self._documents: Dict[str, int] = {}
+        # Archive listings, keyed by (archive path, signature): listing a compressed tar decompresses it
+        self._archive_listings: Dict[Tuple[str, Tuple[int, int]], List[str]] = {}
+        # Signatures of the files of the last update that failed, not retried until they change again
+        self._failed: Dict[str, Tuple[str, Tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+        self.updated_at: Optional[str] = None
+        self._responses: Dict[str, bytes] = {}
+
+    def _list_files(self, folder_path) -> List[str]:
+        folder_path = str(folder_path)
+        if not os.path.isfile(folder_path):
+            return umr_stats.list_umr_files(folder_path)
+        st = os.stat(folder_path)
+        key = (folder_path, (st.st_mtime_ns, st.st_size))
+        if key not in self._archive_listings:
+            self._archive_listings = {k: v for k, v in self._archive_listings.items() if k[0] != folder_path}
+            self._archive_listings[key] = umr_stats.list_umr_files(folder_path)
+        return self._archive_listings[key]
+
+    def _scan(self) -> Tuple[List[str], Dict[str, Tuple[str, Tuple[int, int]]]]:
+        """List the corpus: (languages, {path: (language, signature)})."""
+        languages, files_by_lang = umr_stats.find_language_files(self.root_dir, list_files=self._list_files)
+        files = {}
+        for lang, file_paths in files_by_lang.items():
+            for file_path in file_paths:
+                try:
+                    st = os.stat(archive_of(file_path) or file_path)
+                except OSError:
+                    # Removed between the listing and the stat; the next poll will not list it
+                    continue
+                files[file_path] = (lang, (st.st_mtime_ns, st.st_size))
+        return languages, files
+
+    def _analyze(self, files: Dict[str, Tuple[str, Tuple[int, int]]], cache=None) -> Dict[str, np.ndarray]:
+        """The counters of every given file, analyzed as statistics.py does (see umr_stats.collect_block_table)."""
+        files_by_lang: Dict[str, List[str]] = {}
+        for file_path, (lang, _) in files.items():
+            files_by_lang.setdefault(lang, []).append(file_path)
+        table = umr_stats.collect_block_table(files_by_lang, jobs=self.jobs, shard_size=self.shard_size,
+                                              cache=cache)
+        # Every counter is a sum over files, so a group-by per file gives each file's share
+        labels, counters = table.counters("file")
+        stacked = np.stack([counters[name] for name in COUNTERS], axis=1).astype(np.int64)
+        return {file_path: stacked[i] for i, file_path in enumerate(labels)}
+
+    def load(self) -> None:
+        """Analyze the whole corpus (reusing the statistics.py cache, if one was given)."""
+        languages, files = self._scan()
+        cache = umr_stats.load_stats_cache(self.cache_path) if self.cache_path else None
+        counters = self._analyze(files, cache=cache)
+        if cache is not None:
+            umr_stats.save_stats_cache(self.cache_path, cache)
+        with self._lock:
+            self.languages = languages
+            self._files = {}
+            self._totals = {lang: np.zeros((len(COUNTERS), 2), dtype=np.int64) for lang in languages}
+            self._documents = dict.fromkeys(languages, 0)
+            for file_path, (lang, signature) in files.items():
+                self._add(file_path, lang, signature, counters[file_path])
+            self._publish()
+
+    def poll(self) -> Tuple[List[str], Dict[str, str]]:
+        """
+        Re-analyze the files that were added or changed since the last call, drop the ones that
+        were removed, and update the tables. Returns (updated paths, {path: error} for the files
+        that failed). A file that fails keeps its previous counters and is not tried again until
+        it changes; the other files are updated as usual.
+        """
+        languages, files = self._scan()
+        with self._lock:
+            known = dict(self._files)
+        changed = {file_path: entry for file_path, entry in files.items()
+                   if (file_path not in known or known[file_path][:2] != entry)
+                   and self._failed.get(file_path) != entry}
+        removed = [file_path for file_path in known if file_path not in files]
+        # Failed files that changed since are tried again; the ones that did not stay skipped
+        self._failed = {file_path: entry for file_path, entry in self._failed.items()
+                        if files.get(file_path) == entry}
+        if not changed and not removed and languages == self.languages:
+            return [], {}
+        counters, errors = self._analyze_each(changed)
+        for file_path in errors:
+            self._failed[file_path] = changed.pop(file_path)
+        with self._lock:
+            for lang in languages:
+                if lang not in self._totals:
+                    self._totals[lang] = np.zeros((len(COUNTERS), 2), dtype=np.int64)
+                    self._documents[lang] = 0
+            self.languages = languages
+            for file_path in removed + list(changed):
+                if file_path in self._files:
+                    self._remove(file_path)
+            for file_path, (lang, signature) in changed.items():
+                self._add(file_path, lang, signature, counters[file_path])
+            self._publish()
+        return removed + list(changed), errors
+
+    def _analyze_each(self, files: Dict[str, Tuple[str, Tuple[int, int]]]) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+        """
+        The counters of the given files, and {path: error} for the ones that cannot be analyzed.
+        They are analyzed together, and one at a time only if that fails, to find the failing files.
+        """
+        if not files:
+            return {}, {}
+        try:
+            return self._analyze(files), {}
+        except Exception as e:
+            if len(files) == 1:
+                return {}, {file_path: f"{type(e).__name__}: {e}" for file_path in files}
+        counters, errors = {}, {}
+        for file_path, entry in files.items():
+            try:
+                counters.update(self._analyze({file_path: entry}))
+            except Exception as e:
+                errors[file_path] = f"{type(e).__name__}: {e}"
+        return counters, errors
+
+    @property
+    def n_files(self) -> int:
+        return len(self._files)
+
+    def _add(self, file_path: str, lang: str, signature: Tuple[int, int], counters: np.ndarray) -> None:
+        self._files[file_path] = (lang, signature, counters)
+        self._totals[lang] += counters
+        self._documents[lang] += 1
+
+    def _remove(self, file_path: str) -> None:
+        lang, _, counters = self._files.pop(file_path)
+        self._totals[lang] -= counters
+        self._documents[lang] -= 1
+
+    def _language_counters(self) -> Tuple[List[str], Dict[str, np.ndarray]]:
+        """The per-language counters in the BlockTable.counters layout, for the umr_stats helpers."""
+        labels = list(self.languages)
+        counters = {name: np.array([self._totals[lang][i] for lang in labels], dtype=np.int64).reshape(len(labels), 2)
+                    for i, name in enumerate(COUNTERS)}
+        counters["all_docs"] = np.array([self._documents[lang] for lang in labels], dtype=np.int64)
+        return labels, counters
+
+    def _publish(self) -> None:
+        """Render the JSON responses for the current counters (called with the lock held)."""
+        self.version += 1
+        self.updated_at = datetime.now().isoformat(timespec='seconds')
+        labels, counters = self._language_counters()
+        languages = {lang: umr_stats.stats_from_counters(counters, i) for i, lang in enumerate(labels)}
+        summary = {"headers": ["Language"] + umr_stats.SUMMARY_HEADERS,
+                   "rows": umr_stats.summary_rows(labels, counters)}
+        meta = {"version": self.version, "updated_at": self.updated_at, "files": self.n_files}
+        responses = {
+            "/stats": dict(meta, languages=languages, summary=summary),
+            "/summary": dict(meta, summary=summary),
+        }
+        for lang, stats in languages.items():
+            responses[f"/stats/{lang}"] = dict(meta, language=lang, stats=stats)
+        self._responses = {path: json.dumps(body).encode('utf-8') for path, body in responses.items()}
+
+    def response(self, path: str) -> Optional[bytes]:
+        """The rendered JSON for a request path, or None if there is no such resource."""
+        return self._responses.get(path.rstrip('/') or '/stats')
+
+def make_handler(stats: CorpusStats):
+    """A request handler class serving the rendered responses of `stats`."""
+
+    class StatsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = stats.response(self.path.split('?', 1)[0])
+            if body is None:
+                self.send_error(404, "Unknown resource; try /stats, /stats/<language> or /summary")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Requests are frequent and uninteresting; errors still go through log_error
+            pass
+
+    return StatsHandler
+
+def watch(stats: CorpusStats, interval: float, stop: threading.Event) -> None:
+    """Poll the corpus every `interval` seconds until `stop` is set, reporting updates on stderr."""
+    while not stop.wait(interval):
+        start = time.perf_counter()
+        try:
+            updated, errors = stats.poll()
+        except Exception as e:
+            print(f"Update failed: {type(e).__name__}: {e}", file=sys.stderr)
+            continue
+        for file_path, error in errors.items():
+            # A file caught mid-write can fail to read; it is retried once it changes again
+            print(f"Cannot analyze {file_path} (tried again once it changes): {error}", file=sys.stderr)
+        if updated:
+            names = ', '.join(os.path.basename(path) for path in updated[:5]) + (' ...' if len(updated) > 5 else '')
+            print(f"[{stats.updated_at}] updated {len(updated)} files ({names}) in "
+                  f"{time.perf_counter() - start:.2f}s, version {stats.version}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the statistics tables up to date as .umr files change '
+                                                 'and serve them as JSON over local HTTP')
+    parser.add_argument('--root-dir', type=str, default=str(os.path.dirname(os.path.abspath(__file__))),
+                        help='Root directory containing language subdirectories (default: the script directory)')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1, local connections only)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f'Seconds between checks for changed files (default: {DEFAULT_INTERVAL})')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of worker processes for the initial analysis and large updates; '
+                             '0 uses all CPUs (default: 1)')
+    parser.add_argument('--cache', type=str, nargs='?', const=str(umr_stats.DEFAULT_CACHE_PATH),
+                        help='Start from the statistics.py cache and save it after the initial analysis '
+                             f'(default path when given without a value: {umr_stats.DEFAULT_CACHE_PATH.name})')
+    args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("--jobs must be >= 0")
+    if args.interval <= 0:
+        parser.error("--interval must be > 0")
+
+    stats = CorpusStats(os.path.abspath(args.root_dir), jobs=args.jobs or os.cpu_count() or 1,
+                        cache_path=args.cache)
+    start = time.perf_counter()
+    stats.load()
+    print(f"Analyzed {stats.n_files} files in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stats))
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch, args=(stats, args.interval, stop), name="umr-watch", daemon=True)
+    watcher.start()
+    print(f"Serving statistics on http://{args.host}:{server.server_address[1]}/stats", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()